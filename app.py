@@ -1,18 +1,107 @@
-from flask import Flask, render_template, redirect, flash, url_for, abort, request, g
-# from contacts.file_storage import ContactsFileStorage, DataHandlingError
-from contacts.db_storage import ContactsDatabaseStorage, DataHandlingError
+from markupsafe import Markup
+from flask import Flask, Blueprint, render_template, redirect, flash, url_for, abort, request, g, Response, stream_with_context, session
+from flask import before_render_template, template_rendered
+from contacts.errors import DataHandlingError
+from contacts.storage import create_storage
+from contacts.async_db_storage import AsyncContactsDatabaseStorage, get_async_pool
+from contacts.connection_pool import PoolTimeoutError, shared_pools, shared_pools_lock
+from contacts.batch_validation import CONTACT_COLUMNS, errors_in_contact_columns
+from contacts.db_storage import get_db_dsn, statement_stats
+from contacts.metrics import registry as metrics_registry
+from contacts.query_profiler import start_profile, stop_profile
+from contacts.cache import MISSING, CachedContactsStorage, ContactCache, LRUCache, SharedCacheBackend
+from contacts.export import EXPORT_FORMATS, EXPORT_MIMETYPES, export_chunks
+from contacts.bulk_import import (
+    IMPORT_FORMATS, ImportReport, batched, detect_format, errors_for_import_record,
+    open_text_upload, read_contact_records
+)
+import hashlib
+from contextlib import asynccontextmanager
 import os
+import random
 import secrets
+import threading
+import time
 import yaml
 from utils import *
 from uuid import uuid4
 from functools import wraps
 from werkzeug.exceptions import InternalServerError, HTTPException
+import click
+from flask.cli import AppGroup
 
 app = Flask(__name__)
 app.secret_key = secrets.token_hex(32)
 # '*T2<3>g;=E1Kc+N;^GP='
 
+app.config.update(
+    # Any name registered with `contacts.storage.register_backend`:
+    # 'postgres-pooled', 'postgres', 'sqlite', 'file' or 'memory'
+    CONTACTS_STORAGE_BACKEND='postgres-pooled',
+    # Only used by the 'file' backend. Defaults to contacts/data/contacts.yaml
+    CONTACTS_FILE_PATH=None,
+    # Snapshot format of the 'file' backend: 'yaml', or 'marshal' for
+    # faster loads. Switching converts the existing snapshot.
+    CONTACTS_FILE_FORMAT='yaml',
+    # Only used by the 'sqlite' backend. Defaults to contacts/data/contacts.sqlite3
+    CONTACTS_SQLITE_PATH=None,
+    DB_POOL_MIN_SIZE=1,
+    DB_POOL_MAX_SIZE=10,
+    # Seconds a request waits for a free connection before giving up
+    DB_POOL_TIMEOUT=5.0,
+    # Connections idle for longer than this many seconds are checked
+    # with a query before being handed out
+    DB_POOL_HEALTH_CHECK=True,
+    DB_POOL_HEALTH_CHECK_IDLE_TIME=30.0,
+    # Apply pending schema migrations on the first request of each process.
+    # Deployments that run `flask contacts init-db` can switch this off.
+    DB_AUTO_MIGRATE=True,
+    # Run the storage queries of the 'postgres-pooled' backend as
+    # server-side prepared statements, prepared once per pooled connection
+    DB_PREPARED_STATEMENTS=True,
+    # Read-through cache for single contacts. The in-process cache is per
+    # worker and only sees that worker's writes, so other workers can serve
+    # a contact up to CONTACT_CACHE_TTL seconds old. With several workers,
+    # either keep the TTL short or set CONTACT_CACHE_SHARED_CLIENT to a
+    # redis-py compatible client, which then replaces the in-process cache.
+    CONTACT_CACHE_ENABLED=True,
+    CONTACT_CACHE_MAX_SIZE=10000,
+    CONTACT_CACHE_TTL=60,
+    CONTACT_CACHE_SHARED_CLIENT=None,
+    # Cache of the rendered contact list, keyed on the list version.
+    # Turn off to debug template changes. The TTL bounds how long a page
+    # can outlive a write whose version bump was lost.
+    FRAGMENT_CACHE_ENABLED=True,
+    FRAGMENT_CACHE_MAX_BYTES=32 * 1024 * 1024,
+    FRAGMENT_CACHE_TTL=60,
+    # Share of requests whose queries are timed (0 turns the profiler off).
+    # Queries slower than the threshold are logged as warnings, and the
+    # per-request summary is logged at debug level.
+    QUERY_PROFILE_SAMPLE_RATE=1.0,
+    QUERY_SLOW_THRESHOLD_MS=100,
+    # Add a Server-Timing header with the request's database time.
+    # Exposes query names, so meant for development.
+    QUERY_PROFILE_HEADER=False,
+)
+
+CONTACTS_PAGE_SIZE = 50
+CONTACTS_MAX_PAGE_SIZE = 200
+SEARCH_RESULTS_LIMIT = 20
+SEARCH_MAX_RESULTS_LIMIT = 100
+IMPORT_BATCH_SIZE = 5000
+
+# One contact cache per storage per process
+contact_caches = {}
+contact_caches_lock = threading.Lock()
+
+# One cache of rendered contact list pages per storage per process
+fragment_caches = {}
+fragment_caches_lock = threading.Lock()
+
+# Storages whose schema was already brought up to date by this process
+migrated_storages = set()
+migrated_storages_lock = threading.Lock()
+
 # CONTACTS_DIR_STRUCTURE = ('contacts', 'data')
 # CONTACTS_DIR_STRUCTURE_TEST =  ('tests', 'data')
 # CONTACTS_FILE_NAME = 'contacts.yaml'
@@ -38,137 +127,411 @@ app.secret_key = secrets.token_hex(32)
 #     except FileNotFoundError:
 #             raise InternalServerError('Problem while loading contacts. Try again later')
 
+# Form fields and their validators, in the order errors are reported.
+# To make it simpler, we rely on DB check for the phone type value.
+# It's very unlikely that the type will be wrong if the form
+# is submitted ia UI
+CONTACT_FIELD_CHECKERS = (
+    ('first_name', errors_for_first_name),
+    ('email_address', errors_for_email_addr),
+    ('phone_number_1', errors_for_phone_num),
+    ('phone_number_2', errors_for_phone_num),
+    ('phone_number_3', errors_for_phone_num),
+)
+
+CONTACT_ATTRIBUTES = ('first_name', 'middle_names', 'last_name', 'email_address')
+
+PHONE_NUMBER_FIELDS = (
+    ('phone_number_1', 'phone_number_1_type', 'phone_number_1_id'),
+    ('phone_number_2', 'phone_number_2_type', 'phone_number_2_id'),
+    ('phone_number_3', 'phone_number_3_type', 'phone_number_3_id'),
+)
+
 def errors_in_contact_data(form_data):
-    # error_checkers = {
-    #     'first_name': errors_for_first_name,
-    #     'phone_number_1': errors_for_phone_num,
-    #     'phone_number_1_type': errors_for_phone_num,
-    #     'email_address': errors_for_email_addr,
-    # }
-    error_checkers = {
-        errors_for_first_name: ('first_name', ),
-        errors_for_email_addr: ('email_address', ),
-        errors_for_phone_num: (
-            'phone_number_1',
-            'phone_number_2',
-            'phone_number_3'
-        ),
-        # To make it simpler, we rely on DB check for the phone type value.
-        # It's very unlikely that the type will be wrong if the form
-        # is submitted ia UI
-
-        # errors_for_phone_num_type: (
-        #     'phone_number_1_type',
-        #     'phone_number_2_type',
-        #     'phone_number_3_type'
-        # )
-    }
     errors = []
-    # TODO - if multiple attrs, run checker for each
-    for error_checker, attributes,  in error_checkers.items():
-        for attribute_name in attributes:
-            attribute_value = form_data.get(attribute_name)
-            attribute_errors = error_checker(attribute_value)
-            errors.extend(attribute_errors)
+    for attribute_name, error_checker in CONTACT_FIELD_CHECKERS:
+        errors += error_checker(form_data.get(attribute_name))
 
     return errors if errors else None
 
 def get_phone_nums_from_form(form_data):
-    phone_nums = []
-    phone_num_attributes = (
-        ('phone_number_1', 'phone_number_1_type', 'phone_number_1_id'),
-        ('phone_number_2', 'phone_number_2_type', 'phone_number_2_id'),
-        ('phone_number_3', 'phone_number_3_type', 'phone_number_3_id'),
-    )
-    for value_attr, type_attr, id_attr in phone_num_attributes:
-        value = form_data.get(value_attr)
-        type = form_data.get(type_attr)
-        id = form_data.get(id_attr)
-        # if value and not value.isspace():
-        phone_nums.append({
-            'number_value': value,
-            'number_type': type.lower(),
-            'id': id
-        })
-
-    return phone_nums
+    get = form_data.get
+    return [
+        {
+            'number_value': get(value_attr),
+            'number_type': get(type_attr).lower(),
+            'id': get(id_attr)
+        }
+        for value_attr, type_attr, id_attr in PHONE_NUMBER_FIELDS
+    ]
 
 def get_contact_data_from_form(form_data):
-    attributes = (
-        'first_name',
-        'middle_names',
-        'last_name',
-        'email_address',
-    )
-
-    contact_data = {attribute: form_data.get(attribute) for attribute in attributes}
-    contact_data = {
-        key: value.strip() if value and not value.isspace() else None
-        for key, value in contact_data.items()
-    }
+    contact_data = {}
+    for attribute in CONTACT_ATTRIBUTES:
+        value = form_data.get(attribute)
+        contact_data[attribute] = value.strip() if value and not value.isspace() else None
 
     contact_data['phone_numbers'] = get_phone_nums_from_form(form_data)
 
     return contact_data
 
+def import_contacts(storage, records, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    """
+    Validates and imports (row number, form record) pairs in batches.
+    Invalid rows are skipped and listed in the returned report.
+    `progress`, if given, is called with the report after each batch.
+
+    Batches are committed one by one, so an error that stops the import
+    (an unreadable file, a storage failure) is recorded as the report's
+    `failure` rather than raised: the caller still learns how many rows
+    went in before it.
+    """
+    report = ImportReport()
+    try:
+        for batch in batched(records, batch_size):
+            # Validated column by column, which is much faster than one row
+            # at a time for large imports
+            columns = {column_name: [record.get(column_name) for _, record in batch]
+                       for column_name in CONTACT_COLUMNS}
+            valid_contacts = []
+            for (row_number, record), errors in zip(batch, errors_in_contact_columns(columns)):
+                errors = record['import_errors'] or errors + errors_for_import_record(record)
+                if errors:
+                    report.errors.append((row_number, errors))
+                else:
+                    valid_contacts.append(get_contact_data_from_form(record))
+
+            report.rows_imported += storage.bulk_import_contacts(valid_contacts)
+            report.rows_processed += len(batch)
+            if progress:
+                progress(report)
+    except DataHandlingError as e:
+        report.failure = str(e)
+
+    return report
+
+def describe_import_failure(report):
+    return (f'{report.failure}. The import stopped there: '
+            f'{report.rows_imported} contacts from the first {report.rows_processed} rows '
+            f'were imported, later rows were not.')
+
 # def update_contacts(contacts):
 #     with open(get_contacts_file_path(), 'w') as file:
 #         yaml.dump(contacts, file)
 
+def get_storage_key(is_testing_env):
+    # Identifies the data a request works with, for per-process state
+    # such as caches
+    backend = app.config['CONTACTS_STORAGE_BACKEND']
+    return f"{backend}:{'test' if is_testing_env else 'main'}"
+
+def open_storage(is_testing_env):
+    return create_storage(app.config['CONTACTS_STORAGE_BACKEND'],
+                          is_testing_env, app.config)
+
+def get_contact_cache(is_testing_env):
+    storage_key = get_storage_key(is_testing_env)
+    with contact_caches_lock:
+        if storage_key not in contact_caches:
+            shared_client = app.config['CONTACT_CACHE_SHARED_CLIENT']
+            shared_cache = (
+                SharedCacheBackend(shared_client,
+                                   ttl=app.config['CONTACT_CACHE_TTL'],
+                                   key_prefix=f'contacts:{storage_key}:')
+                if shared_client is not None else None
+            )
+            contact_caches[storage_key] = ContactCache(
+                LRUCache(max_size=app.config['CONTACT_CACHE_MAX_SIZE'],
+                         ttl=app.config['CONTACT_CACHE_TTL']),
+                shared_cache
+            )
+        return contact_caches[storage_key]
+
+def get_fragment_cache(is_testing_env):
+    storage_key = get_storage_key(is_testing_env)
+    with fragment_caches_lock:
+        if storage_key not in fragment_caches:
+            fragment_caches[storage_key] = LRUCache(
+                ttl=app.config['FRAGMENT_CACHE_TTL'],
+                max_cost=app.config['FRAGMENT_CACHE_MAX_BYTES']
+            )
+        return fragment_caches[storage_key]
+
+def ensure_schema(storage, is_testing_env):
+    storage_key = get_storage_key(is_testing_env)
+    if storage_key in migrated_storages:
+        return
+
+    with migrated_storages_lock:
+        if storage_key not in migrated_storages:
+            storage.setup_schema()
+            migrated_storages.add(storage_key)
+
+request_duration = metrics_registry.histogram(
+    'contacts_http_request_duration_seconds',
+    'Time spent handling requests, by endpoint, method and status.',
+    ('endpoint', 'method', 'status')
+)
+storage_opened = metrics_registry.counter(
+    'contacts_storage_opened_total',
+    'Storages opened for requests, by backend.', ('backend', )
+)
+storage_closed = metrics_registry.counter(
+    'contacts_storage_closed_total',
+    'Storages closed at the end of requests, by backend.', ('backend', )
+)
+storage_open_duration = metrics_registry.histogram(
+    'contacts_storage_open_seconds',
+    'Time spent opening the storage of a request, including pool waits.',
+    ('backend', )
+)
+template_render_duration = metrics_registry.histogram(
+    'contacts_template_render_seconds',
+    'Time spent rendering templates, by template.', ('template', )
+)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_duration(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        request_duration.observe(time.perf_counter() - start,
+                                 request.endpoint or 'unmatched',
+                                 request.method, response.status_code)
+    return response
+
+def start_template_timer(sender, template, context, **extra):
+    # A stack, since templates can render other templates
+    g.setdefault('template_render_starts', []).append(time.perf_counter())
+
+def record_template_duration(sender, template, context, **extra):
+    starts = g.get('template_render_starts')
+    if starts:
+        template_render_duration.observe(time.perf_counter() - starts.pop(),
+                                         template.name or 'string')
+
+before_render_template.connect(start_template_timer, app)
+template_rendered.connect(record_template_duration, app)
+
+@app.before_request
+def start_query_profile():
+    sample_rate = app.config['QUERY_PROFILE_SAMPLE_RATE']
+    if sample_rate and random.random() < sample_rate:
+        g.query_profile = start_profile(request.endpoint)
+
+@app.after_request
+def report_query_profile(response):
+    profile = g.pop('query_profile', None)
+    if profile is None:
+        return response
+
+    threshold = app.config['QUERY_SLOW_THRESHOLD_MS'] / 1000
+    for query in profile.slow_queries(threshold):
+        app.logger.warning('Slow query %s in %s: %.1fms, %s rows',
+                           query.statement, query.route,
+                           query.duration * 1000, query.rowcount)
+    app.logger.debug('Queries for %s', profile.summary())
+
+    if app.config['QUERY_PROFILE_HEADER']:
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={profile.total_duration * 1000:.2f};'
+            f'desc="{len(profile.queries)} queries"'
+        )
+    return response
+
 @app.before_request
 def load_storage():
+    # The metrics endpoint must stay reachable when the pool is exhausted.
+    # Async views borrow their connections from the async pool.
+    if request.endpoint == 'metrics' or request.blueprint == 'async':
+        return
+
     is_testing_env = app.config.get('TESTING', False)
-    g.storage = ContactsDatabaseStorage(is_testing_env)
+    backend = app.config['CONTACTS_STORAGE_BACKEND']
+    start = time.perf_counter()
+    try:
+        g.storage = open_storage(is_testing_env)
+    except PoolTimeoutError:
+        abort(503, description="The server is busy. Try again later")
+    finally:
+        storage_open_duration.observe(time.perf_counter() - start, backend)
+    storage_opened.inc(backend)
+    g.storage_backend = backend
+
+    if app.config['DB_AUTO_MIGRATE']:
+        ensure_schema(g.storage, is_testing_env)
+
+    if app.config['CONTACT_CACHE_ENABLED']:
+        g.storage = CachedContactsStorage(g.storage, get_contact_cache(is_testing_env))
 
 @app.teardown_appcontext
 def close_storage(exception=None):
     if hasattr(g, 'storage'):
         g.storage.close_connection()
+        storage_closed.inc(g.storage_backend)
+    stop_profile()
 
-def requires_contacts(func):
+def requires_contact(func):
+    # Single-contact routes only need the one contact, so this does an
+    # indexed lookup (with the phone numbers joined in) instead of
+    # loading the whole contact list.
     @wraps(func)
     def wrapper(*args, **kwargs):
+        contact_id = kwargs.get('contact_id')
         try:
-            # TODO - replace to use g.storage
-            contacts = g.storage.get_all_contacts()
+            contact = g.storage.find_contact_with_phone_numbers(contact_id)
         except DataHandlingError as e:
             abort(500, description="Problem while loading contacts. Try again later")
-        result = func(contacts=contacts, *args, **kwargs)
-        return result
-    return wrapper
-
-def requires_contact(func):
-    @wraps(func)
-    @requires_contacts
-    def wrapper(contacts, *args, **kwargs):
-        contact_id = kwargs.get('contact_id')
-        # contact = get_contact_by_id(contact_id, contacts)
-        contact = g.storage.find_contact_by_id(contact_id)
 
         if contact is None:
             flash('Contact not found.', 'error')
             return redirect(url_for('home'))
 
-        result = func(contacts=contacts, contact=contact, *args, **kwargs)
+        result = func(contact=contact, *args, **kwargs)
         return result
     return wrapper
 
 
+def get_page_params(args):
+    """
+    Reads the `after`/`before` cursors and the page size from the query
+    string. Invalid values fall back to the defaults.
+    """
+    after = args.get('after', type=int)
+    before = args.get('before', type=int)
+    limit = args.get('limit', CONTACTS_PAGE_SIZE, type=int)
+    limit = min(max(limit, 1), CONTACTS_MAX_PAGE_SIZE)
+    return after, before, limit
+
+def is_not_modified(etag, last_modified=None):
+    # Pages with pending flash messages always have to be rendered,
+    # otherwise the browser would show its cached copy without them
+    if session.get('_flashes'):
+        return False
+
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if last_modified is not None and request.if_modified_since:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+def conditional_response(etag, render, last_modified=None):
+    """
+    Answers with 304 Not Modified when the client already has this
+    version of the page, so `render` (the template rendering) only runs
+    when the page changed.
+    """
+    if is_not_modified(etag, last_modified):
+        response = app.response_class(status=304)
+    else:
+        response = app.make_response(render())
+        if response.status_code != 200:
+            return response
+
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Browsers may keep the page but must revalidate it before reuse
+    response.cache_control.no_cache = True
+    response.cache_control.private = True
+    return response
+
+def render_contact_list_body(page, after, before, limit):
+    """
+    Renders the list of contacts (with its pagination links) for one page.
+    Returns None when the cursor contact no longer exists or there is
+    nothing past it.
+    """
+    if not page.contacts and (after is not None or before is not None):
+        return None
+
+    return render_template('_contact_list_body.html', contacts=page.contacts, page=page, limit=limit)
+
+def get_list_page_key(list_version, after, before, limit):
+    # Every write to the contacts bumps the list version, so a page
+    # is unchanged for as long as the version stays the same
+    storage_key = get_storage_key(app.config.get('TESTING', False))
+    return (storage_key, list_version, after, before, limit)
+
+def get_list_page_etag(page_key):
+    return hashlib.sha1(repr(page_key).encode()).hexdigest()
+
+def get_cached_list_body(page_key):
+    if not app.config['FRAGMENT_CACHE_ENABLED']:
+        return MISSING
+    return get_fragment_cache(app.config.get('TESTING', False)).get(page_key)
+
+def cache_list_body(page_key, list_body):
+    if app.config['FRAGMENT_CACHE_ENABLED']:
+        get_fragment_cache(app.config.get('TESTING', False)).set(
+            page_key, list_body, cost=len(list_body.encode('utf-8'))
+        )
+
 @app.route('/')
-@requires_contacts
-def home(contacts):
-    add_full_name(contacts)
-    contacts = [ {'id': contact['id'], 'full_name': contact['full_name']} for contact in contacts ]
-    return render_template('contact_list.html', contacts=contacts)
+def home():
+    after, before, limit = get_page_params(request.args)
+    try:
+        list_version = g.storage.get_list_version()
+    except DataHandlingError as e:
+        abort(500, description="Problem while loading contacts. Try again later")
+
+    page_key = get_list_page_key(list_version, after, before, limit)
+
+    def render():
+        list_body = get_cached_list_body(page_key)
+        if list_body is MISSING:
+            try:
+                page = g.storage.get_contacts_page(after=after, before=before, limit=limit)
+            except DataHandlingError as e:
+                abort(500, description="Problem while loading contacts. Try again later")
+
+            list_body = render_contact_list_body(page, after, before, limit)
+            # The cursor contact was deleted or there is nothing past it
+            if list_body is None:
+                return redirect(url_for('home'))
+            cache_list_body(page_key, list_body)
+
+        return render_template('contact_list.html', list_body=Markup(list_body))
+
+    return conditional_response(get_list_page_etag(page_key), render)
+
+@app.route('/contacts/search')
+def search_contacts():
+    search_text = request.args.get('q', '').strip()
+    limit = request.args.get('limit', SEARCH_RESULTS_LIMIT, type=int)
+    limit = min(max(limit, 1), SEARCH_MAX_RESULTS_LIMIT)
+
+    contacts = []
+    if search_text:
+        try:
+            contacts = g.storage.search_contacts(search_text, limit=limit)
+        except DataHandlingError as e:
+            abort(500, description="Problem while searching contacts. Try again later")
+
+    return render_template('search_results.html', contacts=contacts, search_text=search_text)
 
 @app.route('/contacts/<int:contact_id>')
 @requires_contact
-def view_contact(contacts, contact, contact_id):
+def view_contact(contact, contact_id):
+    return contact_details_response(contact)
+
+def contact_details_response(contact):
     contact['full_name'] = get_full_name(contact)
     # For now, the number of phone numbers is fixed to 3 in the app.
     # So we only take 3 first results from the storage
-    phone_numbers = g.storage.get_phone_numbers(contact_id)[:3]
-    return render_template('contact_details.html', contact=contact, phone_numbers=phone_numbers)
+    phone_numbers = contact['phone_numbers'][:3]
+    # Ids can be given out again after a delete, and a new contact starts
+    # at version 1, so the ETag also carries the modification time
+    updated_at = contact['updated_at'].isoformat() if contact['updated_at'] else ''
+    return conditional_response(
+        f"contact-{contact['id']}-{contact['version']}-{updated_at}",
+        lambda: render_template('contact_details.html', contact=contact, phone_numbers=phone_numbers),
+        last_modified=contact['updated_at']
+    )
 
 @app.route('/contacts/new')
 def new_contact():
@@ -194,34 +557,58 @@ def create_contact():
     flash(f'{get_full_name(contact)} has been added to your contacts', 'success')
     return redirect(url_for('view_contact', contact_id=new_id))
 
+@app.route('/contacts/import', methods=['GET', 'POST'])
+def import_contacts_upload():
+    if request.method == 'GET':
+        return render_template('import_contacts.html')
+
+    upload = request.files.get('contacts_file')
+    if not upload or not upload.filename:
+        flash('Choose a file to import.', 'error')
+        return render_template('import_contacts.html'), 422
+
+    try:
+        file_format = detect_format(upload.filename)
+    except DataHandlingError as e:
+        flash(str(e), 'error')
+        return render_template('import_contacts.html'), 422
+
+    records = read_contact_records(open_text_upload(upload), file_format)
+    report = import_contacts(g.storage, records)
+    if report.failure:
+        flash(describe_import_failure(report), 'error')
+        return render_template('import_contacts.html', report=report), 422
+
+    flash(f'{report.rows_imported} of {report.rows_processed} contacts imported.',
+          'success' if not report.errors else 'error')
+    return render_template('import_contacts.html', report=report)
+
+@app.route('/contacts/export.<export_format>')
+def export_contacts(export_format):
+    if export_format not in EXPORT_FORMATS:
+        abort(404)
+
+    # stream_with_context keeps the request (and its pooled connection)
+    # alive until the whole export has been sent
+    contacts = g.storage.iter_contacts_with_phone_numbers()
+    return Response(
+        stream_with_context(export_chunks(contacts, export_format)),
+        mimetype=EXPORT_MIMETYPES[export_format],
+        headers={
+            'Content-Disposition': f'attachment; filename=contacts.{export_format}'
+        }
+    )
+
 @app.route('/contacts/<int:contact_id>/edit', methods=['GET', 'POST'])
 @requires_contact
-def edit_contact(contacts, contact, contact_id):
+def edit_contact(contact, contact_id):
     if request.method == 'GET':
-        phone_numbers_data = g.storage.get_phone_numbers(contact_id)
-
-        # We only support 3 phone numbers in the frontend.
-        # If there are less than 3 phone numbers in the database,
-        # We populate the remaining fields with default data
-
-        phone_numbers = [
-            phone_numbers_data[i] if len(phone_numbers_data) > i
-            else default_phone_number_data()
-            for i in range(3)
-        ]
-
-        return render_template('edit_contact.html', contact=contact, phone_numbers=phone_numbers)
+        return render_edit_form(contact)
 
     elif request.method == 'POST':
         errors = errors_in_contact_data(request.form)
         if errors:
-            for error in errors:
-                flash(error, 'error')
-
-            contact = {'id': contact['id']} | request.form
-            phone_numbers = get_phone_nums_from_form(request.form)
-
-            return render_template('edit_contact.html', contact=contact, phone_numbers=phone_numbers), 422
+            return render_invalid_edit_form(contact['id'], errors)
 
         # updated_data = {'id':contact['id']} | get_clean_contact_data(request.form)
         updated_data = get_contact_data_from_form(request.form)
@@ -234,9 +621,33 @@ def edit_contact(contacts, contact, contact_id):
         return redirect(url_for('view_contact', contact_id=contact_id))
 
 
+def render_edit_form(contact):
+    phone_numbers_data = contact['phone_numbers']
+
+    # We only support 3 phone numbers in the frontend.
+    # If there are less than 3 phone numbers in the database,
+    # We populate the remaining fields with default data
+
+    phone_numbers = [
+        phone_numbers_data[i] if len(phone_numbers_data) > i
+        else default_phone_number_data()
+        for i in range(3)
+    ]
+
+    return render_template('edit_contact.html', contact=contact, phone_numbers=phone_numbers)
+
+def render_invalid_edit_form(contact_id, errors):
+    for error in errors:
+        flash(error, 'error')
+
+    contact = {'id': contact_id} | request.form
+    phone_numbers = get_phone_nums_from_form(request.form)
+
+    return render_template('edit_contact.html', contact=contact, phone_numbers=phone_numbers), 422
+
 @app.route('/contacts/<int:contact_id>/delete', methods=['POST'])
 @requires_contact
-def delete_contact(contacts, contact, contact_id):
+def delete_contact(contact, contact_id):
     g.storage.delete_one_contact(contact_id)
     # contacts.remove(contact)
     # update_contacts(contacts)
@@ -244,10 +655,253 @@ def delete_contact(contacts, contact, contact_id):
     flash('The contact has been deleted', 'success')
     return redirect(url_for('home'))
 
+# Async versions of the routes, under /async. They run as coroutines on
+# the event loop of an ASGI server, with connections borrowed from a
+# shared psycopg 3 `AsyncConnectionPool`, so one worker keeps many of
+# their queries in flight. The blueprint is registered by asgi.py, which
+# serves it: under WSGI, Flask would run each view in a loop of its own.
+async_views = Blueprint('async', __name__, url_prefix='/async')
+
+ASYNC_STORAGE_BACKENDS = ('postgres', 'postgres-pooled')
+
+@asynccontextmanager
+async def open_async_storage():
+    if app.config['CONTACTS_STORAGE_BACKEND'] not in ASYNC_STORAGE_BACKENDS:
+        abort(404)
+
+    pool = get_async_pool(get_db_dsn(app.config.get('TESTING', False)))
+    try:
+        storage = await AsyncContactsDatabaseStorage.connect(pool)
+    except PoolTimeoutError:
+        abort(503, description="The server is busy. Try again later")
+
+    try:
+        yield storage
+    finally:
+        await storage.close_connection()
+
+def invalidate_cached_contact(contact_id):
+    # Async writes bypass CachedContactsStorage, so the sync routes
+    # must not keep serving the old version of the contact
+    if app.config['CONTACT_CACHE_ENABLED']:
+        cache = get_contact_cache(app.config.get('TESTING', False))
+        for method_name in CachedContactsStorage.CACHED_READS:
+            cache.delete((method_name, contact_id))
+
+async def find_contact_or_redirect(storage, contact_id):
+    try:
+        contact = await storage.find_contact_with_phone_numbers(contact_id)
+    except DataHandlingError as e:
+        abort(500, description="Problem while loading contacts. Try again later")
+
+    if contact is None:
+        flash('Contact not found.', 'error')
+        abort(redirect(url_for('async.home')))
+    return contact
+
+@async_views.route('/')
+async def home():
+    after, before, limit = get_page_params(request.args)
+    async with open_async_storage() as storage:
+        try:
+            list_version = await storage.get_list_version()
+            page_key = get_list_page_key(list_version, after, before, limit)
+            etag = get_list_page_etag(page_key)
+
+            list_body = None
+            if not is_not_modified(etag):
+                list_body = get_cached_list_body(page_key)
+                if list_body is MISSING:
+                    page = await storage.get_contacts_page(after=after, before=before, limit=limit)
+                    list_body = render_contact_list_body(page, after, before, limit)
+                    # The cursor contact was deleted or there is nothing past it
+                    if list_body is None:
+                        return redirect(url_for('async.home'))
+                    cache_list_body(page_key, list_body)
+        except DataHandlingError as e:
+            abort(500, description="Problem while loading contacts. Try again later")
+
+    return conditional_response(
+        etag, lambda: render_template('contact_list.html', list_body=Markup(list_body))
+    )
+
+@async_views.route('/contacts/search')
+async def search_contacts():
+    search_text = request.args.get('q', '').strip()
+    limit = request.args.get('limit', SEARCH_RESULTS_LIMIT, type=int)
+    limit = min(max(limit, 1), SEARCH_MAX_RESULTS_LIMIT)
+
+    contacts = []
+    if search_text:
+        async with open_async_storage() as storage:
+            try:
+                contacts = await storage.search_contacts(search_text, limit=limit)
+            except DataHandlingError as e:
+                abort(500, description="Problem while searching contacts. Try again later")
+
+    return render_template('search_results.html', contacts=contacts, search_text=search_text)
+
+@async_views.route('/contacts/<int:contact_id>')
+async def view_contact(contact_id):
+    async with open_async_storage() as storage:
+        contact = await find_contact_or_redirect(storage, contact_id)
+
+    return contact_details_response(contact)
+
+@async_views.route('/contacts', methods=["POST"])
+async def create_contact():
+    errors = errors_in_contact_data(request.form)
+    if errors:
+        for error in errors:
+            flash(error, 'error')
+        return render_template('create_contact.html'), 422
+
+    contact = get_contact_data_from_form(request.form)
+    async with open_async_storage() as storage:
+        new_id = await storage.create_new_contact(**contact)
+    invalidate_cached_contact(new_id)
+
+    flash(f'{get_full_name(contact)} has been added to your contacts', 'success')
+    return redirect(url_for('async.view_contact', contact_id=new_id))
+
+@async_views.route('/contacts/<int:contact_id>/edit', methods=['GET', 'POST'])
+async def edit_contact(contact_id):
+    if request.method == 'GET':
+        async with open_async_storage() as storage:
+            contact = await find_contact_or_redirect(storage, contact_id)
+        return render_edit_form(contact)
+
+    errors = errors_in_contact_data(request.form)
+    async with open_async_storage() as storage:
+        await find_contact_or_redirect(storage, contact_id)
+        if errors:
+            return render_invalid_edit_form(contact_id, errors)
+
+        updated_data = get_contact_data_from_form(request.form)
+        await storage.update_one_contact(contact_id, **updated_data)
+    invalidate_cached_contact(contact_id)
+
+    flash(f'{get_full_name(updated_data)} has been updated.', 'success')
+    return redirect(url_for('async.view_contact', contact_id=contact_id))
+
+@async_views.route('/contacts/<int:contact_id>/delete', methods=['POST'])
+async def delete_contact(contact_id):
+    async with open_async_storage() as storage:
+        await find_contact_or_redirect(storage, contact_id)
+        await storage.delete_one_contact(contact_id)
+    invalidate_cached_contact(contact_id)
+
+    flash('The contact has been deleted', 'success')
+    return redirect(url_for('async.home'))
+
 @app.route('/test')
 def test_view():
     pass
 
+@app.route('/metrics')
+def metrics():
+    # Prometheus text exposition format
+    lines = metrics_registry.render()
+    with shared_pools_lock:
+        pools = list(shared_pools.items())
+
+    for dsn, pool in pools:
+        database = dsn.removeprefix('dbname=')
+        for name, value in pool.stats().items():
+            lines.append(
+                f'contacts_db_pool_{name}{{database="{database}"}} {value}'
+            )
+
+    statements = statement_stats.snapshot()
+    for name in ('prepares', 'prepare_seconds', 'reused_executions', 'parse_seconds_saved'):
+        lines.append(f'contacts_db_statement_{name}_total {statements[name]}')
+    for name, executions in sorted(statements['executions'].items()):
+        lines.append(
+            f'contacts_db_statement_executions_total{{statement="{name}"}} {executions}'
+        )
+
+    with contact_caches_lock:
+        caches = list(contact_caches.items())
+
+    for storage_key, cache in caches:
+        for name, value in cache.stats().items():
+            lines.append(
+                f'contacts_cache_{name}{{storage="{storage_key}"}} {value}'
+            )
+
+    return '\n'.join(lines) + '\n', 200, {
+        'Content-Type': 'text/plain; version=0.0.4'
+    }
+
+contacts_cli = AppGroup('contacts', help='Manage the contacts database.')
+
+@contacts_cli.command('init-db')
+@click.option('--testing', is_flag=True,
+              help='Migrate the test storage instead.')
+def init_db_command(testing):
+    """Apply pending schema migrations."""
+    storage = open_storage(testing)
+    try:
+        applied = storage.setup_schema()
+    finally:
+        storage.close_connection()
+
+    if applied:
+        click.echo(f"Applied migrations: {', '.join(map(str, applied))}")
+    else:
+        click.echo('Database schema is up to date.')
+
+@contacts_cli.command('import')
+@click.argument('file_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(IMPORT_FORMATS),
+              help='File format. Guessed from the file extension by default.')
+@click.option('--batch-size', default=IMPORT_BATCH_SIZE, show_default=True,
+              help='Contacts validated and loaded per transaction.')
+@click.option('--testing', is_flag=True,
+              help='Import into the test database instead.')
+def import_command(file_path, file_format, batch_size, testing):
+    """Import contacts from a CSV, JSONL or YAML file."""
+    def print_progress(report):
+        click.echo(f'Processed {report.rows_processed} rows, '
+                   f'imported {report.rows_imported}, '
+                   f'rejected {report.rows_rejected}', err=True)
+
+    storage = open_storage(testing)
+    try:
+        file_format = file_format or detect_format(file_path)
+        with open(file_path, 'r', encoding='utf-8', newline='') as file:
+            records = read_contact_records(file, file_format)
+            report = import_contacts(storage, records, batch_size, print_progress)
+    except DataHandlingError as e:
+        raise click.ClickException(str(e))
+    finally:
+        storage.close_connection()
+
+    for row_number, errors in report.errors:
+        click.echo(f'Row {row_number}: {"; ".join(errors)}')
+    if report.failure:
+        raise click.ClickException(describe_import_failure(report))
+    click.echo(f'Imported {report.rows_imported} of {report.rows_processed} contacts.')
+
+@contacts_cli.command('export')
+@click.option('--format', 'export_format', type=click.Choice(EXPORT_FORMATS),
+              default='csv', show_default=True)
+@click.option('-o', '--output', type=click.File('w', encoding='utf-8'),
+              default='-', help='Output file. Defaults to stdout.')
+@click.option('--testing', is_flag=True,
+              help='Export the test database instead.')
+def export_command(export_format, output, testing):
+    """Export all contacts as CSV, JSONL or vCard."""
+    storage = open_storage(testing)
+    try:
+        contacts = storage.iter_contacts_with_phone_numbers()
+        for chunk in export_chunks(contacts, export_format):
+            output.write(chunk)
+    finally:
+        storage.close_connection()
+
+app.cli.add_command(contacts_cli)
+
 # Creating a filter that will display empty strings when non-mandatory
 # fields are null in the data storage
 def display_optional_value(value):
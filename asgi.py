@@ -0,0 +1,178 @@
+"""
+ASGI entry point, for serving the async views:
+
+    uvicorn asgi:application --workers 4
+
+Requests under /async are handled by the `async` blueprint's views as
+coroutines on the server's event loop, with connections from one shared
+`AsyncConnectionPool` per worker, so a worker keeps many of their
+queries in flight. Every other request goes to the WSGI app, which
+asgiref's WsgiToAsgi runs in a thread pool.
+"""
+import inspect
+import io
+import sys
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import request, request_started
+
+from app import (
+    ASYNC_STORAGE_BACKENDS, app, async_views, get_storage_key,
+    migrated_storages, migrated_storages_lock
+)
+from contacts.async_db_storage import (
+    AsyncContactsDatabaseStorage, close_async_pools, open_async_pool
+)
+from contacts.db_storage import get_db_dsn
+
+app.register_blueprint(async_views)
+wsgi_application = WsgiToAsgi(app)
+
+def build_environ(scope, body):
+    # What a WSGI server would have passed to the app for this request
+    script_name = scope.get('root_path', '').encode('utf8').decode('latin1')
+    path_info = scope['path'].encode('utf8').decode('latin1')
+    if path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name,
+        'PATH_INFO': path_info,
+        'QUERY_STRING': scope['query_string'].decode('ascii'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+
+    for name, value in scope['headers']:
+        name = name.decode('latin1')
+        if name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        elif name == 'content-type':
+            key = 'CONTENT_TYPE'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        value = value.decode('latin1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+async def read_body(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        body += message.get('body', b'')
+        if not message.get('more_body', False):
+            break
+    return bytes(body)
+
+async def full_dispatch_request():
+    # Flask.full_dispatch_request, except that the view is awaited on
+    # this event loop instead of being run by `app.ensure_sync`
+    try:
+        request_started.send(app, _async_wrapper=app.ensure_sync)
+        response = app.preprocess_request()
+        if response is None:
+            if request.routing_exception is not None:
+                app.raise_routing_exception(request)
+            rule = request.url_rule
+            if (getattr(rule, 'provide_automatic_options', False)
+                    and request.method == 'OPTIONS'):
+                response = app.make_default_options_response()
+            else:
+                response = app.view_functions[rule.endpoint](**request.view_args)
+                if inspect.isawaitable(response):
+                    response = await response
+    except Exception as e:
+        response = app.handle_user_exception(e)
+    return app.finalize_request(response)
+
+async def serve_async_view(scope, receive, send):
+    # Flask.wsgi_app, with the response sent through ASGI
+    environ = build_environ(scope, await read_body(receive))
+    ctx = app.request_context(environ)
+    error = None
+    try:
+        try:
+            ctx.push()
+            response = await full_dispatch_request()
+        except Exception as e:
+            error = e
+            response = app.handle_exception(e)
+
+        body, status, headers = response.get_wsgi_response(environ)
+        await send({
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(name.lower().encode('latin1'), value.encode('latin1'))
+                        for name, value in headers],
+        })
+        try:
+            for chunk in body:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        ctx.pop(error)
+
+def is_async_path(scope):
+    path = scope['path'][len(scope.get('root_path', '')):]
+    prefix = async_views.url_prefix
+    return path == prefix or path.startswith(prefix + '/')
+
+async def startup():
+    if app.config['CONTACTS_STORAGE_BACKEND'] not in ASYNC_STORAGE_BACKENDS:
+        return
+
+    is_testing_env = app.config.get('TESTING', False)
+    pool = await open_async_pool(get_db_dsn(is_testing_env),
+                                 min_size=app.config['DB_POOL_MIN_SIZE'],
+                                 max_size=app.config['DB_POOL_MAX_SIZE'],
+                                 timeout=app.config['DB_POOL_TIMEOUT'])
+
+    # The views expect the schema to be up to date, as the sync ones do
+    if app.config['DB_AUTO_MIGRATE']:
+        storage = await AsyncContactsDatabaseStorage.connect(pool)
+        try:
+            await storage.setup_schema()
+        finally:
+            await storage.close_connection()
+        with migrated_storages_lock:
+            migrated_storages.add(get_storage_key(is_testing_env))
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await startup()
+            except Exception as e:
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_async_pools()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    elif scope['type'] == 'http' and is_async_path(scope):
+        await serve_async_view(scope, receive, send)
+    else:
+        await wsgi_application(scope, receive, send)
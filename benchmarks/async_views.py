@@ -0,0 +1,93 @@
+"""
+Latency percentiles and throughput of the sync routes against their
+async versions under /async.
+
+The sync routes are served by a threaded WSGI server, one thread per
+request, on the pooled psycopg2 storage. The async ones are served by
+uvicorn on a single event loop, on the shared psycopg 3 pool. Both use
+the postgres test database and the same pool size, and the async
+side needs `pip install contacts[async]`:
+
+    python -m benchmarks.async_views --contacts 10000 --concurrency 64
+"""
+import argparse
+import asyncio
+import logging
+import socket
+import sys
+import threading
+import time
+
+from app import app
+from benchmarks.load import (
+    ROUTES, WSGIRunner, destroy_storage, measure_route, print_result, seed_storage
+)
+from contacts.async_db_storage import async_storage_available
+
+class ASGIRunner(WSGIRunner):
+    """Serves asgi.py with uvicorn, on an event loop in another thread."""
+    def __enter__(self):
+        import uvicorn
+
+        logging.getLogger('uvicorn.access').setLevel(logging.WARNING)
+        self._socket = socket.socket()
+        self._socket.bind(('127.0.0.1', 0))
+        self.port = self._socket.getsockname()[1]
+        self._server = uvicorn.Server(uvicorn.Config('asgi:application', lifespan='on',
+                                                     log_level='warning'))
+        self._thread = threading.Thread(
+            target=lambda: asyncio.run(self._server.serve(sockets=[self._socket])),
+            daemon=True
+        )
+        self._thread.start()
+        while not self._server.started:
+            if not self._thread.is_alive():
+                raise SystemExit('uvicorn did not start')
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.should_exit = True
+        self._thread.join()
+        self._socket.close()
+
+def prefixed(make_request, prefix):
+    def make_prefixed_request(rng, contacts):
+        method, path, data = make_request(rng, contacts)
+        return method, prefix + path, data
+    return make_prefixed_request
+
+def run(contact_count, request_count, concurrency, routes, seed):
+    if not async_storage_available():
+        raise SystemExit('The async views need psycopg 3 and asgiref: '
+                         'pip install contacts[async]')
+
+    app.config.update(
+        TESTING=True,
+        CONTACTS_STORAGE_BACKEND='postgres-pooled',
+        DB_POOL_MAX_SIZE=max(concurrency, app.config['DB_POOL_MAX_SIZE']),
+    )
+    print(f'Seeding {contact_count} contacts...', file=sys.stderr)
+    contacts = seed_storage(contact_count, seed)
+
+    try:
+        for mode, runner_class, prefix in (('sync', WSGIRunner, ''),
+                                           ('async', ASGIRunner, '/async')):
+            with runner_class() as runner:
+                for route in routes:
+                    stats = measure_route(runner, prefixed(ROUTES[route], prefix),
+                                          contacts, request_count, concurrency, seed)
+                    print_result(mode, route, stats)
+    finally:
+        destroy_storage()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--contacts', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=1000,
+                        help='Requests per route and mode')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--routes', nargs='+', choices=list(ROUTES), default=list(ROUTES))
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    run(args.contacts, args.requests, args.concurrency, args.routes, args.seed)
@@ -0,0 +1,56 @@
+"""
+Rows per second of column-wise contact validation, against validating
+one form record at a time with `errors_in_contact_data`.
+
+    python -m benchmarks.batch_validation --rows 100000 1000000
+"""
+import argparse
+import random
+import statistics
+import timeit
+
+from app import errors_in_contact_data
+from contacts.batch_validation import CONTACT_COLUMNS, errors_in_contact_columns
+from utils import create_random_contacts
+
+def build_rows(row_count, seed, invalid_share=0.05):
+    rng = random.Random(seed)
+    rows = []
+    for contact in create_random_contacts(row_count, seed):
+        row = {'first_name': contact['first_name'],
+               'email_address': contact['email_address']}
+        for number in (1, 2, 3):
+            phone_numbers = contact['phone_numbers']
+            row[f'phone_number_{number}'] = (phone_numbers[number - 1]['number_value']
+                                             if number <= len(phone_numbers) else '')
+        if rng.random() < invalid_share:
+            row[rng.choice(CONTACT_COLUMNS)] = 'x@'
+        rows.append(row)
+    return rows
+
+def rows_per_second(func, row_count, repeat):
+    runs = timeit.repeat(func, number=1, repeat=repeat)
+    return row_count / statistics.median(runs)
+
+def run(row_counts, repeat, seed):
+    for row_count in row_counts:
+        rows = build_rows(row_count, seed)
+        columns = {column_name: [row[column_name] for row in rows]
+                   for column_name in CONTACT_COLUMNS}
+
+        by_row = rows_per_second(lambda: [errors_in_contact_data(row) for row in rows],
+                                 row_count, repeat)
+        by_column = rows_per_second(lambda: errors_in_contact_columns(columns),
+                                    row_count, repeat)
+        print(f'{row_count} rows')
+        print(f'  {"errors_in_contact_data":<28} {by_row:12,.0f} rows/s')
+        print(f'  {"errors_in_contact_columns":<28} {by_column:12,.0f} rows/s'
+              f'   ({by_column / by_row:.1f}x)')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    run(args.rows, args.repeat, args.seed)
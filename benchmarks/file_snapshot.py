@@ -0,0 +1,95 @@
+"""
+Load and dump times of the file backend's snapshot formats.
+
+Compares pure Python YAML, libyaml (when PyYAML has it) and marshal:
+
+    python -m benchmarks.file_snapshot --contacts 10000 100000
+"""
+import argparse
+import mmap
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import yaml
+
+from contacts.file_storage import (
+    SNAPSHOT_FORMATS, SnapshotFormat, store_from_data, store_to_data
+)
+from contacts.memory_storage import ContactsMemoryStore
+from utils import create_random_contact
+
+PHONE_TYPES = ('personal', 'home', 'work', 'other')
+
+def pure_python_yaml():
+    return SnapshotFormat(
+        '.yaml', False,
+        lambda buffer: yaml.load(buffer, Loader=yaml.SafeLoader),
+        lambda data, file: yaml.dump(data, file, Dumper=yaml.SafeDumper),
+    )
+
+def build_store(contact_count):
+    store = ContactsMemoryStore()
+    now = datetime.now(timezone.utc)
+    for contact_id in range(1, contact_count + 1):
+        contact = create_random_contact()
+        store.apply({
+            'op': 'create',
+            'contact': {
+                'id': contact_id,
+                'first_name': contact['first_name'],
+                'middle_names': contact['middle_names'],
+                'last_name': contact['last_name'],
+                'email_address': contact['email_address'],
+            },
+            'phone_numbers': [{
+                'id': store.allocate_phone_number_id(),
+                'number_value': contact['phone_number'],
+                'number_type': random.choice(PHONE_TYPES),
+            }],
+            'updated_at': now,
+        })
+    return store
+
+def time_format(snapshot_format, data, path, repeat):
+    mode = 'wb' if snapshot_format.binary else 'w'
+    dumps, loads = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with open(path, mode) as file:
+            snapshot_format.dump(data, file)
+        dumps.append(time.perf_counter() - start)
+
+        # Loaders take a read-only mmap, as in ContactsFile
+        start = time.perf_counter()
+        with open(path, 'rb') as file, \
+                mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            store_from_data(snapshot_format.load(buffer))
+        loads.append(time.perf_counter() - start)
+    return statistics.median(dumps), statistics.median(loads), os.path.getsize(path)
+
+def run(contact_counts, repeat):
+    formats = {'yaml (pure Python)': pure_python_yaml()}
+    if hasattr(yaml, 'CSafeLoader'):
+        formats['yaml (libyaml)'] = SNAPSHOT_FORMATS['yaml']
+    formats['marshal'] = SNAPSHOT_FORMATS['marshal']
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        for contact_count in contact_counts:
+            print(f'{contact_count} contacts')
+            data = store_to_data(build_store(contact_count))
+            for label, snapshot_format in formats.items():
+                path = os.path.join(data_dir, 'contacts' + snapshot_format.suffix)
+                dump, load, size = time_format(snapshot_format, data, path, repeat)
+                print(f'  {label:<20} dump {dump:8.3f} s   load {load:8.3f} s'
+                      f'   {size / 2 ** 20:7.1f} MB')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--contacts', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    run(args.contacts, args.repeat)
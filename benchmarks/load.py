@@ -0,0 +1,286 @@
+"""
+Latency percentiles and throughput of the main routes, through the Flask
+test client and a threaded WSGI server.
+
+Seeds the chosen storage backend with reproducible contacts, then
+requests each route in turn at a fixed concurrency. Results can be saved
+as a baseline and later runs compared against it:
+
+    python -m benchmarks.load --backend sqlite --contacts 10000 --concurrency 16
+    python -m benchmarks.load --backend sqlite --save benchmarks/baselines/sqlite.json
+    python -m benchmarks.load --backend sqlite --compare benchmarks/baselines/sqlite.json
+
+The postgres backends use the test database. Compare runs made on the
+same machine with the same options only; the command exits with status 1
+when a route regressed by more than `--tolerance`.
+"""
+import argparse
+import http.client
+import json
+import logging
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+from werkzeug.serving import make_server
+
+from app import app, open_storage
+from utils import PHONE_NUMBER_TYPES, create_random_contact, create_random_contacts
+
+MODES = ('test-client', 'wsgi')
+
+def contact_form(rng, phone_number_ids=()):
+    """
+    A create form with one phone number or, given the ids of a contact's
+    phone numbers, an edit form that updates them all in place, so
+    edits do not add numbers.
+    """
+    contact = create_random_contact(rng)
+    form = {key: contact[key]
+            for key in ('first_name', 'middle_names', 'last_name', 'email_address')}
+    for number in (1, 2, 3):
+        if phone_number_ids:
+            number_id = phone_number_ids[number - 1] if number <= len(phone_number_ids) else ''
+            value = create_random_contact(rng)['phone_number'] if number_id else ''
+        else:
+            number_id = ''
+            value = contact['phone_number'] if number == 1 else ''
+        form[f'phone_number_{number}'] = value
+        form[f'phone_number_{number}_type'] = rng.choice(PHONE_NUMBER_TYPES)
+        form[f'phone_number_{number}_id'] = str(number_id)
+    return form
+
+def edit_contact_request(rng, contacts):
+    contact_id, phone_number_ids = rng.choice(contacts)
+    return 'POST', f'/contacts/{contact_id}/edit', contact_form(rng, phone_number_ids)
+
+# Route name: function of (rng, seeded (contact id, phone number ids)
+# pairs) giving the (method, path, form data) of one request
+ROUTES = {
+    'home': lambda rng, contacts: ('GET', '/', None),
+    'home_page': lambda rng, contacts: ('GET', f'/?after={rng.choice(contacts)[0]}', None),
+    'search_contacts': lambda rng, contacts: (
+        'GET', '/contacts/search?' + urlencode({'q': rng.choice(('jo', 'smith', 'k.', '12'))}),
+        None
+    ),
+    'view_contact': lambda rng, contacts: ('GET', f'/contacts/{rng.choice(contacts)[0]}', None),
+    'edit_contact_form': lambda rng, contacts: (
+        'GET', f'/contacts/{rng.choice(contacts)[0]}/edit', None
+    ),
+    'create_contact': lambda rng, contacts: ('POST', '/contacts', contact_form(rng)),
+    'edit_contact': edit_contact_request,
+}
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+def seed_storage(contact_count, seed):
+    storage = open_storage(is_testing_env=True)
+    try:
+        storage.setup_schema()
+        storage.destroy_data()
+        storage.bulk_import_contacts(create_random_contacts(contact_count, seed))
+        return [(contact['id'], [phone_number['id'] for phone_number in contact['phone_numbers']])
+                for contact in storage.iter_contacts_with_phone_numbers()]
+    finally:
+        storage.close_connection()
+
+def destroy_storage():
+    storage = open_storage(is_testing_env=True)
+    try:
+        storage.destroy_data()
+    finally:
+        storage.close_connection()
+
+class ClientRunner:
+    """Calls the app in-process; each worker thread has its own client."""
+    def __init__(self):
+        self._local = threading.local()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def request(self, method, path, data):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            # No cookies, so flash messages do not pile up in the session
+            client = self._local.client = app.test_client(use_cookies=False)
+        return client.open(path, method=method, data=data).status_code
+
+class WSGIRunner:
+    """Serves the app with werkzeug's threaded server, over HTTP."""
+    def __enter__(self):
+        # One access log line per request would skew the timings
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        self._server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.port = self._server.server_port
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._thread.join()
+
+    def request(self, method, path, data):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port)
+        try:
+            body = headers = None
+            if data is not None:
+                body = urlencode(data)
+                headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+            connection.request(method, path, body=body, headers=headers or {})
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        finally:
+            connection.close()
+
+def measure_route(runner, make_request, contacts, request_count, concurrency, seed):
+    rng = random.Random(seed)
+    requests = [make_request(rng, contacts) for _ in range(request_count)]
+
+    def timed(request):
+        start = time.perf_counter()
+        status = runner.request(*request)
+        return time.perf_counter() - start, status
+
+    # Warm up the connections, caches and templates first
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed, requests[:concurrency]))
+
+        start = time.perf_counter()
+        results = list(executor.map(timed, requests))
+        elapsed = time.perf_counter() - start
+
+    durations = sorted(duration * 1000 for duration, status in results)
+    return {
+        'requests': request_count,
+        'errors': sum(1 for duration, status in results if status >= 400),
+        'mean_ms': round(statistics.fmean(durations), 3),
+        'p50_ms': round(percentile(durations, 0.50), 3),
+        'p95_ms': round(percentile(durations, 0.95), 3),
+        'p99_ms': round(percentile(durations, 0.99), 3),
+        'throughput_rps': round(request_count / elapsed, 1),
+    }
+
+def run(backend, contact_count, request_count, concurrency, modes, routes, seed):
+    with tempfile.TemporaryDirectory() as data_dir:
+        app.config.update(
+            TESTING=True,
+            CONTACTS_STORAGE_BACKEND=backend,
+            CONTACTS_FILE_PATH=os.path.join(data_dir, 'contacts.yaml'),
+            CONTACTS_SQLITE_PATH=os.path.join(data_dir, 'contacts.sqlite3'),
+            DB_POOL_MAX_SIZE=max(concurrency, app.config['DB_POOL_MAX_SIZE']),
+        )
+        print(f'Seeding {contact_count} contacts into {backend}...', file=sys.stderr)
+        contacts = seed_storage(contact_count, seed)
+
+        results = {}
+        try:
+            for mode in modes:
+                runner_class = ClientRunner if mode == 'test-client' else WSGIRunner
+                results[mode] = {}
+                with runner_class() as runner:
+                    for route in routes:
+                        results[mode][route] = stats = measure_route(
+                            runner, ROUTES[route], contacts,
+                            request_count, concurrency, seed
+                        )
+                        print_result(mode, route, stats)
+        finally:
+            destroy_storage()
+
+    return {
+        'options': {
+            'backend': backend,
+            'contacts': contact_count,
+            'requests': request_count,
+            'concurrency': concurrency,
+            'seed': seed,
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'recorded_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        },
+        'results': results,
+    }
+
+def print_result(mode, route, stats):
+    print(f"{mode:<12} {route:<18} p50 {stats['p50_ms']:8.2f} ms"
+          f"   p95 {stats['p95_ms']:8.2f} ms   p99 {stats['p99_ms']:8.2f} ms"
+          f"   {stats['throughput_rps']:8.1f} req/s"
+          + (f"   {stats['errors']} errors" if stats['errors'] else ''))
+
+def compare(report, baseline, tolerance):
+    """
+    Prints the change of every route measured in both runs, and returns
+    the regressions: p95 latency up, or throughput down, by more than
+    `tolerance` (a fraction).
+    """
+    if report['options'] != baseline['options']:
+        print(f"Warning: baseline options {baseline['options']} differ from "
+              f"{report['options']}", file=sys.stderr)
+
+    regressions = []
+    for mode, routes in report['results'].items():
+        for route, stats in routes.items():
+            base = baseline['results'].get(mode, {}).get(route)
+            if base is None:
+                continue
+            p95_change = stats['p95_ms'] / base['p95_ms'] - 1
+            throughput_change = stats['throughput_rps'] / base['throughput_rps'] - 1
+            regressed = p95_change > tolerance or throughput_change < -tolerance
+            if regressed:
+                regressions.append((mode, route))
+            print(f'{mode:<12} {route:<18} p95 {p95_change:+7.1%}'
+                  f'   throughput {throughput_change:+7.1%}'
+                  + ('   REGRESSION' if regressed else ''))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--backend', default='sqlite',
+                        help='Storage backend: sqlite, memory, file, postgres or postgres-pooled')
+    parser.add_argument('--contacts', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=500,
+                        help='Requests per route and mode')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--mode', choices=MODES + ('both', ), default='both')
+    parser.add_argument('--routes', nargs='+', choices=list(ROUTES), default=list(ROUTES))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', metavar='PATH', help='Write the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='PATH', help='Compare with a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    report = run(args.backend, args.contacts, args.requests, args.concurrency,
+                 MODES if args.mode == 'both' else (args.mode, ), args.routes, args.seed)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as file:
+            json.dump(report, file, indent=2)
+            file.write('\n')
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,118 @@
+"""
+Per-contact read and delete latency with and without the
+`phone_numbers_contact_id_idx` index.
+
+Runs against the test database:
+
+    python -m benchmarks.phone_numbers_index --contacts 200000
+"""
+import argparse
+import random
+import statistics
+import time
+
+from psycopg2.extras import execute_values
+
+from contacts.db_storage import ContactsDatabaseStorage
+from utils import create_random_contact
+
+PHONE_TYPES = ('personal', 'home', 'work', 'other')
+
+def seed_contacts(storage, contact_count, batch_size=5000):
+    storage.destroy_data()
+    with storage.connection:
+        with storage.connection.cursor() as cursor:
+            for start in range(0, contact_count, batch_size):
+                batch = [create_random_contact()
+                         for _ in range(min(batch_size, contact_count - start))]
+                contact_ids = execute_values(
+                    cursor,
+                    """
+                    INSERT INTO contacts (first_name, middle_names, last_name, email_address)
+                    VALUES %s
+                    RETURNING id
+                    """,
+                    [(c['first_name'], c['middle_names'], c['last_name'], c['email_address'])
+                     for c in batch],
+                    page_size=batch_size,
+                    fetch=True,
+                )
+                execute_values(
+                    cursor,
+                    """
+                    INSERT INTO phone_numbers (number_value, number_type, contact_id)
+                    VALUES %s
+                    """,
+                    [(contact['phone_number'], random.choice(PHONE_TYPES), contact_id)
+                     for contact, (contact_id, ) in zip(batch, contact_ids)],
+                    template='(%s, %s::phone_number_type, %s)',
+                    page_size=batch_size,
+                )
+            cursor.execute('ANALYZE contacts')
+            cursor.execute('ANALYZE phone_numbers')
+
+def all_contact_ids(storage):
+    with storage.connection:
+        with storage.connection.cursor() as cursor:
+            cursor.execute('SELECT id FROM contacts')
+            return [row[0] for row in cursor.fetchall()]
+
+def time_calls(func, args_list):
+    durations = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+def summarize(label, durations):
+    durations = sorted(durations)
+    p95 = durations[int(len(durations) * 0.95) - 1]
+    print(f'{label:<32} median {statistics.median(durations):8.3f} ms'
+          f'   p95 {p95:8.3f} ms')
+
+def set_index(storage, enabled):
+    with storage.connection:
+        with storage.connection.cursor() as cursor:
+            if enabled:
+                cursor.execute(
+                    """
+                    CREATE INDEX IF NOT EXISTS phone_numbers_contact_id_idx
+                    ON phone_numbers (contact_id, id)
+                    """
+                )
+            else:
+                cursor.execute('DROP INDEX IF EXISTS phone_numbers_contact_id_idx')
+
+def run(contact_count, sample_size):
+    storage = ContactsDatabaseStorage(is_testing_environment=True)
+    storage.setup_schema()
+
+    print(f'Seeding {contact_count} contacts...')
+    seed_contacts(storage, contact_count)
+    contact_ids = all_contact_ids(storage)
+    samples = random.sample(contact_ids, sample_size * 2)
+    read_ids, delete_ids = samples[:sample_size], samples[sample_size:]
+
+    try:
+        for enabled, delete_batch in ((False, delete_ids[:sample_size // 2]),
+                                      (True, delete_ids[sample_size // 2:])):
+            label = 'with index' if enabled else 'without index'
+            set_index(storage, enabled)
+            reads = time_calls(storage.find_contact_with_phone_numbers,
+                               [(contact_id, ) for contact_id in read_ids])
+            deletes = time_calls(storage.delete_one_contact,
+                                 [(contact_id, ) for contact_id in delete_batch])
+            summarize(f'read ({label})', reads)
+            summarize(f'delete ({label})', deletes)
+    finally:
+        set_index(storage, True)
+        storage.destroy_data()
+        storage.close_connection()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--contacts', type=int, default=100000)
+    parser.add_argument('--samples', type=int, default=200)
+    args = parser.parse_args()
+    run(args.contacts, args.samples)
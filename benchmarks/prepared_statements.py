@@ -0,0 +1,55 @@
+"""
+Per-call latency of the storage reads with and without server-side
+prepared statements.
+
+Runs against the test database:
+
+    python -m benchmarks.prepared_statements --contacts 100000
+"""
+import argparse
+import random
+
+from benchmarks.phone_numbers_index import seed_contacts, summarize, time_calls
+from contacts.db_storage import ContactsDatabaseStorage, statement_stats
+
+def run(contact_count, sample_size):
+    storage = ContactsDatabaseStorage(is_testing_environment=True)
+    storage.setup_schema()
+    print(f'Seeding {contact_count} contacts...')
+    seed_contacts(storage, contact_count)
+    contact_ids = [contact['id'] for contact in storage.get_all_contacts()]
+    storage.close_connection()
+
+    read_ids = [(contact_id, ) for contact_id in random.sample(contact_ids, sample_size)]
+    try:
+        for prepare in (False, True):
+            label = 'prepared' if prepare else 'unprepared'
+            storage = ContactsDatabaseStorage(is_testing_environment=True,
+                                              prepare_statements=prepare)
+            try:
+                reads = {
+                    'find_contact_with_phone_numbers': storage.find_contact_with_phone_numbers,
+                    'find_contact_by_id': storage.find_contact_by_id,
+                    'get_phone_numbers': storage.get_phone_numbers,
+                    'get_contacts_page': lambda contact_id: storage.get_contacts_page(after=contact_id),
+                }
+                for name, read in reads.items():
+                    summarize(f'{name} ({label})', time_calls(read, read_ids))
+            finally:
+                storage.close_connection()
+    finally:
+        storage = ContactsDatabaseStorage(is_testing_environment=True)
+        storage.destroy_data()
+        storage.close_connection()
+
+    stats = statement_stats.snapshot()
+    print(f"PREPAREs: {stats['prepares']}, executions reusing them: "
+          f"{stats['reused_executions']}, estimated parse time saved: "
+          f"{stats['parse_seconds_saved'] * 1000:.1f} ms")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--contacts', type=int, default=100000)
+    parser.add_argument('--samples', type=int, default=2000)
+    args = parser.parse_args()
+    run(args.contacts, args.samples)
@@ -0,0 +1,80 @@
+"""
+Per-call cost of the form validation and parsing that runs on every
+create and edit, and of the full name helpers over large batches.
+
+    python -m benchmarks.validation --forms 10000 --contacts 100000
+"""
+import argparse
+import copy
+import random
+import statistics
+import timeit
+
+from werkzeug.datastructures import ImmutableMultiDict
+
+from app import errors_in_contact_data, get_contact_data_from_form, get_phone_nums_from_form
+from utils import (
+    PHONE_NUMBER_TYPES, add_full_name, create_random_contact, create_random_contacts,
+    errors_for_email_addr, get_full_name
+)
+
+def build_forms(form_count, seed, invalid_share=0.2):
+    """Create/edit forms as the app receives them, some of them invalid."""
+    rng = random.Random(seed)
+    forms = []
+    for _ in range(form_count):
+        contact = create_random_contact(rng)
+        form = {
+            'first_name': f" {contact['first_name']} ",
+            'middle_names': rng.choice((contact['middle_names'], '', '  ')),
+            'last_name': contact['last_name'],
+            'email_address': contact['email_address'],
+        }
+        for number in (1, 2, 3):
+            form[f'phone_number_{number}'] = contact['phone_number'] if number == 1 else ''
+            form[f'phone_number_{number}_type'] = rng.choice(PHONE_NUMBER_TYPES).title()
+            form[f'phone_number_{number}_id'] = ''
+        if rng.random() < invalid_share:
+            form[rng.choice(('first_name', 'email_address', 'phone_number_2'))] = 'x@'
+        forms.append(ImmutableMultiDict(form))
+    return forms
+
+def time_per_call(func, args_list, repeat):
+    """Median over `repeat` runs of the time per call, in microseconds."""
+    def run_all():
+        for args in args_list:
+            func(*args)
+
+    runs = timeit.repeat(run_all, number=1, repeat=repeat)
+    return statistics.median(runs) / len(args_list) * 1e6
+
+def run(form_count, contact_count, repeat, seed):
+    forms = [(form, ) for form in build_forms(form_count, seed)]
+    emails = [(form[0]['email_address'], ) for form in forms]
+    contacts = create_random_contacts(contact_count, seed)
+    names = [(contact, ) for contact in contacts]
+
+    benchmarks = {
+        'errors_for_email_addr': (errors_for_email_addr, emails),
+        'errors_in_contact_data': (errors_in_contact_data, forms),
+        'get_phone_nums_from_form': (get_phone_nums_from_form, forms),
+        'get_contact_data_from_form': (get_contact_data_from_form, forms),
+        'get_full_name': (get_full_name, names),
+    }
+    for name, (func, args_list) in benchmarks.items():
+        print(f'{name:<28} {time_per_call(func, args_list, repeat):8.3f} us/call')
+
+    # add_full_name writes into the contacts, so each run gets fresh copies
+    batches = [copy.deepcopy(contacts) for _ in range(repeat)]
+    runs = timeit.repeat(lambda: add_full_name(batches.pop()), number=1, repeat=repeat)
+    print(f"{f'add_full_name ({contact_count})':<28} "
+          f'{statistics.median(runs) * 1000:8.3f} ms/batch')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--forms', type=int, default=10000)
+    parser.add_argument('--contacts', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    run(args.forms, args.contacts, args.repeat, args.seed)
@@ -0,0 +1,440 @@
+import asyncio
+import logging
+import re
+import time
+from functools import wraps
+
+import psycopg2
+
+from contacts.connection_pool import PoolTimeoutError
+from contacts.db_storage import (
+    BUMP_LIST_VERSION, DELETE_CONTACT, DELETE_PHONE_NUMBERS, EXPORT_CONTACTS,
+    INSERT_CONTACT, INSERT_PHONE_NUMBERS, SEARCH_CONTACTS, SEARCH_EMAILS,
+    SEARCH_NAMES, SEARCH_PHONE_NUMBERS, SELECT_ALL_CONTACTS, SELECT_CONTACT,
+    SELECT_CONTACT_WITH_PHONE_NUMBERS, SELECT_FIRST_PAGE, SELECT_LIST_VERSION,
+    SELECT_PAGE_AFTER, SELECT_PAGE_BEFORE, SELECT_PHONE_NUMBERS, UPDATE_CONTACT,
+    UPDATE_PHONE_NUMBERS, db_transaction_duration, escape_like
+)
+from contacts.errors import DataHandlingError
+from contacts.migrations import apply_migrations
+from contacts.storage import ContactSummary, ContactsPage
+
+try:
+    import psycopg
+    from psycopg.rows import dict_row
+    from psycopg_pool import AsyncConnectionPool, PoolTimeout
+except ImportError:
+    psycopg = None
+    dict_row = None
+    AsyncConnectionPool = PoolTimeout = None
+
+logger = logging.getLogger(__name__)
+
+def async_storage_available():
+    """
+    The async storage needs psycopg 3 and psycopg_pool, and serving it
+    needs asgiref (`pip install contacts[async]`).
+    """
+    try:
+        import asgiref
+    except ImportError:
+        return False
+    return psycopg is not None
+
+# DSN -> AsyncConnectionPool. An async pool belongs to the event loop it
+# was opened in, so the pools are opened by the ASGI server's lifespan
+# startup (see asgi.py) and closed at shutdown.
+async_pools = {}
+
+async def open_async_pool(dsn, min_size=1, max_size=10, timeout=5.0):
+    if psycopg is None:
+        raise DataHandlingError('The async storage needs psycopg 3 '
+                                '(pip install "psycopg[pool]")')
+
+    if dsn not in async_pools:
+        # Every storage method runs in an explicit transaction block
+        pool = AsyncConnectionPool(dsn, min_size=min_size, max_size=max_size,
+                                   timeout=timeout, kwargs={'autocommit': True},
+                                   open=False)
+        try:
+            await pool.open(wait=True, timeout=timeout)
+        except PoolTimeout as e:
+            await pool.close()
+            raise DataHandlingError(f'Could not connect to the database: {e}')
+        async_pools[dsn] = pool
+    return async_pools[dsn]
+
+def get_async_pool(dsn):
+    try:
+        return async_pools[dsn]
+    except KeyError:
+        raise DataHandlingError('No async connection pool is open: '
+                                'the async views are served by asgi.py')
+
+async def close_async_pools():
+    while async_pools:
+        _, pool = async_pools.popitem()
+        await pool.close()
+
+def db_transaction(row_factory=None, bumps_list_version=False):
+    """
+    Async counterpart of `contacts.db_storage.db_transaction`: runs the
+    decorated method in a transaction, passing it a cursor, and bumps
+    the list version once the transaction has committed.
+    """
+    def query_decorator(meth):
+        @wraps(meth)
+        async def wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
+            outcome = 'rollback'
+            try:
+                async with self.connection.transaction():
+                    async with self.connection.cursor(row_factory=row_factory) as cursor:
+                        result = await meth(self, cursor, *args, **kwargs)
+                outcome = 'commit'
+            finally:
+                db_transaction_duration.observe(time.perf_counter() - start,
+                                                meth.__name__, outcome)
+            if bumps_list_version:
+                try:
+                    await self._bump_list_version()
+                except (psycopg.Error, DataHandlingError):
+                    # The write itself has committed. Cached pages of the
+                    # old list expire through the fragment cache TTL.
+                    logger.exception('Could not bump the contact list version after %s',
+                                     meth.__name__)
+            return result
+        return wrapper
+    return query_decorator
+
+class AsyncContactsDatabaseStorage:
+    """
+    `ContactsDatabaseStorage` as coroutines, on psycopg 3: the same
+    methods, queries and return values.
+
+    Create it with `await AsyncContactsDatabaseStorage.connect(pool)`,
+    which borrows a connection from the shared `AsyncConnectionPool`;
+    `close_connection` gives it back. psycopg 3 prepares a query on
+    its own once a connection has run it a few times, and pooled
+    connections keep their prepared statements across requests.
+    """
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self.connection = connection
+
+    @classmethod
+    async def connect(cls, pool):
+        try:
+            connection = await pool.getconn()
+        except PoolTimeout:
+            raise PoolTimeoutError()
+        return cls(pool, connection)
+
+    async def close_connection(self):
+        if self.connection is None:
+            return
+
+        await self._pool.putconn(self.connection)
+        self.connection = None
+
+    async def setup_schema(self):
+        # Migrations are written against psycopg2, so they run on a
+        # connection of their own, in a thread
+        def migrate():
+            connection = psycopg2.connect(self._pool.conninfo)
+            try:
+                return apply_migrations(connection)
+            finally:
+                connection.close()
+
+        return await asyncio.to_thread(migrate)
+
+    @db_transaction(bumps_list_version=True)
+    async def destroy_data(self, cursor):
+        await cursor.execute('DELETE FROM contacts')
+
+    @db_transaction()
+    async def _bump_list_version(self, cursor):
+        await cursor.execute(BUMP_LIST_VERSION.sql)
+
+    @db_transaction()
+    async def get_list_version(self, cursor):
+        await cursor.execute(SELECT_LIST_VERSION.sql)
+        return (await cursor.fetchone())[0]
+
+    @db_transaction(dict_row)
+    async def get_all_contacts(self, cursor):
+        await cursor.execute(SELECT_ALL_CONTACTS.sql)
+        return await cursor.fetchall()
+
+    @db_transaction()
+    async def get_contacts_page(self, cursor, after=None, before=None, limit=50):
+        if after is not None:
+            await cursor.execute(SELECT_PAGE_AFTER.sql, (after, limit + 1))
+        elif before is not None:
+            await cursor.execute(SELECT_PAGE_BEFORE.sql, (before, limit + 1))
+        else:
+            await cursor.execute(SELECT_FIRST_PAGE.sql, (limit + 1, ))
+        contacts = list(map(ContactSummary._make, await cursor.fetchall()))
+
+        # One extra row was fetched to tell whether there is another page
+        has_more = len(contacts) > limit
+        contacts = contacts[:limit]
+
+        if before is not None:
+            contacts.reverse()
+            previous_cursor = contacts[0].id if has_more else None
+            next_cursor = contacts[-1].id if contacts else None
+        else:
+            previous_cursor = (contacts[0].id
+                               if after is not None and contacts else None)
+            next_cursor = contacts[-1].id if has_more else None
+
+        return ContactsPage(contacts, previous_cursor, next_cursor)
+
+    @db_transaction()
+    async def search_contacts(self, cursor, search_text, limit=20):
+        # Same matching and ranking as the sync storage
+        words = re.findall(r'\w+', search_text.lower())
+        digits = re.sub(r'\D', '', search_text)
+        email_prefix = search_text.strip().lower()
+
+        branches = []
+        params = {'limit': limit}
+        if words:
+            branches.append(SEARCH_NAMES)
+            params['name_query'] = ' & '.join(f'{word}:*' for word in words)
+        if email_prefix and ' ' not in email_prefix:
+            branches.append(SEARCH_EMAILS)
+            params['email_prefix'] = escape_like(email_prefix) + '%'
+        if digits:
+            branches.append(SEARCH_PHONE_NUMBERS)
+            params['phone_prefix'] = digits + '%'
+
+        if not branches:
+            return []
+
+        query = SEARCH_CONTACTS.format(matches=' UNION ALL '.join(branches))
+        await cursor.execute(query, params)
+        return list(map(ContactSummary._make, await cursor.fetchall()))
+
+    @db_transaction(dict_row)
+    async def find_contact_by_id(self, cursor, contact_id):
+        await cursor.execute(SELECT_CONTACT.sql, (contact_id, ))
+        return await cursor.fetchone()
+
+    @db_transaction(dict_row)
+    async def find_contact_with_phone_numbers(self, cursor, contact_id):
+        await cursor.execute(SELECT_CONTACT_WITH_PHONE_NUMBERS.sql, (contact_id, ))
+        rows = await cursor.fetchall()
+        if not rows:
+            return None
+
+        first_row = rows[0]
+        return {
+            'id': first_row['id'],
+            'first_name': first_row['first_name'],
+            'middle_names': first_row['middle_names'],
+            'last_name': first_row['last_name'],
+            'email_address': first_row['email_address'],
+            'version': first_row['version'],
+            'updated_at': first_row['updated_at'],
+            'phone_numbers': [
+                {
+                    'id': row['phone_number_id'],
+                    'number_value': row['number_value'],
+                    'number_type': row['number_type'],
+                    'contact_id': row['id'],
+                }
+                for row in rows
+                if row['phone_number_id'] is not None
+            ],
+        }
+
+    @db_transaction(dict_row)
+    async def get_phone_numbers(self, cursor, contact_id):
+        await cursor.execute(SELECT_PHONE_NUMBERS.sql, (contact_id, ))
+        return await cursor.fetchall()
+
+    @db_transaction(bumps_list_version=True)
+    async def create_new_contact(self, cursor, first_name, middle_names=None,
+                                 last_name=None, email_address=None,
+                                 phone_numbers=None):
+        await cursor.execute(INSERT_CONTACT.sql,
+                             (first_name, middle_names, last_name, email_address))
+        created_contact_id = (await cursor.fetchone())[0]
+
+        await self._add_phone_numbers(
+            cursor,
+            created_contact_id,
+            [
+                phone_num for phone_num in phone_numbers or []
+                if phone_num['number_value'] and phone_num['number_value'].strip()
+            ]
+        )
+        return created_contact_id
+
+    @db_transaction(bumps_list_version=True)
+    async def update_one_contact(self, cursor, contact_id, first_name,
+                                 middle_names, last_name, email_address,
+                                 phone_numbers):
+        await cursor.execute(UPDATE_CONTACT.sql, (first_name, middle_names, last_name,
+                                                  email_address, contact_id))
+
+        updated_numbers = []
+        deleted_number_ids = []
+        added_numbers = []
+        for phone_number in phone_numbers:
+            if phone_number['id']:
+                if phone_number['number_value']:
+                    updated_numbers.append(phone_number)
+                else:
+                    deleted_number_ids.append(int(phone_number['id']))
+            elif phone_number['number_value']:
+                added_numbers.append(phone_number)
+
+        await self._update_phone_numbers(cursor, contact_id, updated_numbers)
+        await self._delete_phone_numbers(cursor, contact_id, deleted_number_ids)
+        await self._add_phone_numbers(cursor, contact_id, added_numbers)
+
+    async def _delete_phone_numbers(self, cursor, contact_id, number_ids):
+        if not number_ids:
+            return
+
+        await cursor.execute(DELETE_PHONE_NUMBERS.sql, (number_ids, contact_id))
+
+    async def _update_phone_numbers(self, cursor, contact_id, phone_numbers):
+        if not phone_numbers:
+            return
+
+        params = (
+           [int(phone_number['id']) for phone_number in phone_numbers],
+           [phone_number['number_value'] for phone_number in phone_numbers],
+           [phone_number['number_type'] for phone_number in phone_numbers],
+           contact_id
+        )
+        await cursor.execute(UPDATE_PHONE_NUMBERS.sql, params)
+
+    async def _add_phone_numbers(self, cursor, contact_id, phone_numbers):
+        if not phone_numbers:
+            return
+
+        params = (
+           contact_id,
+           [phone_number['number_value'] for phone_number in phone_numbers],
+           [phone_number['number_type'] for phone_number in phone_numbers]
+        )
+        await cursor.execute(INSERT_PHONE_NUMBERS.sql, params)
+
+    @db_transaction(bumps_list_version=True)
+    async def delete_one_contact(self, cursor, contact_id):
+        await cursor.execute(DELETE_CONTACT.sql, (contact_id, ))
+
+    @db_transaction(bumps_list_version=True)
+    async def bulk_import_contacts(self, cursor, contacts):
+        """
+        Same staging tables and statements as the sync storage, with
+        the rows sent through psycopg 3's COPY.
+        """
+        if not contacts:
+            return 0
+
+        await cursor.execute(
+            """
+            CREATE TEMPORARY TABLE contacts_staging (
+                row_number INT PRIMARY KEY,
+                id INT,
+                first_name TEXT,
+                middle_names TEXT,
+                last_name TEXT,
+                email_address TEXT
+            ) ON COMMIT DROP;
+
+            CREATE TEMPORARY TABLE phone_numbers_staging (
+                row_number INT,
+                number_value TEXT,
+                number_type TEXT
+            ) ON COMMIT DROP;
+            """
+        )
+
+        async with cursor.copy(
+            """
+            COPY contacts_staging
+                (row_number, first_name, middle_names, last_name, email_address)
+            FROM STDIN
+            """
+        ) as copy:
+            for row_number, contact in enumerate(contacts):
+                await copy.write_row((row_number, contact['first_name'], contact['middle_names'],
+                                      contact['last_name'], contact['email_address']))
+
+        async with cursor.copy(
+            """
+            COPY phone_numbers_staging (row_number, number_value, number_type)
+            FROM STDIN
+            """
+        ) as copy:
+            for row_number, contact in enumerate(contacts):
+                for phone_number in contact.get('phone_numbers') or []:
+                    if phone_number['number_value'] and phone_number['number_value'].strip():
+                        await copy.write_row((row_number, phone_number['number_value'],
+                                              phone_number['number_type']))
+
+        # Ids are allocated up front so that phone numbers can be
+        # matched to their contacts through the staging row number
+        await cursor.execute(
+            """
+            UPDATE contacts_staging
+            SET id = nextval(pg_get_serial_sequence('contacts', 'id'));
+
+            INSERT INTO contacts (id, first_name, middle_names, last_name, email_address)
+            SELECT id, first_name, middle_names, last_name, email_address
+            FROM contacts_staging
+            ORDER BY row_number;
+
+            INSERT INTO phone_numbers (number_value, number_type, contact_id)
+            SELECT p.number_value, p.number_type::phone_number_type, c.id
+            FROM phone_numbers_staging AS p
+            JOIN contacts_staging AS c USING (row_number);
+            """
+        )
+
+        return len(contacts)
+
+    async def iter_contacts_with_phone_numbers(self, batch_size=2000):
+        """
+        Yields every contact, with its phone numbers, in id order,
+        reading `batch_size` rows at a time through a server-side cursor.
+        This is an async generator: the transaction stays open until it
+        is exhausted or closed.
+        """
+        contact = None
+        async with self.connection.transaction():
+            async with self.connection.cursor(name='contacts_export') as cursor:
+                cursor.itersize = batch_size
+                await cursor.execute(EXPORT_CONTACTS)
+
+                async for row in cursor:
+                    contact_id, first_name, middle_names, last_name, email_address = row[:5]
+                    if contact is None or contact['id'] != contact_id:
+                        if contact is not None:
+                            yield contact
+                        contact = {
+                            'id': contact_id,
+                            'first_name': first_name,
+                            'middle_names': middle_names,
+                            'last_name': last_name,
+                            'email_address': email_address,
+                            'phone_numbers': [],
+                        }
+                    if row[5] is not None:
+                        contact['phone_numbers'].append({
+                            'id': row[5],
+                            'number_value': row[6],
+                            'number_type': row[7],
+                            'contact_id': contact_id,
+                        })
+
+        if contact is not None:
+            yield contact
@@ -0,0 +1,198 @@
+import csv
+import io
+import json
+import os
+from itertools import islice
+
+import yaml
+
+from contacts.errors import DataHandlingError
+
+IMPORT_FORMATS = ('csv', 'jsonl', 'yaml')
+
+PHONE_NUMBER_TYPES = ('personal', 'home', 'work', 'other')
+
+# The web form supports 3 phone numbers per contact, so does the import
+MAX_PHONE_NUMBERS = 3
+
+# CSV column with the numbers past MAX_PHONE_NUMBERS, as
+# "5551234 (work); 5559876 (home)"
+OTHER_PHONE_NUMBERS_COLUMN = 'other_phone_numbers'
+
+CONTACT_ATTRIBUTES = (
+    'first_name',
+    'middle_names',
+    'last_name',
+    'email_address',
+)
+
+class ImportReport:
+    def __init__(self):
+        self.rows_processed = 0
+        self.rows_imported = 0
+        # (row number, [error messages]) for every rejected row
+        self.errors = []
+        # Why the import stopped before the end of the file, if it did.
+        # The batches imported until then stay imported.
+        self.failure = None
+
+    @property
+    def rows_rejected(self):
+        return len(self.errors)
+
+def detect_format(file_name):
+    extension = os.path.splitext(file_name)[1].lower().lstrip('.')
+    if extension == 'yml':
+        return 'yaml'
+    if extension == 'json':
+        return 'jsonl'
+    if extension in IMPORT_FORMATS:
+        return extension
+    raise DataHandlingError(f'Unsupported import file type: {file_name}')
+
+def format_other_phone_numbers(phone_numbers):
+    return '; '.join(f"{phone_number['number_value']} ({phone_number['number_type']})"
+                     for phone_number in phone_numbers)
+
+def parse_other_phone_numbers(text):
+    """(number value, number type) pairs of an `other_phone_numbers` cell."""
+    phone_numbers = []
+    for item in (text or '').split(';'):
+        number_value, _, number_type = item.strip().partition(' (')
+        if number_value:
+            phone_numbers.append((number_value, number_type.rstrip(')') or None))
+    return phone_numbers
+
+def _as_text(value):
+    return str(value).strip() if value is not None else None
+
+def _empty_form_record():
+    record = dict.fromkeys(CONTACT_ATTRIBUTES)
+    for index in range(1, MAX_PHONE_NUMBERS + 1):
+        record[f'phone_number_{index}'] = None
+        record[f'phone_number_{index}_type'] = 'personal'
+    record['extra_phone_numbers'] = 0
+    record['import_errors'] = []
+    return record
+
+class UnreadableRow:
+    """A row of the file that could not be parsed into fields."""
+    def __init__(self, message):
+        self.message = message
+
+def _jsonl_rows(file):
+    # Each line stands on its own, so a broken one only rejects its row
+    for line in file:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            yield UnreadableRow(f'Line is not valid JSON: {e}')
+
+def _as_form_record(data):
+    """
+    Converts one imported contact to the same flat shape as the
+    create/edit form (`phone_number_1`, `phone_number_1_type`, ...) so that
+    it goes through the same validators as a form submission.
+    Contacts can list their numbers under `phone_numbers`, either as plain
+    strings or as {'number_value', 'number_type'} mappings, or use the
+    single `phone_number` field of `contacts.yaml`.
+
+    Rows that are not contacts at all get `import_errors`; numbers past
+    the supported ones are counted in `extra_phone_numbers`.
+    """
+    record = _empty_form_record()
+    if isinstance(data, UnreadableRow):
+        record['import_errors'].append(data.message)
+        return record
+    if not isinstance(data, dict):
+        record['import_errors'].append('Row is not a contact: expected a mapping of fields')
+        return record
+
+    for attribute in CONTACT_ATTRIBUTES:
+        if data.get(attribute) is not None:
+            record[attribute] = str(data[attribute])
+
+    phone_numbers = data.get('phone_numbers')
+    if phone_numbers is None and data.get('phone_number') is not None:
+        phone_numbers = [data['phone_number']]
+    elif isinstance(phone_numbers, (str, int)):
+        phone_numbers = [phone_numbers]
+
+    if phone_numbers is not None:
+        if not isinstance(phone_numbers, list):
+            record['import_errors'].append('phone_numbers must be a list')
+            return record
+        phone_numbers = [
+            (phone_number.get('number_value'), phone_number.get('number_type'))
+            if isinstance(phone_number, dict) else (phone_number, None)
+            for phone_number in phone_numbers
+        ]
+    else:
+        phone_numbers = [
+            (data.get(f'phone_number_{index}'), data.get(f'phone_number_{index}_type'))
+            for index in range(1, MAX_PHONE_NUMBERS + 1)
+        ] + parse_other_phone_numbers(data.get(OTHER_PHONE_NUMBERS_COLUMN))
+
+    for index, (number_value, number_type) in enumerate(phone_numbers[:MAX_PHONE_NUMBERS], 1):
+        # The database rejects numbers with surrounding whitespace
+        record[f'phone_number_{index}'] = _as_text(number_value)
+        record[f'phone_number_{index}_type'] = _as_text(number_type) or 'personal'
+    record['extra_phone_numbers'] = sum(
+        1 for number_value, _ in phone_numbers[MAX_PHONE_NUMBERS:] if _as_text(number_value)
+    )
+
+    return record
+
+def read_contact_records(file, file_format):
+    """
+    Yields (row number, form record) pairs from a text file object.
+    Row numbers start at 1 and count data rows only.
+    """
+    if file_format not in IMPORT_FORMATS:
+        raise DataHandlingError(f'Unsupported import format: {file_format}')
+
+    try:
+        if file_format == 'csv':
+            rows = csv.DictReader(file)
+        elif file_format == 'jsonl':
+            rows = _jsonl_rows(file)
+        else:
+            rows = yaml.safe_load(file) or []
+            if not isinstance(rows, list):
+                raise DataHandlingError('YAML import files must contain a list of contacts')
+
+        for row_number, row in enumerate(rows, 1):
+            yield row_number, _as_form_record(row)
+    except (csv.Error, yaml.YAMLError) as e:
+        raise DataHandlingError(f'Could not parse import file: {e}')
+    except UnicodeDecodeError:
+        raise DataHandlingError('Import files must be UTF-8 encoded text')
+
+def errors_for_phone_num_types(record):
+    return [
+        f'Phone number type must be one of: {", ".join(PHONE_NUMBER_TYPES)}'
+        for index in range(1, MAX_PHONE_NUMBERS + 1)
+        if record[f'phone_number_{index}']
+        and record[f'phone_number_{index}_type'].lower() not in PHONE_NUMBER_TYPES
+    ]
+
+def errors_for_import_record(record):
+    """
+    Errors of an imported contact on top of the form validation. Rows
+    with `import_errors` are not contacts and are not validated further.
+    """
+    errors = errors_for_phone_num_types(record)
+    if record['extra_phone_numbers']:
+        errors.append(f'At most {MAX_PHONE_NUMBERS} phone numbers are supported per contact')
+    return errors
+
+def batched(iterable, batch_size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+def open_text_upload(file_storage):
+    # Uploaded files are binary streams; the readers above expect text
+    return io.TextIOWrapper(file_storage.stream, encoding='utf-8', newline='')
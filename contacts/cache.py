@@ -0,0 +1,259 @@
+import copy
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+# Returned by caches on a miss, since None is a valid cached value
+MISSING = object()
+
+class LRUCache:
+    """
+    Thread-safe in-process cache bounded by number of entries and,
+    optionally, by entry age (`ttl`, in seconds) and by the total
+    `cost` of its entries (e.g. their size in bytes).
+    """
+    def __init__(self, max_size=10000, ttl=None, max_cost=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_cost = max_cost
+        self.total_cost = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key, MISSING)
+            if entry is MISSING:
+                return MISSING
+
+            value, expires_at, _ = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                return MISSING
+
+            self._entries.move_to_end(key)
+            return value
+
+    def _remove(self, key):
+        _, _, cost = self._entries.pop(key)
+        self.total_cost -= cost
+
+    def set(self, key, value, cost=0):
+        if self.max_cost is not None and cost > self.max_cost:
+            return
+
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires_at, cost)
+            self.total_cost += cost
+            while (len(self._entries) > self.max_size
+                   or (self.max_cost is not None and self.total_cost > self.max_cost)):
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_cost = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+class SharedCacheBackend:
+    """
+    Cache shared between processes, on top of a client with the
+    redis-py `get` / `set(ex=..., nx=...)` interface.
+
+    Deleting a key leaves a short-lived tombstone in its place. Values
+    read from the storage are only written back where there is neither
+    a value nor a tombstone, so a read that started before a write cannot
+    put the old value back once the write has invalidated it.
+    """
+    TOMBSTONE = b''
+
+    def __init__(self, client, ttl=None, key_prefix='contacts:', tombstone_ttl=5):
+        self.client = client
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+        self.tombstone_ttl = tombstone_ttl
+
+    def _key(self, key):
+        return self.key_prefix + ':'.join(map(str, key))
+
+    def get(self, key):
+        data = self.client.get(self._key(key))
+        if data is None or data == self.TOMBSTONE:
+            return MISSING
+        return pickle.loads(data)
+
+    def set(self, key, value):
+        self.client.set(self._key(key), pickle.dumps(value), ex=self.ttl)
+
+    def add(self, key, value):
+        self.client.set(self._key(key), pickle.dumps(value), ex=self.ttl, nx=True)
+
+    def delete(self, key):
+        self.client.set(self._key(key), self.TOMBSTONE, ex=self.tombstone_ttl)
+
+    def clear(self):
+        # Entries of a shared cache expire through their TTL
+        pass
+
+class ContactCache:
+    """
+    Cache for contact records: the shared backend if one is configured,
+    else the in-process LRU. Only the shared backend sees the
+    invalidations of other workers, so the two are never stacked.
+    """
+    def __init__(self, local_cache, shared_cache=None):
+        self.local_cache = local_cache
+        self.shared_cache = shared_cache
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+        # Bumped by every invalidation of the local cache. A value read
+        # from the storage is only added if no invalidation happened
+        # since the read started.
+        self._invalidations = 0
+        self._invalidations_lock = threading.Lock()
+
+    def get(self, key):
+        if self.shared_cache is not None:
+            value = self.shared_cache.get(key)
+        else:
+            value = self.local_cache.get(key)
+
+        with self._stats_lock:
+            if value is MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        # Callers are free to modify what they get back
+        return copy.deepcopy(value) if value is not MISSING else MISSING
+
+    def set(self, key, value):
+        value = copy.deepcopy(value)
+        if self.shared_cache is not None:
+            self.shared_cache.set(key, value)
+        else:
+            self.local_cache.set(key, value)
+
+    def read_token(self):
+        """To be taken before reading a value from the storage and passed to `add`."""
+        return self._invalidations
+
+    def add(self, key, value, token):
+        """
+        Caches a value read from the storage, unless the key may have been
+        invalidated since `token` was taken.
+        """
+        value = copy.deepcopy(value)
+        if self.shared_cache is not None:
+            self.shared_cache.add(key, value)
+            return
+
+        with self._invalidations_lock:
+            if token == self._invalidations:
+                self.local_cache.set(key, value)
+
+    def delete(self, key):
+        if self.shared_cache is not None:
+            self.shared_cache.delete(key)
+            return
+
+        with self._invalidations_lock:
+            self._invalidations += 1
+            self.local_cache.delete(key)
+
+    def clear(self):
+        if self.shared_cache is not None:
+            self.shared_cache.clear()
+            return
+
+        with self._invalidations_lock:
+            self._invalidations += 1
+            self.local_cache.clear()
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self.local_cache),
+            }
+
+class CachedContactsStorage:
+    """
+    Read-through cache in front of a contacts storage object.
+    Single-contact reads are served from the cache; writes go to the
+    storage and invalidate the keys of the contact they change.
+    Anything not handled here is passed through to the storage.
+    """
+    CACHED_READS = (
+        'find_contact_with_phone_numbers',
+        'find_contact_by_id',
+        'get_phone_numbers',
+    )
+
+    def __init__(self, storage, cache):
+        self.storage = storage
+        self.cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self.storage, name)
+
+    def _read_through(self, method_name, contact_id):
+        key = (method_name, contact_id)
+        value = self.cache.get(key)
+        if value is MISSING:
+            token = self.cache.read_token()
+            value = getattr(self.storage, method_name)(contact_id)
+            # Missing contacts are not cached, so a later create
+            # never has to invalidate anything
+            if value is not None:
+                self.cache.add(key, value, token)
+        return value
+
+    def _invalidate(self, contact_id):
+        for method_name in self.CACHED_READS:
+            self.cache.delete((method_name, contact_id))
+
+    def find_contact_with_phone_numbers(self, contact_id):
+        return self._read_through('find_contact_with_phone_numbers', contact_id)
+
+    def find_contact_by_id(self, contact_id):
+        return self._read_through('find_contact_by_id', contact_id)
+
+    def get_phone_numbers(self, contact_id):
+        return self._read_through('get_phone_numbers', contact_id)
+
+    def update_one_contact(self, contact_id, *args, **kwargs):
+        try:
+            return self.storage.update_one_contact(contact_id, *args, **kwargs)
+        finally:
+            self._invalidate(contact_id)
+
+    def delete_one_contact(self, contact_id):
+        try:
+            return self.storage.delete_one_contact(contact_id)
+        finally:
+            self._invalidate(contact_id)
+
+    def create_new_contact(self, *args, **kwargs):
+        contact_id = self.storage.create_new_contact(*args, **kwargs)
+        self._invalidate(contact_id)
+        return contact_id
+
+    def destroy_data(self):
+        try:
+            return self.storage.destroy_data()
+        finally:
+            self.cache.clear()
@@ -0,0 +1,193 @@
+import threading
+import time
+from collections import deque
+
+import psycopg2
+
+from contacts.errors import DataHandlingError
+
+
+class PoolTimeoutError(DataHandlingError):
+    def __init__(self, message='Timed out waiting for a database connection'):
+        super().__init__(message)
+
+
+class PoolMetrics:
+    # Plain integer counters. They are only updated while the pool
+    # lock is held, so no extra synchronisation is needed here.
+    def __init__(self):
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.connections_opened = 0
+        self.connections_closed = 0
+        self.health_check_failures = 0
+
+
+class ConnectionPool:
+    """
+    Process-wide pool of psycopg2 connections.
+
+    Requests borrow a connection with `get_connection` and give it back
+    with `put_connection`. When all `max_size` connections are in use,
+    callers wait up to `timeout` seconds for one to be returned.
+
+    With `health_check`, connections that sat idle for more than
+    `health_check_idle_time` seconds are tested before being handed
+    out. Recently used ones are not, so a busy pool pays nothing for it.
+    """
+    def __init__(self, dsn, min_size=1, max_size=10, timeout=5.0,
+                 health_check=True, health_check_idle_time=30.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError('Invalid pool size: '
+                             f'min_size={min_size}, max_size={max_size}')
+
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check = health_check
+        self.health_check_idle_time = health_check_idle_time
+        self.metrics = PoolMetrics()
+
+        # (connection, time it was returned to the pool)
+        self._idle = deque()
+        self._size = 0
+        self._lock = threading.Condition()
+
+        for _ in range(min_size):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+            self.metrics.connections_opened += 1
+
+    def _connect(self):
+        try:
+            connection = psycopg2.connect(self.dsn)
+        except psycopg2.Error as e:
+            raise DataHandlingError(f'Could not connect to database: {e}')
+        return connection
+
+    def _close(self, connection):
+        if not connection.closed:
+            connection.close()
+        self.metrics.connections_closed += 1
+
+    def _needs_health_check(self, connection, idle_since):
+        if connection.closed:
+            return True
+        return (self.health_check
+                and time.monotonic() - idle_since > self.health_check_idle_time)
+
+    @staticmethod
+    def _is_healthy(connection):
+        if connection.closed:
+            return False
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            connection.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def get_connection(self):
+        deadline = time.monotonic() + self.timeout
+
+        while True:
+            connection = None
+            idle_since = None
+            with self._lock:
+                waited = False
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.metrics.timeouts += 1
+                        raise PoolTimeoutError()
+                    if not waited:
+                        self.metrics.waits += 1
+                        waited = True
+                    self._lock.wait(remaining)
+
+                if self._idle:
+                    connection, idle_since = self._idle.pop()
+                else:
+                    # Reserve the slot now, open the connection outside
+                    # the lock so other threads are not blocked by it.
+                    self._size += 1
+
+            if connection is None:
+                try:
+                    connection = self._connect()
+                except DataHandlingError:
+                    self._release_slot()
+                    raise
+                with self._lock:
+                    self.metrics.connections_opened += 1
+            elif self._needs_health_check(connection, idle_since) \
+                    and not self._is_healthy(connection):
+                with self._lock:
+                    self.metrics.health_check_failures += 1
+                    self._close(connection)
+                    self._size -= 1
+                    self._lock.notify()
+                continue
+
+            with self._lock:
+                self.metrics.checkouts += 1
+            return connection
+
+    def put_connection(self, connection, discard=False):
+        if not connection.closed and not discard:
+            try:
+                # Never hand out a connection with a transaction left open
+                status = connection.get_transaction_status()
+                if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        with self._lock:
+            if connection.closed or discard:
+                self._close(connection)
+                self._size -= 1
+            else:
+                self._idle.append((connection, time.monotonic()))
+            self._lock.notify()
+
+    def _release_slot(self):
+        with self._lock:
+            self._size -= 1
+            self._lock.notify()
+
+    def close_all(self):
+        with self._lock:
+            while self._idle:
+                self._close(self._idle.pop()[0])
+                self._size -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'checkouts': self.metrics.checkouts,
+                'waits': self.metrics.waits,
+                'timeouts': self.metrics.timeouts,
+                'connections_opened': self.metrics.connections_opened,
+                'connections_closed': self.metrics.connections_closed,
+                'health_check_failures': self.metrics.health_check_failures,
+            }
+
+
+# One pool per database per process, created on first use
+shared_pools = {}
+shared_pools_lock = threading.Lock()
+
+def get_shared_pool(dsn, **pool_options):
+    with shared_pools_lock:
+        if dsn not in shared_pools:
+            shared_pools[dsn] = ConnectionPool(dsn, **pool_options)
+        return shared_pools[dsn]
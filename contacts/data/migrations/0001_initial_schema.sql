@@ -0,0 +1,27 @@
+-- Databases created before migrations were introduced already have these
+-- objects, so every statement here must be safe to re-run on them.
+CREATE TABLE IF NOT EXISTS contacts (
+    id SERIAL PRIMARY KEY,
+    first_name TEXT NOT NULL,
+    middle_names TEXT,
+    last_name TEXT,
+    email_address TEXT,
+    CHECK(position('@' in email_address) > 0)
+);
+
+DO $$
+BEGIN
+    CREATE TYPE phone_number_type AS ENUM ('personal', 'home', 'work', 'other');
+EXCEPTION
+    WHEN duplicate_object THEN NULL;
+END
+$$;
+
+CREATE TABLE IF NOT EXISTS phone_numbers(
+    id SERIAL PRIMARY KEY,
+    number_value TEXT NOT NULL,
+    number_type phone_number_type NOT NULL,
+    contact_id INT NOT NULL REFERENCES contacts(id) ON DELETE CASCADE,
+    CHECK(LENGTH(number_value) >= 6),
+    CHECK(number_value SIMILAR TO '\d{6,}')
+);
@@ -0,0 +1,9 @@
+-- Sort key for the contact list. Stored so that keyset pagination
+-- over (sort_name, id) can be served straight from the index below.
+ALTER TABLE contacts
+    ADD COLUMN IF NOT EXISTS sort_name TEXT
+    GENERATED ALWAYS AS (
+        lower(first_name || ' ' || coalesce(middle_names, '') || ' ' || coalesce(last_name, ''))
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS contacts_sort_name_id_idx ON contacts (sort_name, id);
@@ -0,0 +1,17 @@
+-- Name search: prefix full-text matching over all name parts
+ALTER TABLE contacts
+    ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        to_tsvector('simple', first_name || ' ' || coalesce(middle_names, '') || ' ' || coalesce(last_name, ''))
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS contacts_search_vector_idx
+    ON contacts USING GIN (search_vector);
+
+-- Email search: case-insensitive prefix matching (LIKE 'abc%')
+CREATE INDEX IF NOT EXISTS contacts_email_address_prefix_idx
+    ON contacts (lower(email_address) text_pattern_ops);
+
+-- Phone search: prefix matching on the stored digits
+CREATE INDEX IF NOT EXISTS phone_numbers_number_value_prefix_idx
+    ON phone_numbers (number_value text_pattern_ops);
@@ -0,0 +1,5 @@
+-- Foreign key index for phone number lookups by contact and for the
+-- ON DELETE CASCADE from contacts. Including `id` lets the
+-- `ORDER BY id` in the phone number queries come straight from the index.
+CREATE INDEX IF NOT EXISTS phone_numbers_contact_id_idx
+    ON phone_numbers (contact_id, id);
@@ -0,0 +1,9 @@
+-- Row versions and modification times, used for HTTP conditional requests.
+-- The storage bumps them on every write to a row.
+ALTER TABLE contacts
+    ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 1,
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+ALTER TABLE phone_numbers
+    ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 1,
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
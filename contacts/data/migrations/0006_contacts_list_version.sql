@@ -0,0 +1,10 @@
+-- Counter bumped by every write that can change the contact list.
+-- Caches of the rendered list are keyed on it. A sequence rather than a
+-- table row, so concurrent writers do not queue behind each other's
+-- bump. Sequences do not roll back, so the storage bumps it only after
+-- the write has committed.
+CREATE SEQUENCE IF NOT EXISTS contacts_list_version;
+
+-- Until its first nextval, a sequence's last_value is the value that
+-- nextval will return, so the first bump would not change the version
+SELECT setval('contacts_list_version', 1);
@@ -4,9 +4,21 @@ CREATE TABLE contacts (
     middle_names TEXT,
     last_name TEXT,
     email_address TEXT,
+    sort_name TEXT GENERATED ALWAYS AS (
+        lower(first_name || ' ' || coalesce(middle_names, '') || ' ' || coalesce(last_name, ''))
+    ) STORED,
+    search_vector tsvector GENERATED ALWAYS AS (
+        to_tsvector('simple', first_name || ' ' || coalesce(middle_names, '') || ' ' || coalesce(last_name, ''))
+    ) STORED,
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
     CHECK(position('@' in email_address) > 0)
 );
 
+CREATE INDEX contacts_sort_name_id_idx ON contacts (sort_name, id);
+CREATE INDEX contacts_search_vector_idx ON contacts USING GIN (search_vector);
+CREATE INDEX contacts_email_address_prefix_idx ON contacts (lower(email_address) text_pattern_ops);
+
 CREATE TYPE phone_number_type as ENUM ('personal', 'home', 'work', 'other');
 
 CREATE TABLE phone_numbers(
@@ -14,6 +26,14 @@ CREATE TABLE phone_numbers(
     number_value TEXT NOT NULL,
     number_type phone_number_type NOT NULL,
     contact_id INT NOT NULL REFERENCES contacts(id) ON DELETE CASCADE,
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
     CHECK(LENGTH(number_value) >= 6),
     CHECK(number_value SIMILAR TO '\d{6,}')
-);
\ No newline at end of file
+);
+
+CREATE INDEX phone_numbers_contact_id_idx ON phone_numbers (contact_id, id);
+CREATE INDEX phone_numbers_number_value_prefix_idx ON phone_numbers (number_value text_pattern_ops);
+
+CREATE SEQUENCE contacts_list_version;
+SELECT setval('contacts_list_version', 1);
@@ -1,18 +1,439 @@
+import csv
+import io
+import logging
 import psycopg2
+import re
+import threading
+import time
+import weakref
+from psycopg2.errors import InvalidSqlStatementName
 from psycopg2.extras import DictCursor
 from textwrap import dedent
 from functools import wraps
-
-class DataHandlingError(Exception):
-    def __init__(self, message):
-        super().__init__(message)
-
+from itertools import count, groupby
+from operator import itemgetter
+from contacts.errors import DataHandlingError
+from contacts.metrics import registry
+from contacts.migrations import apply_migrations
+from contacts.query_profiler import ProfiledCursor, current_profile
+from contacts.storage import ContactSummary, ContactsPage
+
+logger = logging.getLogger(__name__)
+
+def escape_like(value):
+    return re.sub(r'([\\%_])', r'\\\1', value)
+
+# Query text -> statement name, for the query profiler
+statement_names = {}
+
+# Placeholders, and the string literals, quoted identifiers and
+# comments whose text can look like one
+SQL_TOKENS = re.compile(r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|--[^\n]*|%%|%s""")
+
+def number_placeholders(sql):
+    """
+    Returns `sql` with its `%s` placeholders numbered as `$1`, `$2`...
+    and `%%` unescaped, as PREPARE takes it, and the placeholder count.
+    """
+    numbers = count(1)
+    placeholders = 0
+
+    def replace(match):
+        nonlocal placeholders
+        token = match.group()
+        if token == '%s':
+            placeholders += 1
+            return f'${next(numbers)}'
+        # `%%` escapes a percent sign everywhere, as with psycopg2
+        return token.replace('%%', '%')
+
+    return SQL_TOKENS.sub(replace, sql), placeholders
+
+class Statement:
+    """
+    A query with positional `%s` parameters that can also run as a
+    server-side prepared statement. `param_types` are the Postgres types
+    of the parameters, in order.
+    """
+    def __init__(self, name, sql, param_types=()):
+        self.name = name
+        self.sql = dedent(sql)
+        body, placeholders = number_placeholders(self.sql)
+        if placeholders != len(param_types):
+            raise ValueError(f'{name}: expected {len(param_types)} parameters')
+
+        if param_types:
+            self.prepare_sql = f"PREPARE {name} ({', '.join(param_types)}) AS {body}"
+            self.execute_sql = f"EXECUTE {name} ({', '.join(['%s'] * len(param_types))})"
+        else:
+            self.prepare_sql = f'PREPARE {name} AS {body}'
+            self.execute_sql = f'EXECUTE {name}'
+
+        statement_names[self.sql] = statement_names[self.execute_sql] = name
+        statement_names[self.prepare_sql] = f'{name} (prepare)'
+
+class StatementStats:
+    """
+    Process-wide counts of prepared statement use, for /metrics.
+    Every execution of an already prepared statement skips parsing and
+    analysing the query; once Postgres switches the statement to a
+    generic plan it skips planning too.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.prepares = 0
+        self.prepare_seconds = 0.0
+        self.executions = {}
+        self.reused_executions = 0
+
+    def record_prepare(self, duration):
+        with self._lock:
+            self.prepares += 1
+            self.prepare_seconds += duration
+
+    def record_execution(self, name, reused):
+        with self._lock:
+            self.executions[name] = self.executions.get(name, 0) + 1
+            self.reused_executions += reused
+
+    def snapshot(self):
+        with self._lock:
+            average_prepare = self.prepare_seconds / self.prepares if self.prepares else 0.0
+            return {
+                'prepares': self.prepares,
+                'prepare_seconds': self.prepare_seconds,
+                'reused_executions': self.reused_executions,
+                # Estimated from the average PREPARE round trip, which is
+                # the parse and analysis each reuse avoided
+                'parse_seconds_saved': average_prepare * self.reused_executions,
+                'executions': dict(self.executions),
+            }
+
+statement_stats = StatementStats()
+
+# Names of the statements prepared on each connection. Prepared
+# statements live as long as the server session, so pooled connections
+# keep theirs across requests.
+prepared_statements = weakref.WeakKeyDictionary()
+prepared_statements_lock = threading.Lock()
+
+def execute_statement(cursor, statement, params=(), prepare=True):
+    if not prepare:
+        cursor.execute(statement.sql, params or None)
+        statement_stats.record_execution(statement.name, False)
+        return
+
+    connection = cursor.connection
+    with prepared_statements_lock:
+        prepared = prepared_statements.setdefault(connection, set())
+
+    reused = statement.name in prepared
+    if reused:
+        try:
+            cursor.execute(statement.execute_sql, params or None)
+        except InvalidSqlStatementName:
+            # Deallocated behind our back (e.g. DISCARD ALL by a
+            # connection pooler), likely along with every other one.
+            # The transaction is aborted; `db_transaction` runs it again.
+            prepared.clear()
+            raise
+        statement_stats.record_execution(statement.name, True)
+        return
+
+    start = time.perf_counter()
+    cursor.execute(statement.prepare_sql)
+    statement_stats.record_prepare(time.perf_counter() - start)
+    prepared.add(statement.name)
+
+    cursor.execute(statement.execute_sql, params or None)
+    statement_stats.record_execution(statement.name, False)
+
+CONTACT_COLUMNS = 'id, first_name, middle_names, last_name, email_address'
+DISPLAY_NAME = "concat_ws(' ', first_name, middle_names, last_name)"
+PAGE_ANCHOR = '(SELECT sort_name, id FROM contacts WHERE id = %s)'
+
+BUMP_LIST_VERSION = Statement(
+    'bump_list_version',
+    "SELECT nextval('contacts_list_version')"
+)
+
+SELECT_LIST_VERSION = Statement(
+    'select_list_version',
+    'SELECT last_value FROM contacts_list_version'
+)
+
+SELECT_ALL_CONTACTS = Statement(
+    'select_all_contacts',
+    f'SELECT {CONTACT_COLUMNS} FROM contacts'
+)
+
+# Keyset pagination over the (sort_name, id) index. The cursor is a
+# contact id; its sort key is looked up by primary key so the page
+# query never has to skip over rows like OFFSET does.
+# Only the id and the display name are selected: that is all the
+# list page needs.
+SELECT_PAGE_AFTER = Statement(
+    'select_page_after',
+    f"""
+    SELECT id, {DISPLAY_NAME}
+    FROM contacts
+    WHERE (sort_name, id) > {PAGE_ANCHOR}
+    ORDER BY sort_name, id
+    LIMIT %s
+    """,
+    ('int', 'int')
+)
+
+SELECT_PAGE_BEFORE = Statement(
+    'select_page_before',
+    f"""
+    SELECT id, {DISPLAY_NAME}
+    FROM contacts
+    WHERE (sort_name, id) < {PAGE_ANCHOR}
+    ORDER BY sort_name DESC, id DESC
+    LIMIT %s
+    """,
+    ('int', 'int')
+)
+
+SELECT_FIRST_PAGE = Statement(
+    'select_first_page',
+    f"""
+    SELECT id, {DISPLAY_NAME}
+    FROM contacts
+    ORDER BY sort_name, id
+    LIMIT %s
+    """,
+    ('int', )
+)
+
+SELECT_CONTACT = Statement(
+    'select_contact',
+    f"""
+    SELECT {CONTACT_COLUMNS}
+    FROM contacts
+    WHERE id = %s
+    """,
+    ('int', )
+)
+
+# One round trip for the contact, its phone numbers and the
+# "not found" check. Contacts without phone numbers come back
+# as a single row with NULL phone columns.
+SELECT_CONTACT_WITH_PHONE_NUMBERS = Statement(
+    'select_contact_with_phone_numbers',
+    """
+    SELECT
+        c.id,
+        c.first_name,
+        c.middle_names,
+        c.last_name,
+        c.email_address,
+        c.version,
+        c.updated_at,
+        p.id AS phone_number_id,
+        p.number_value,
+        p.number_type
+    FROM contacts AS c
+    LEFT JOIN phone_numbers AS p ON p.contact_id = c.id
+    WHERE c.id = %s
+    ORDER BY p.id
+    """,
+    ('int', )
+)
+
+SELECT_PHONE_NUMBERS = Statement(
+    'select_phone_numbers',
+    """
+    SELECT id, number_value, number_type, contact_id
+    FROM phone_numbers
+    WHERE contact_id = %s
+    ORDER BY id
+    """,
+    ('int', )
+)
+
+INSERT_CONTACT = Statement(
+    'insert_contact',
+    """
+    INSERT INTO contacts(
+        first_name,
+        middle_names,
+        last_name,
+        email_address
+    )
+    VALUES (%s, %s, %s, %s)
+    RETURNING id
+    """,
+    ('text', 'text', 'text', 'text')
+)
+
+UPDATE_CONTACT = Statement(
+    'update_contact',
+    """
+    UPDATE contacts
+    SET
+        first_name = %s,
+        middle_names = %s,
+        last_name = %s,
+        email_address = %s,
+        version = version + 1,
+        updated_at = now()
+    WHERE id = %s
+    """,
+    ('text', 'text', 'text', 'text', 'int')
+)
+
+DELETE_CONTACT = Statement(
+    'delete_contact',
+    """
+    DELETE
+    FROM contacts
+    WHERE id = %s
+    """,
+    ('int', )
+)
+
+DELETE_PHONE_NUMBERS = Statement(
+    'delete_phone_numbers',
+    """
+    DELETE FROM phone_numbers
+    WHERE id = ANY(%s) and contact_id = %s
+    """,
+    ('int[]', 'int')
+)
+
+# Phone number types are passed as text[], which every driver can send
+UPDATE_PHONE_NUMBERS = Statement(
+    'update_phone_numbers',
+    """
+    UPDATE phone_numbers AS p
+    SET number_value = v.number_value,
+        number_type = v.number_type,
+        version = p.version + 1,
+        updated_at = now()
+    FROM unnest(%s::int[], %s::text[], %s::text[]::phone_number_type[])
+        AS v(id, number_value, number_type)
+    WHERE p.id = v.id and p.contact_id = %s
+    """,
+    ('int[]', 'text[]', 'text[]', 'int')
+)
+
+INSERT_PHONE_NUMBERS = Statement(
+    'insert_phone_numbers',
+    """
+    INSERT INTO phone_numbers(
+        number_value,
+        number_type,
+        contact_id
+    )
+    SELECT number_value, number_type, %s
+    FROM unnest(%s::text[], %s::text[]::phone_number_type[])
+        AS v(number_value, number_type)
+    """,
+    ('int', 'text[]', 'text[]')
+)
+
+# The search query is put together from the branches that apply to the
+# search text, so it is not prepared. Each kind of match is served by
+# its own index:
+#  - names: prefix full-text match on `search_vector` (GIN)
+#  - emails: prefix match on lower(email_address)
+#  - phone numbers: prefix match on number_value
+# Contacts matching in several ways rank higher.
+SEARCH_NAMES = """
+    SELECT id AS contact_id, ts_rank(search_vector, query) + 1 AS rank
+    FROM contacts, to_tsquery('simple', %(name_query)s) AS query
+    WHERE search_vector @@ query
+"""
+
+SEARCH_EMAILS = """
+    SELECT id, 1
+    FROM contacts
+    WHERE lower(email_address) LIKE %(email_prefix)s
+"""
+
+SEARCH_PHONE_NUMBERS = """
+    SELECT contact_id, 1
+    FROM phone_numbers
+    WHERE number_value LIKE %(phone_prefix)s
+"""
+
+SEARCH_CONTACTS = dedent(
+    """
+    WITH matches AS (
+        {matches}
+    )
+    SELECT c.id, concat_ws(' ', c.first_name, c.middle_names, c.last_name)
+    FROM (
+        SELECT contact_id, sum(rank) AS rank
+        FROM matches
+        GROUP BY contact_id
+    ) AS m
+    JOIN contacts AS c ON c.id = m.contact_id
+    ORDER BY m.rank DESC, c.sort_name, c.id
+    LIMIT %(limit)s
+    """
+)
+
+# Read through a named cursor, which can't run a prepared statement
+EXPORT_CONTACTS = dedent(
+    """
+    SELECT
+        c.id,
+        c.first_name,
+        c.middle_names,
+        c.last_name,
+        c.email_address,
+        p.id,
+        p.number_value,
+        p.number_type
+    FROM contacts AS c
+    LEFT JOIN phone_numbers AS p ON p.contact_id = c.id
+    ORDER BY c.id, p.id
+    """
+)
+
+
+db_transaction_duration = registry.histogram(
+    'contacts_db_transaction_seconds',
+    'Duration of storage transactions, by storage method and outcome.',
+    ('method', 'outcome')
+)
 
 ### Decorators do not work on instance methods:
-def db_transaction(cursor_type=None):
+def db_transaction(cursor_type=None, bumps_list_version=False):
+    """
+    Runs the decorated storage method in a transaction, passing it a
+    cursor. Methods that change the contact list set `bumps_list_version`.
+    """
     def query_decorator(meth):
         @wraps(meth)
         def wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
+            outcome = 'rollback'
+            try:
+                try:
+                    result = run_transaction(self, *args, **kwargs)
+                except InvalidSqlStatementName:
+                    # A prepared statement was gone from the session and
+                    # has been forgotten: the retry prepares it again
+                    result = run_transaction(self, *args, **kwargs)
+                outcome = 'commit'
+            finally:
+                db_transaction_duration.observe(time.perf_counter() - start,
+                                                meth.__name__, outcome)
+            if bumps_list_version:
+                try:
+                    self._bump_list_version()
+                except (psycopg2.Error, DataHandlingError):
+                    # The write itself has committed. Cached pages of the
+                    # old list expire through the fragment cache TTL.
+                    logger.exception('Could not bump the contact list version after %s',
+                                     meth.__name__)
+            return result
+
+        def run_transaction(self, *args, **kwargs):
             with self.connection:
                 # cursor_type = DictCursor
                 cursor = (
@@ -22,82 +443,73 @@ def db_transaction(cursor_type=None):
                 )
 
                 with cursor:
+                    # When the request is being profiled, every query is
+                    # recorded under its statement name, or else under
+                    # the name of the storage method
+                    profile = current_profile.get()
+                    if profile is not None:
+                        profile.record_transaction()
+                        cursor = ProfiledCursor(
+                            cursor, profile,
+                            lambda query: statement_names.get(query, meth.__name__)
+                        )
                     result = meth(self, cursor, *args, **kwargs)
                     return result
         return wrapper
     return query_decorator
 
+def get_db_dsn(is_testing_environment):
+    db_name = ('contact_list' if not is_testing_environment
+               else 'test_contact_list')
+    return f'dbname={db_name}'
+
 class ContactsDatabaseStorage:
-    def __init__(self, is_testing_environment):
-        db_name = ('contact_list' if not is_testing_environment
-                   else 'test_contact_list')
+    def __init__(self, is_testing_environment, connection_pool=None,
+                 prepare_statements=None):
+        # In pooled mode the connection is borrowed from the process-wide
+        # pool and handed back in `close_connection`.
+        # Statements are prepared once per connection, which only pays
+        # off when the connection outlives the storage, so by default
+        # only pooled connections prepare them.
+        if prepare_statements is None:
+            prepare_statements = connection_pool is not None
+        self._connection_pool = connection_pool
+        self._prepare_statements = prepare_statements
+        if connection_pool is not None:
+            self.connection = connection_pool.get_connection()
+        else:
+            self.connection = psycopg2.connect(
+                get_db_dsn(is_testing_environment)
+            )
 
-        self.connection = psycopg2.connect(f'dbname={db_name}')
-        self.setup_schema()
+    def setup_schema(self):
+        # Schema changes are versioned migrations, applied once per process
+        # at startup (or via `flask contacts init-db`), not per request.
+        return apply_migrations(self.connection)
 
-    @db_transaction()
-    def setup_schema(self, cursor):
+    def _execute(self, cursor, statement, params=()):
+        execute_statement(cursor, statement, params, self._prepare_statements)
 
-        cursor.execute(
-            """
-            SELECT 1
-            FROM information_schema.tables
-            WHERE table_schema = 'public'
-            AND table_name = 'contacts'
-            """
-        )
-        if cursor.rowcount < 1:
-            cursor.execute(
-                r"""
-                CREATE TABLE contacts (
-                    id SERIAL PRIMARY KEY,
-                    first_name TEXT NOT NULL,
-                    middle_names TEXT,
-                    last_name TEXT,
-                    email_address TEXT,
-                    CHECK(position('@' in email_address) > 0)
-                )
-                """
-            )
+    @db_transaction(bumps_list_version=True)
+    def destroy_data(self, cursor):
+        cursor.execute('DELETE FROM contacts')
 
-        cursor.execute(
-            """
-            SELECT 1
-            FROM information_schema.tables
-            WHERE table_schema = 'public'
-            AND table_name = 'phone_numbers'
-            """
-        )
-        if cursor.rowcount < 1:
-            cursor.execute(
-                """
-                CREATE TYPE phone_number_type
-                AS ENUM ('personal', 'home', 'work', 'other')
-                """
-            )
-            cursor.execute(
-                """
-                CREATE TABLE phone_numbers(
-                    id SERIAL PRIMARY KEY,
-                    number_value TEXT NOT NULL,
-                    number_type phone_number_type NOT NULL,
-                    contact_id INT NOT NULL REFERENCES contacts(id) ON DELETE CASCADE,
-                    CHECK(LENGTH(number_value) >= 6),
-                    CHECK(number_value SIMILAR TO '\d{6,}')
-                )
-                """
-            )
+    @db_transaction()
+    def _bump_list_version(self, cursor):
+        # Only once the write has committed: a request that reads the new
+        # version must also see the new rows, or it would cache the old
+        # list under the new version. The version is a sequence, so
+        # concurrent writers do not queue behind each other's bump.
+        self._execute(cursor, BUMP_LIST_VERSION)
 
     @db_transaction()
-    def destroy_data(self, cursor):
-        cursor.execute('DELETE FROM contacts')
+    def get_list_version(self, cursor):
+        self._execute(cursor, SELECT_LIST_VERSION)
+        return cursor.fetchone()[0]
 
     @db_transaction(DictCursor)
     def _load_all_contacts(self, cursor):
-        # with self.connection:
-        #     with self.connection.cursor(cursor_factory=DictCursor) as cursor:
-        query = 'SELECT * FROM contacts'
-        cursor.execute(query)
+        self._execute(cursor, SELECT_ALL_CONTACTS)
         results = cursor.fetchall()
 
         return results
@@ -108,65 +520,121 @@ class ContactsDatabaseStorage:
         contacts = [dict(contact) for contact in self._load_all_contacts()]
         return contacts
 
+    @db_transaction()
+    def get_contacts_page(self, cursor, after=None, before=None, limit=50):
+        if after is not None:
+            self._execute(cursor, SELECT_PAGE_AFTER, (after, limit + 1))
+        elif before is not None:
+            self._execute(cursor, SELECT_PAGE_BEFORE, (before, limit + 1))
+        else:
+            self._execute(cursor, SELECT_FIRST_PAGE, (limit + 1, ))
+        contacts = list(map(ContactSummary._make, cursor.fetchall()))
+
+        # One extra row was fetched to tell whether there is another page
+        has_more = len(contacts) > limit
+        contacts = contacts[:limit]
+
+        if before is not None:
+            contacts.reverse()
+            previous_cursor = contacts[0].id if has_more else None
+            next_cursor = contacts[-1].id if contacts else None
+        else:
+            previous_cursor = (contacts[0].id
+                               if after is not None and contacts else None)
+            next_cursor = contacts[-1].id if has_more else None
+
+        return ContactsPage(contacts, previous_cursor, next_cursor)
+
+    @db_transaction()
+    def search_contacts(self, cursor, search_text, limit=20):
+        words = re.findall(r'\w+', search_text.lower())
+        digits = re.sub(r'\D', '', search_text)
+        email_prefix = search_text.strip().lower()
+
+        branches = []
+        params = {'limit': limit}
+        if words:
+            branches.append(SEARCH_NAMES)
+            params['name_query'] = ' & '.join(f'{word}:*' for word in words)
+        if email_prefix and ' ' not in email_prefix:
+            branches.append(SEARCH_EMAILS)
+            params['email_prefix'] = escape_like(email_prefix) + '%'
+        if digits:
+            branches.append(SEARCH_PHONE_NUMBERS)
+            params['phone_prefix'] = digits + '%'
+
+        if not branches:
+            return []
+
+        query = SEARCH_CONTACTS.format(matches=' UNION ALL '.join(branches))
+        cursor.execute(query, params)
+        return list(map(ContactSummary._make, cursor.fetchall()))
+
     @db_transaction(DictCursor)
     def find_contact_by_id(self, cursor, contact_id):
-        # with self.connection:
-        #     with self.connection.cursor(cursor_factory=DictCursor) as cursor:
-        query = dedent(
-            """
-            SELECT *
-            FROM contacts
-            WHERE id = %s
-            """
-        )
-        cursor.execute(query, (contact_id, ))
-        contact = dict(cursor.fetchone())
+        self._execute(cursor, SELECT_CONTACT, (contact_id, ))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+    @db_transaction(DictCursor)
+    def find_contact_with_phone_numbers(self, cursor, contact_id):
+        self._execute(cursor, SELECT_CONTACT_WITH_PHONE_NUMBERS, (contact_id, ))
+        rows = cursor.fetchall()
+        if not rows:
+            return None
+
+        first_row = rows[0]
+        contact = {
+            'id': first_row['id'],
+            'first_name': first_row['first_name'],
+            'middle_names': first_row['middle_names'],
+            'last_name': first_row['last_name'],
+            'email_address': first_row['email_address'],
+            'version': first_row['version'],
+            'updated_at': first_row['updated_at'],
+            'phone_numbers': [
+                {
+                    'id': row['phone_number_id'],
+                    'number_value': row['number_value'],
+                    'number_type': row['number_type'],
+                    'contact_id': row['id'],
+                }
+                for row in rows
+                if row['phone_number_id'] is not None
+            ],
+        }
         return contact
 
-    @db_transaction()
+    @db_transaction(bumps_list_version=True)
     def delete_one_contact(self, cursor, contact_id):
-        # with self.connection:
-        #     with self.connection.cursor() as cursor:
-        query = dedent(
-            """
-            DELETE
-            FROM contacts
-            WHERE id = %s
-            """
-        )
-        cursor.execute(query, (contact_id, ))
+        self._execute(cursor, DELETE_CONTACT, (contact_id, ))
 
     def close_connection(self):
-        self.connection.close()
+        if self.connection is None:
+            return
+
+        if self._connection_pool is not None:
+            self._connection_pool.put_connection(self.connection)
+        else:
+            self.connection.close()
+        self.connection = None
 
     def _update_contact_details(
         self, cursor, contact_id,first_name,
         middle_names, last_name, email_address):
 
-        query = dedent(
-            """
-            UPDATE contacts
-            SET
-                first_name = %s,
-                middle_names = %s,
-                last_name = %s,
-                email_address = %s
-            WHERE id = %s
-            """
-        )
         params = (
             first_name, middle_names,
             last_name,
             email_address, contact_id
         )
-
-        cursor.execute(query, params)
+        self._execute(cursor, UPDATE_CONTACT, params)
 
 
     # Updating a contact is a transaction.
     # All the sub_queries composing the update are
     # pat the same transaction. 1 sub-query fails = txn fails
-    @db_transaction()
+    @db_transaction(bumps_list_version=True)
     def update_one_contact(
         self,
         cursor,
@@ -177,87 +645,71 @@ class ContactsDatabaseStorage:
         email_address,
         phone_numbers
     ):
-        # Update basic contact details
+        # Update basic contact details. This also bumps the contact's
+        # version, so phone number changes show up in its ETag too.
         self._update_contact_details(cursor, contact_id, first_name,
                                      middle_names,last_name, email_address)
 
-        # Update phone numbers based on input data
+        # Sort the submitted phone numbers into one set-based statement
+        # per kind of change, so a save costs the same number of round
+        # trips however many phone numbers the contact has.
+        updated_numbers = []
+        deleted_number_ids = []
+        added_numbers = []
         for phone_number in phone_numbers:
             # Existing phone number
             if phone_number['id']:
                 # Existing phone number should be updated
                 if phone_number['number_value']:
-                    self._update_phone_number(
-                        cursor,
-                        contact_id,
-                        int(phone_number['id']),
-                        phone_number['number_value'],
-                        phone_number['number_type']
-                    )
+                    updated_numbers.append(phone_number)
                 # Existing phone number was deleted
                 else:
-                    self._delete_phone_number(cursor, contact_id, int(phone_number['id']))
+                    deleted_number_ids.append(int(phone_number['id']))
             # There is no existing number but value was entered:
             # add new number
             elif phone_number['number_value']:
-                self._add_phone_number(
-                    cursor,
-                    contact_id,
-                    phone_number['number_value'],
-                    phone_number['number_type']
-                )
+                added_numbers.append(phone_number)
 
+        self._update_phone_numbers(cursor, contact_id, updated_numbers)
+        self._delete_phone_numbers(cursor, contact_id, deleted_number_ids)
+        self._add_phone_numbers(cursor, contact_id, added_numbers)
+
+
+    def _delete_phone_numbers(self, cursor, contact_id, number_ids):
+        if not number_ids:
+            return
 
-    def _delete_phone_number(self, cursor, contact_id, number_id):
-        query = dedent(
-            """
-            DELETE FROM phone_numbers
-            WHERE id = %s and contact_id = %s
-            """
-        )
         params = (
-           number_id,
+           number_ids,
            contact_id
         )
-        cursor.execute(query, params)
+        self._execute(cursor, DELETE_PHONE_NUMBERS, params)
+
+    def _update_phone_numbers(self, cursor, contact_id, phone_numbers):
+        if not phone_numbers:
+            return
 
-    def _update_phone_number(self, cursor, contact_id, number_id, number_value, number_type):
-        query = dedent(
-            """
-            UPDATE phone_numbers
-            SET number_value = %s,
-                number_type = %s
-            WHERE id = %s and contact_id = %s
-            """
-        )
         params = (
-           number_value,
-           number_type,
-           number_id,
+           [int(phone_number['id']) for phone_number in phone_numbers],
+           [phone_number['number_value'] for phone_number in phone_numbers],
+           [phone_number['number_type'] for phone_number in phone_numbers],
            contact_id
         )
-        cursor.execute(query, params)
+        self._execute(cursor, UPDATE_PHONE_NUMBERS, params)
+
+    def _add_phone_numbers(self, cursor, contact_id, phone_numbers):
+        if not phone_numbers:
+            return
 
-    def _add_phone_number(self, cursor, contact_id, number_value, number_type):
-        query = dedent(
-            """
-            INSERT INTO phone_numbers(
-                number_value,
-                number_type,
-                contact_id
-            )
-            VALUES (%s, %s, %s)
-            """
-        )
         params = (
-           number_value,
-           number_type,
-           contact_id
+           contact_id,
+           [phone_number['number_value'] for phone_number in phone_numbers],
+           [phone_number['number_type'] for phone_number in phone_numbers]
         )
-        cursor.execute(query, params)
+        self._execute(cursor, INSERT_PHONE_NUMBERS, params)
 
 
-    @db_transaction()
+    @db_transaction(bumps_list_version=True)
     def create_new_contact(
         self,
         cursor,
@@ -267,47 +719,147 @@ class ContactsDatabaseStorage:
         email_address=None,
         phone_numbers=None
     ):
-        # with self.connection:
-        #     with self.connection.cursor(cursor_factory=DictCursor) as cursor:
-        query = dedent(
-            """
-            INSERT INTO contacts(
-                first_name,
-                middle_names,
-                last_name,
-                email_address
-            )
-            VALUES (%s, %s, %s, %s)
-            RETURNING id
-            """
-        )
-
         params = (first_name, middle_names, last_name, email_address)
-        cursor.execute(query, params)
+        self._execute(cursor, INSERT_CONTACT, params)
 
         created_contact_id = cursor.fetchone()[0]
 
-        for phone_num in phone_numbers:
-            if phone_num['number_value'].strip():
-                self._add_phone_number(
-                    cursor,
-                    created_contact_id,
-                    phone_num['number_value'],
-                    phone_num['number_type']
-                )
+        self._add_phone_numbers(
+            cursor,
+            created_contact_id,
+            [
+                phone_num for phone_num in phone_numbers or []
+                if phone_num['number_value'] and phone_num['number_value'].strip()
+            ]
+        )
 
         # Returning the ID of the new contact so that the app
         # can redirect to the details of the contact
         return created_contact_id
 
-    @db_transaction(DictCursor)
-    def get_phone_numbers(self, cursor, contact_id):
-        query = dedent(
+    @staticmethod
+    def _csv_buffer(rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        return buffer
+
+    @db_transaction(bumps_list_version=True)
+    def bulk_import_contacts(self, cursor, contacts):
+        """
+        Inserts a batch of already validated contacts (in the shape
+        returned by `get_contact_data_from_form`) in one transaction.
+        Rows are loaded with COPY into temporary staging tables and moved
+        into the real tables with two INSERT ... SELECT statements.
+        Returns the number of contacts imported.
+        """
+        if not contacts:
+            return 0
+
+        cursor.execute(
+            """
+            CREATE TEMPORARY TABLE contacts_staging (
+                row_number INT PRIMARY KEY,
+                id INT,
+                first_name TEXT,
+                middle_names TEXT,
+                last_name TEXT,
+                email_address TEXT
+            ) ON COMMIT DROP;
+
+            CREATE TEMPORARY TABLE phone_numbers_staging (
+                row_number INT,
+                number_value TEXT,
+                number_type TEXT
+            ) ON COMMIT DROP;
+            """
+        )
+
+        contact_rows = (
+            (row_number, contact['first_name'], contact['middle_names'],
+             contact['last_name'], contact['email_address'])
+            for row_number, contact in enumerate(contacts)
+        )
+        phone_number_rows = (
+            (row_number, phone_number['number_value'], phone_number['number_type'])
+            for row_number, contact in enumerate(contacts)
+            for phone_number in contact.get('phone_numbers') or []
+            if phone_number['number_value'] and phone_number['number_value'].strip()
+        )
+
+        # In CSV format unquoted empty fields are read as NULL
+        cursor.copy_expert(
+            """
+            COPY contacts_staging
+                (row_number, first_name, middle_names, last_name, email_address)
+            FROM STDIN WITH (FORMAT csv)
+            """,
+            self._csv_buffer(contact_rows)
+        )
+        cursor.copy_expert(
+            """
+            COPY phone_numbers_staging (row_number, number_value, number_type)
+            FROM STDIN WITH (FORMAT csv)
+            """,
+            self._csv_buffer(phone_number_rows)
+        )
+
+        # Ids are allocated up front so that phone numbers can be
+        # matched to their contacts through the staging row number
+        cursor.execute(
             """
-            SELECT *
-            FROM phone_numbers
-            WHERE contact_id = %s
+            UPDATE contacts_staging
+            SET id = nextval(pg_get_serial_sequence('contacts', 'id'));
+
+            INSERT INTO contacts (id, first_name, middle_names, last_name, email_address)
+            SELECT id, first_name, middle_names, last_name, email_address
+            FROM contacts_staging
+            ORDER BY row_number;
+
+            INSERT INTO phone_numbers (number_value, number_type, contact_id)
+            SELECT p.number_value, p.number_type::phone_number_type, c.id
+            FROM phone_numbers_staging AS p
+            JOIN contacts_staging AS c USING (row_number);
             """
         )
-        cursor.execute(query, (contact_id, ))
+
+        return len(contacts)
+
+    def iter_contacts_with_phone_numbers(self, batch_size=2000):
+        """
+        Yields every contact, with its phone numbers, in id order.
+        Rows are read through a server-side (named) cursor `batch_size`
+        at a time, so memory use does not grow with the table.
+        This is a generator: the transaction stays open until it is
+        exhausted or closed.
+        """
+        with self.connection:
+            with self.connection.cursor(name='contacts_export') as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(EXPORT_CONTACTS)
+
+                for contact_id, rows in groupby(cursor, key=itemgetter(0)):
+                    rows = list(rows)
+                    _, first_name, middle_names, last_name, email_address = rows[0][:5]
+                    yield {
+                        'id': contact_id,
+                        'first_name': first_name,
+                        'middle_names': middle_names,
+                        'last_name': last_name,
+                        'email_address': email_address,
+                        'phone_numbers': [
+                            {
+                                'id': row[5],
+                                'number_value': row[6],
+                                'number_type': row[7],
+                                'contact_id': contact_id,
+                            }
+                            for row in rows
+                            if row[5] is not None
+                        ],
+                    }
+
+    @db_transaction(DictCursor)
+    def get_phone_numbers(self, cursor, contact_id):
+        self._execute(cursor, SELECT_PHONE_NUMBERS, (contact_id, ))
         return [dict(row) for row in cursor.fetchall()]
@@ -0,0 +1,124 @@
+import csv
+import io
+import json
+
+from contacts.bulk_import import (
+    CONTACT_ATTRIBUTES, MAX_PHONE_NUMBERS, OTHER_PHONE_NUMBERS_COLUMN,
+    format_other_phone_numbers
+)
+
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'vcf': 'text/vcard',
+}
+
+EXPORT_FORMATS = tuple(EXPORT_MIMETYPES)
+
+# Exports are written out in chunks of roughly this many characters
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# CSV columns match what `flask contacts import` reads back. Numbers
+# past the form's three share the last column.
+CSV_COLUMNS = CONTACT_ATTRIBUTES + tuple(
+    column
+    for index in range(1, MAX_PHONE_NUMBERS + 1)
+    for column in (f'phone_number_{index}', f'phone_number_{index}_type')
+) + (OTHER_PHONE_NUMBERS_COLUMN, )
+
+VCARD_PHONE_TYPES = {
+    'personal': 'CELL',
+    'home': 'HOME',
+    'work': 'WORK',
+    'other': 'VOICE',
+}
+
+def csv_lines(contacts):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def take_line(row):
+        writer.writerow(row)
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    yield take_line(CSV_COLUMNS)
+    for contact in contacts:
+        row = [contact[attribute] for attribute in CONTACT_ATTRIBUTES]
+        phone_numbers = contact['phone_numbers']
+        for index in range(MAX_PHONE_NUMBERS):
+            if index < len(phone_numbers):
+                row.extend((phone_numbers[index]['number_value'],
+                            phone_numbers[index]['number_type']))
+            else:
+                row.extend((None, None))
+        row.append(format_other_phone_numbers(phone_numbers[MAX_PHONE_NUMBERS:]) or None)
+        yield take_line(row)
+
+def jsonl_lines(contacts):
+    for contact in contacts:
+        yield json.dumps({
+            attribute: contact[attribute] for attribute in CONTACT_ATTRIBUTES
+        } | {
+            'phone_numbers': [
+                {
+                    'number_value': phone_number['number_value'],
+                    'number_type': phone_number['number_type'],
+                }
+                for phone_number in contact['phone_numbers']
+            ]
+        }) + '\n'
+
+def _vcard_escape(value):
+    return (value.replace('\\', '\\\\').replace(',', '\\,')
+                 .replace(';', '\\;').replace('\n', '\\n'))
+
+def vcard_lines(contacts):
+    for contact in contacts:
+        first_name, middle_names, last_name = (
+            _vcard_escape(contact[attribute] or '')
+            for attribute in ('first_name', 'middle_names', 'last_name')
+        )
+        full_name = ' '.join(name for name in (first_name, middle_names, last_name) if name)
+
+        lines = [
+            'BEGIN:VCARD',
+            'VERSION:3.0',
+            f'N:{last_name};{first_name};{middle_names};;',
+            f'FN:{full_name}',
+        ]
+        if contact['email_address']:
+            lines.append(f'EMAIL;TYPE=INTERNET:{_vcard_escape(contact["email_address"])}')
+        for phone_number in contact['phone_numbers']:
+            phone_type = VCARD_PHONE_TYPES.get(phone_number['number_type'], 'VOICE')
+            lines.append(f'TEL;TYPE={phone_type}:{phone_number["number_value"]}')
+        lines.append('END:VCARD')
+
+        # vCard requires CRLF line endings
+        yield '\r\n'.join(lines) + '\r\n'
+
+EXPORT_WRITERS = {
+    'csv': csv_lines,
+    'jsonl': jsonl_lines,
+    'vcf': vcard_lines,
+}
+
+def export_chunks(contacts, export_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Formats a stream of contacts and groups the output into chunks,
+    so a streamed response is not written one tiny line at a time.
+    """
+    chunk = []
+    chunk_length = 0
+    for line in EXPORT_WRITERS[export_format](contacts):
+        chunk.append(line)
+        chunk_length += len(line)
+        if chunk_length >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+            chunk_length = 0
+
+    if chunk:
+        yield ''.join(chunk)
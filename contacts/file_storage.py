@@ -1,105 +1,481 @@
+import json
+import marshal
+import mmap
 import os
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+
 import yaml
-from uuid import uuid4
+from contacts.errors import DataHandlingError
+from contacts.memory_storage import ContactsMemoryStorage, ContactsMemoryStore
+
+try:
+    import fcntl
+except ImportError:
+    # No file locking on this platform: only run a single process
+    fcntl = None
 
 CONTACTS_DIR_STRUCTURE = ('contacts', 'data')
 CONTACTS_DIR_STRUCTURE_TEST =  ('tests', 'data')
 
 CONTACTS_FILE_NAME = 'contacts.yaml'
 
-class DataHandlingError(Exception):
-    def __init__(self, message):
-        super().__init__(message)
+JOURNAL_SUFFIX = '.journal'
+LOCK_SUFFIX = '.lock'
 
-class ContactsFileStorage:
-    def __init__(self, is_testing_environment=False):
-        root_dir = os.path.abspath(os.path.dirname(__name__))
-        if is_testing_environment:
-            self._file_path = os.path.join(root_dir,
-                                 *CONTACTS_DIR_STRUCTURE_TEST,
-                                 CONTACTS_FILE_NAME)
-        else:
-            self._file_path = os.path.join(root_dir,
-                                 *CONTACTS_DIR_STRUCTURE,
-                                 CONTACTS_FILE_NAME)
+# Journal entries after which the snapshot is rewritten
+COMPACT_AFTER_ENTRIES = 1000
+
+# libyaml's C loader and dumper are many times faster than the pure
+# Python ones; PyYAML only has them when it was built against libyaml
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+YamlDumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+# Loaders get the snapshot as a read-only mmap
+
+def load_yaml(buffer):
+    return yaml.load(buffer, Loader=YamlLoader)
+
+def dump_yaml(data, file):
+    yaml.dump(data, file, Dumper=YamlDumper)
+
+def load_marshal(buffer):
+    # marshal.load reads a file a few bytes at a time, while loads
+    # parses the mapped pages directly
+    data = marshal.loads(buffer)
+    for contact in data['contacts']:
+        if contact.get('updated_at'):
+            contact['updated_at'] = datetime.fromisoformat(contact['updated_at'])
+    return data
+
+def dump_marshal(data, file):
+    # marshal only takes core types. Its format may change between
+    # Python versions, which is fine for a snapshot the YAML can rebuild.
+    file.write(marshal.dumps(data | {
+        'contacts': [
+            contact | {'updated_at': contact['updated_at'] and contact['updated_at'].isoformat()}
+            for contact in data['contacts']
+        ]
+    }))
+
+SnapshotFormat = namedtuple('SnapshotFormat', ('suffix', 'binary', 'load', 'dump'))
+
+SNAPSHOT_FORMATS = {
+    'yaml': SnapshotFormat('.yaml', False, load_yaml, dump_yaml),
+    'marshal': SnapshotFormat('.marshal', True, load_marshal, dump_marshal),
+}
+
+def get_snapshot_path(file_path, snapshot_format):
+    return os.path.splitext(file_path)[0] + SNAPSHOT_FORMATS[snapshot_format].suffix
+
+def store_from_data(data, store=None):
+    """
+    Builds a store from the parsed snapshot, or refills `store` with it.
+    Older files are a plain list of contacts with uuid ids and a single
+    `phone_number`; those contacts get new integer ids.
+    """
+    if store is None:
+        store = ContactsMemoryStore()
+    store.reset()
+    if isinstance(data, list):
+        data = {'contacts': data}
+    data = data or {}
+
+    contacts = data.get('contacts') or []
+    used_ids = {contact['id'] for contact in contacts
+                if isinstance(contact.get('id'), int)}
+    # Ids of deleted contacts are not given out again, so they are
+    # kept in the snapshot rather than derived from the remaining ones
+    store.next_contact_id = max(max(used_ids, default=0) + 1,
+                                data.get('next_contact_id', 1))
+    # Files can mix both formats, so new phone number ids start past
+    # every explicit one
+    store.next_phone_number_id = max(
+        max(
+            (phone_number['id'] for contact in contacts
+             for phone_number in contact.get('phone_numbers') or ()
+             if isinstance(phone_number.get('id'), int)),
+            default=0
+        ) + 1,
+        data.get('next_phone_number_id', 1)
+    )
+
+    for contact in contacts:
+        contact_id = contact.get('id')
+        if not isinstance(contact_id, int):
+            contact_id = store.allocate_contact_id()
+
+        phone_numbers = contact.get('phone_numbers')
+        if phone_numbers is None:
+            phone_numbers = ([{'number_value': str(contact['phone_number']),
+                               'number_type': 'personal'}]
+                             if contact.get('phone_number') else [])
+
+        store.apply({
+            'op': 'create',
+            'contact': {
+                'id': contact_id,
+                'first_name': contact['first_name'],
+                'middle_names': contact.get('middle_names'),
+                'last_name': contact.get('last_name'),
+                'email_address': contact.get('email_address'),
+            },
+            'phone_numbers': [
+                {
+                    'id': phone_number.get('id') or store.allocate_phone_number_id(),
+                    'number_value': phone_number['number_value'],
+                    'number_type': phone_number['number_type'],
+                }
+                for phone_number in phone_numbers
+            ],
+            'updated_at': contact.get('updated_at'),
+        })
+        store.contacts[contact_id]['version'] = contact.get('version', 1)
+
+    store.list_version = data.get('list_version', store.list_version)
+    return store
+
+def store_to_data(store):
+    # Contacts go in list order, so reloading appends to the sort keys
+    # instead of inserting into the middle of them
+    return {
+        'list_version': store.list_version,
+        'next_contact_id': store.next_contact_id,
+        'next_phone_number_id': store.next_phone_number_id,
+        'contacts': [
+            store.contacts[contact_id] | {
+                'phone_numbers': [
+                    {key: phone_number[key]
+                     for key in ('id', 'number_value', 'number_type')}
+                    for phone_number in store.phone_numbers[contact_id]
+                ]
+            }
+            for _, contact_id in store.sort_keys
+        ],
+    }
+
+def encode_journal_header(generation):
+    return json.dumps({'op': 'journal', 'generation': generation}) + '\n'
+
+def encode_change(change):
+    return json.dumps(change, default=datetime.isoformat) + '\n'
+
+def decode_change(line):
+    change = json.loads(line)
+    if change.get('updated_at'):
+        change['updated_at'] = datetime.fromisoformat(change['updated_at'])
+    return change
+
+def get_file_identity(path):
+    try:
+        return stat_identity(os.stat(path))
+    except FileNotFoundError:
+        return None
+
+def stat_identity(stat):
+    # Replacing the file changes the inode; rewriting it in place
+    # changes the mtime or size
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+class ContactsFile:
+    """
+    A snapshot of the contacts plus an append-only journal of the changes
+    made since, held in a `ContactsMemoryStore`.
+
+    The files are read once per process, through mmap. Writers take an
+    exclusive lock on `<file>.lock`, replay whatever other processes
+    appended to the journal, then append their own changes. Once the
+    journal is long enough it is compacted into a new snapshot. Readers
+    call `refresh`, which only stats the files unless they changed.
+
+    The snapshot is YAML or marshal, see `SNAPSHOT_FORMATS`. A snapshot
+    found only in the other format is converted on load, and the old file
+    kept with a `.bak` suffix.
 
-    def _load_all_contacts(self):
+    Every compaction starts a new journal generation, recorded in the
+    snapshot and in the first line of the journal. A journal of another
+    generation than the snapshot is one a crashed compaction did not get
+    to empty: its changes are already in the snapshot, so it is dropped
+    instead of replayed.
+    """
+    def __init__(self, file_path, snapshot_format='yaml'):
+        if snapshot_format not in SNAPSHOT_FORMATS:
+            raise DataHandlingError(f'Unknown snapshot format: {snapshot_format}')
+        self.snapshot_format = snapshot_format
+        self.snapshot_path = get_snapshot_path(file_path, snapshot_format)
+        self.journal_path = file_path + JOURNAL_SUFFIX
+        self.lock_path = file_path + LOCK_SUFFIX
+        self.store = ContactsMemoryStore()
+        self.snapshot_identity = None
+        self.journal_generation = 0
+        self.journal_offset = 0
+        self.journal_entries = 0
+        self.pending = []
+
+        # Exclusive, in case the snapshot needs converting
+        with self.store.lock, self._file_lock():
+            self._load()
+
+    @contextmanager
+    def _file_lock(self, shared=False):
+        if fcntl is None:
+            yield
+            return
+
+        os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _find_snapshot(self):
+        if os.path.exists(self.snapshot_path):
+            return self.snapshot_format, self.snapshot_path
+        for snapshot_format in SNAPSHOT_FORMATS:
+            snapshot_path = get_snapshot_path(self.snapshot_path, snapshot_format)
+            if os.path.exists(snapshot_path):
+                return snapshot_format, snapshot_path
+        return self.snapshot_format, self.snapshot_path
+
+    def _load(self):
+        snapshot_format, snapshot_path = self._find_snapshot()
+        load = SNAPSHOT_FORMATS[snapshot_format].load
         try:
-            with open(self._file_path, 'r') as file:
-                contacts = yaml.safe_load(file)
-            return contacts if contacts else []
+            with open(snapshot_path, 'rb') as file:
+                stat = os.fstat(file.fileno())
+                self.snapshot_identity = stat_identity(stat)
+                data = None
+                # mmap can't map an empty file
+                if stat.st_size:
+                    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                        data = load(buffer)
+                store_from_data(data, self.store)
+                # Older snapshots and journals have no generation: 0
+                self.journal_generation = (data.get('journal_generation', 0)
+                                           if isinstance(data, dict) else 0)
         except FileNotFoundError:
-            raise DataHandlingError('File not found')
+            self.snapshot_identity = None
+            self.journal_generation = 0
+            self.store.reset()
+        except (yaml.YAMLError, EOFError, ValueError, TypeError, KeyError) as e:
+            raise DataHandlingError(f'Could not read contacts file: {e}')
 
-    def get_all_contacts(self):
-        contacts = self._load_all_contacts()
-        return contacts
+        self.journal_offset = 0
+        self.journal_entries = 0
+        self._replay_journal()
 
-    def _overwrite_contacts(self, contacts):
+        if snapshot_path != self.snapshot_path:
+            self.compact()
+            os.replace(snapshot_path, snapshot_path + '.bak')
+
+    def _replay_journal(self):
         try:
-            with open(self._file_path, 'w') as file:
-                yaml.dump(contacts, file)
+            with open(self.journal_path, 'rb') as journal:
+                if os.fstat(journal.fileno()).st_size <= self.journal_offset:
+                    return
+                with mmap.mmap(journal.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    is_current = self._replay_lines(data)
         except FileNotFoundError:
-            raise DataHandlingError('File not found')
-
-    def find_contact_by_id(self, contact_id):
-        contacts = self._load_all_contacts()
-        if not contacts:
-            return None
-        return next((contact for contact in contacts if contact['id'] == contact_id), None)
-
-    @staticmethod
-    def _contact_as_dict(first_name, middle_names, last_name,
-                       phone_number, email_address):
-        contact = {}
-        contact['first_name'] = first_name
-        contact['middle_names'] = middle_names
-        contact['last_name'] = last_name
-        contact['phone_number'] = phone_number
-        contact['email_address'] = email_address
-
-        return contact
-
-    def update_one_contact(self, contact_id, first_name, middle_names,
-                       last_name, phone_number, email_address):
-
-        updated_contact_data = ContactsFileStorage._contact_as_dict(
-            first_name, middle_names, last_name, phone_number, email_address
-        )
-
-        all_contacts = self._load_all_contacts()
-        for existing_contact in all_contacts:
-            if existing_contact['id'] == contact_id:
-                existing_contact.update(updated_contact_data)
-
-        self._overwrite_contacts(all_contacts)
-
-
-    def delete_one_contact(self, contact_id):
-        all_contacts = self._load_all_contacts()
-        all_contacts = [
-            contact for contact in all_contacts
-            if contact['id'] != contact_id
-        ]
-        self._overwrite_contacts(all_contacts)
+            return
 
-    def create_new_contact(self, first_name, middle_names, last_name,
-                       phone_number, email_address):
+        if not is_current:
+            # Finish the compaction that crashed (called under the file
+            # lock). Failing that, the next write empties the journal.
+            self.journal_offset = 0
+            try:
+                self._start_journal()
+            except OSError:
+                pass
 
-        new_contact = ContactsFileStorage._contact_as_dict(
-            first_name, middle_names, last_name, phone_number, email_address
-        )
-        new_contact['id'] = str(uuid4())
+    def _replay_lines(self, data):
+        """
+        Applies the complete lines past `journal_offset`. Returns False,
+        without applying anything, for a journal of an older generation.
+        """
+        # A line without its newline is a write that never finished
+        start = self.journal_offset
+        end = data.rfind(b'\n', start) + 1
+        try:
+            while start < end:
+                line_end = data.find(b'\n', start) + 1
+                change = decode_change(data[start:line_end])
+                if start == 0:
+                    generation = (change['generation'] if change['op'] == 'journal'
+                                  else 0)
+                    if generation != self.journal_generation:
+                        return False
+                if change['op'] != 'journal':
+                    self.store.apply(change)
+                    self.journal_entries += 1
+                start = line_end
+        except (ValueError, KeyError) as e:
+            raise DataHandlingError(f'Could not read contacts journal: {e}')
+        finally:
+            self.journal_offset = start
+        return True
 
-        all_contacts = self._load_all_contacts()
-        all_contacts.append(new_contact)
-        self._overwrite_contacts(all_contacts)
+    def _start_journal(self):
+        # An empty journal of the snapshot's generation
+        header = encode_journal_header(self.journal_generation)
+        with open(self.journal_path, 'w') as journal:
+            journal.write(header)
+            journal.flush()
+            os.fsync(journal.fileno())
+        self.journal_offset = len(header)
+        self.journal_entries = 0
 
-        return new_contact['id']
+    def _catch_up(self):
+        # Pick up what other processes wrote since we last looked.
+        # A compaction replaces the snapshot, which means a full reload.
+        journal_size = (get_file_identity(self.journal_path) or (0, 0, 0))[2]
+        if (get_file_identity(self.snapshot_path) != self.snapshot_identity
+                or journal_size < self.journal_offset):
+            self._load()
+        elif journal_size > self.journal_offset:
+            self._replay_journal()
 
-    def destroy_data(self):
-        if os.path.exists(self._file_path):
-            os.remove(self._file_path)
+    def _is_current(self):
+        journal_size = (get_file_identity(self.journal_path) or (0, 0, 0))[2]
+        return (get_file_identity(self.snapshot_path) == self.snapshot_identity
+                and journal_size == self.journal_offset)
+
+    def refresh(self):
+        """Catches up with changes made by other processes."""
+        # Two stats without any lock in the common case, where nothing changed
+        if self._is_current():
+            return
+        # Exclusive, in case the snapshot needs converting
+        with self.store.lock, self._file_lock():
+            self._catch_up()
+
+    @contextmanager
+    def writing(self):
+        with self.store.lock, self._file_lock():
+            self._catch_up()
+            try:
+                yield
+            finally:
+                # Changes are applied to the store as they are recorded,
+                # so whatever got recorded must reach the journal
+                self._flush()
+            if self.journal_entries >= COMPACT_AFTER_ENTRIES:
+                self.compact()
+
+    def record(self, change):
+        # Called inside `writing`
+        self.store.apply(change)
+        self.pending.append(change)
+
+    def _flush(self):
+        if not self.pending:
+            return
+
+        try:
+            with open(self.journal_path, 'a') as journal:
+                # Drop the unfinished line of a writer that crashed
+                journal.truncate(self.journal_offset)
+                if self.journal_offset == 0:
+                    journal.write(encode_journal_header(self.journal_generation))
+                journal.write(''.join(map(encode_change, self.pending)))
+                journal.flush()
+                os.fsync(journal.fileno())
+                self.journal_offset = journal.tell()
+        except OSError as e:
+            # The changes are already in the store, which no longer
+            # matches the files, so it goes back to what is on disk
+            self.pending.clear()
+            self._reload_after_failed_write()
+            raise DataHandlingError(f'Could not write contacts journal: {e}')
+
+        self.journal_entries += len(self.pending)
+        self.pending.clear()
+
+    def _reload_after_failed_write(self):
+        try:
+            self._load()
+        except (DataHandlingError, OSError):
+            # Forces a full reload on the next refresh instead
+            self.snapshot_identity = None
+
+    def compact(self):
+        """
+        Writes the whole store as the new snapshot and empties the journal.
+        Called inside `writing`.
+        """
+        self.pending.clear()
+        snapshot_format = SNAPSHOT_FORMATS[self.snapshot_format]
+        temp_path = self.snapshot_path + '.tmp'
+        generation = self.journal_generation + 1
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+            with open(temp_path, 'wb' if snapshot_format.binary else 'w') as file:
+                snapshot_format.dump(store_to_data(self.store)
+                                     | {'journal_generation': generation}, file)
+                file.flush()
+                os.fsync(file.fileno())
+            # From here on the old journal is outdated, even if the
+            # process dies before it is emptied
+            os.replace(temp_path, self.snapshot_path)
+            self.journal_generation = generation
+            self.snapshot_identity = get_file_identity(self.snapshot_path)
+            # Should the journal not get emptied, the next write does it
+            self.journal_offset = 0
+            self.journal_entries = 0
+            self._start_journal()
+        except OSError as e:
+            raise DataHandlingError(f'Could not write contacts file: {e}')
 
+# One ContactsFile per path and format, shared by every request of the process
+contacts_files = {}
+contacts_files_lock = threading.Lock()
 
+def get_contacts_file(file_path, snapshot_format='yaml'):
+    key = (file_path, snapshot_format)
+    with contacts_files_lock:
+        if key not in contacts_files:
+            contacts_files[key] = ContactsFile(file_path, snapshot_format)
+        return contacts_files[key]
 
+class ContactsFileStorage(ContactsMemoryStorage):
+    """
+    Storage backend that keeps contacts in a YAML or marshal file, see
+    `ContactsFile`. Reads are served from memory.
+    """
+    def __init__(self, is_testing_environment=False, file_path=None,
+                 snapshot_format='yaml'):
+        root_dir = os.path.abspath(os.path.dirname(__name__))
+        if file_path is not None:
+            self._file_path = file_path
+        elif is_testing_environment:
+            self._file_path = os.path.join(root_dir,
+                                 *CONTACTS_DIR_STRUCTURE_TEST,
+                                 CONTACTS_FILE_NAME)
+        else:
+            self._file_path = os.path.join(root_dir,
+                                 *CONTACTS_DIR_STRUCTURE,
+                                 CONTACTS_FILE_NAME)
+
+        self._file = get_contacts_file(self._file_path, snapshot_format)
+        self._file.refresh()
+        super().__init__(store=self._file.store)
+
+    def setup_schema(self):
+        with self._file.writing():
+            if not os.path.exists(self._file.snapshot_path):
+                self._file.compact()
+        return []
+
+    def _writing(self):
+        return self._file.writing()
+
+    def _write(self, change):
+        self._file.record(change)
+
+    def destroy_data(self):
+        with self._file.writing():
+            self._write({'op': 'destroy'})
+            self._file.compact()
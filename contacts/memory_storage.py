@@ -0,0 +1,390 @@
+import copy
+import re
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timezone
+
+from contacts.storage import ContactSummary, ContactsPage
+
+CONTACT_ATTRIBUTES = ('first_name', 'middle_names', 'last_name', 'email_address')
+
+def get_sort_name(contact):
+    # Same value as the `sort_name` column of the database backend
+    return ' '.join((contact['first_name'],
+                     contact['middle_names'] or '',
+                     contact['last_name'] or '')).lower()
+
+def get_display_name(contact):
+    # Same value as concat_ws(' ', ...) in the database backend
+    return ' '.join(
+        contact[attribute]
+        for attribute in ('first_name', 'middle_names', 'last_name')
+        if contact[attribute] is not None
+    )
+
+def first_list_version():
+    # A new store starts past any version an earlier store (in this or
+    # an earlier process) can have reached, so the ETags of the contact
+    # list are never reused for different contents
+    return time.time_ns()
+
+class ContactsMemoryStore:
+    """
+    Contacts and phone numbers held in Python dicts, plus a sorted
+    (sort_name, id) index for the contact list.
+
+    All changes go through `apply`, which takes a plain-data description
+    of the change (ids and timestamps already allocated). That keeps the
+    changes easy to replay, e.g. from a journal file.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.contacts = {}
+        self.phone_numbers = {}
+        self.sort_keys = []
+        self.next_contact_id = 1
+        self.next_phone_number_id = 1
+        self.list_version = first_list_version()
+
+    def allocate_contact_id(self):
+        contact_id = self.next_contact_id
+        self.next_contact_id += 1
+        return contact_id
+
+    def allocate_phone_number_id(self):
+        phone_number_id = self.next_phone_number_id
+        self.next_phone_number_id += 1
+        return phone_number_id
+
+    def reset(self):
+        self.contacts.clear()
+        self.phone_numbers.clear()
+        self.sort_keys.clear()
+        self.next_contact_id = 1
+        self.next_phone_number_id = 1
+        self.list_version = first_list_version()
+
+    def apply(self, change):
+        getattr(self, f'_apply_{change["op"]}')(change)
+        self.list_version += 1
+
+    def _add_phone_number(self, contact_id, phone_number, updated_at):
+        self.phone_numbers[contact_id].append({
+            'id': phone_number['id'],
+            'number_value': phone_number['number_value'],
+            'number_type': phone_number['number_type'],
+            'contact_id': contact_id,
+            'version': 1,
+            'updated_at': updated_at,
+        })
+        self.next_phone_number_id = max(self.next_phone_number_id,
+                                        phone_number['id'] + 1)
+
+    def _remove_sort_key(self, contact):
+        sort_key = (get_sort_name(contact), contact['id'])
+        del self.sort_keys[bisect_left(self.sort_keys, sort_key)]
+
+    def _apply_create(self, change):
+        contact = {attribute: change['contact'][attribute]
+                   for attribute in ('id', ) + CONTACT_ATTRIBUTES}
+        contact['version'] = 1
+        contact['updated_at'] = change['updated_at']
+
+        contact_id = contact['id']
+        self.contacts[contact_id] = contact
+        self.phone_numbers[contact_id] = []
+        for phone_number in change['phone_numbers']:
+            self._add_phone_number(contact_id, phone_number, change['updated_at'])
+
+        insort(self.sort_keys, (get_sort_name(contact), contact_id))
+        self.next_contact_id = max(self.next_contact_id, contact_id + 1)
+
+    def _apply_update(self, change):
+        contact_id = change['contact_id']
+        contact = self.contacts.get(contact_id)
+        if contact is None:
+            return
+
+        self._remove_sort_key(contact)
+        for attribute in CONTACT_ATTRIBUTES:
+            contact[attribute] = change['contact'][attribute]
+        contact['version'] += 1
+        contact['updated_at'] = change['updated_at']
+        insort(self.sort_keys, (get_sort_name(contact), contact_id))
+
+        updated = {phone_number['id']: phone_number for phone_number in change['updated']}
+        deleted = set(change['deleted'])
+        phone_numbers = []
+        for phone_number in self.phone_numbers[contact_id]:
+            if phone_number['id'] in deleted:
+                continue
+            if phone_number['id'] in updated:
+                phone_number['number_value'] = updated[phone_number['id']]['number_value']
+                phone_number['number_type'] = updated[phone_number['id']]['number_type']
+                phone_number['version'] += 1
+                phone_number['updated_at'] = change['updated_at']
+            phone_numbers.append(phone_number)
+        self.phone_numbers[contact_id] = phone_numbers
+
+        for phone_number in change['added']:
+            self._add_phone_number(contact_id, phone_number, change['updated_at'])
+
+    def _apply_delete(self, change):
+        contact = self.contacts.pop(change['contact_id'], None)
+        if contact is not None:
+            self._remove_sort_key(contact)
+            del self.phone_numbers[contact['id']]
+
+    def _apply_destroy(self, change):
+        self.contacts.clear()
+        self.phone_numbers.clear()
+        self.sort_keys.clear()
+
+# One store per environment, shared by every request of the process
+memory_stores = {}
+memory_stores_lock = threading.Lock()
+
+def get_memory_store(is_testing_environment):
+    with memory_stores_lock:
+        if is_testing_environment not in memory_stores:
+            memory_stores[is_testing_environment] = ContactsMemoryStore()
+        return memory_stores[is_testing_environment]
+
+class ContactsMemoryStorage:
+    """
+    Storage backend that keeps everything in process memory.
+    Nothing survives a restart; meant for development and load tests.
+    """
+    def __init__(self, is_testing_environment=False, store=None):
+        self._store = store if store is not None else get_memory_store(is_testing_environment)
+
+    def setup_schema(self):
+        return []
+
+    def close_connection(self):
+        pass
+
+    def _writing(self):
+        # Held while ids are allocated and the change is written
+        return self._store.lock
+
+    def _write(self, change):
+        # Called inside `_writing`
+        self._store.apply(change)
+
+    @staticmethod
+    def _now():
+        return datetime.now(timezone.utc)
+
+    def _contact_dict(self, contact_id):
+        contact = self._store.contacts[contact_id]
+        return {attribute: contact[attribute]
+                for attribute in ('id', ) + CONTACT_ATTRIBUTES}
+
+    def get_all_contacts(self):
+        with self._store.lock:
+            return [self._contact_dict(contact_id) for contact_id in self._store.contacts]
+
+    def _summary(self, contact_id):
+        return ContactSummary(contact_id, get_display_name(self._store.contacts[contact_id]))
+
+    def get_contacts_page(self, after=None, before=None, limit=50):
+        with self._store.lock:
+            sort_keys = self._store.sort_keys
+            anchor_id = after if after is not None else before
+            if anchor_id is not None:
+                anchor = self._store.contacts.get(anchor_id)
+                if anchor is None:
+                    return ContactsPage([], None, None)
+                anchor_key = (get_sort_name(anchor), anchor_id)
+
+            if after is not None:
+                start = bisect_right(sort_keys, anchor_key)
+                keys = sort_keys[start:start + limit + 1]
+            elif before is not None:
+                end = bisect_left(sort_keys, anchor_key)
+                keys = sort_keys[max(end - limit - 1, 0):end]
+            else:
+                keys = sort_keys[:limit + 1]
+
+            has_more = len(keys) > limit
+            if before is not None:
+                keys = keys[-limit:] if has_more else keys
+            else:
+                keys = keys[:limit]
+            contacts = [self._summary(contact_id) for _, contact_id in keys]
+
+        if before is not None:
+            previous_cursor = contacts[0].id if has_more else None
+            next_cursor = contacts[-1].id if contacts else None
+        else:
+            previous_cursor = (contacts[0].id
+                               if after is not None and contacts else None)
+            next_cursor = contacts[-1].id if has_more else None
+
+        return ContactsPage(contacts, previous_cursor, next_cursor)
+
+    def search_contacts(self, search_text, limit=20):
+        # Same matching rules as the database backend, by linear scan
+        words = re.findall(r'\w+', search_text.lower())
+        digits = re.sub(r'\D', '', search_text)
+        email_prefix = search_text.strip().lower()
+        if ' ' in email_prefix:
+            email_prefix = ''
+
+        matches = []
+        with self._store.lock:
+            for sort_name, contact_id in self._store.sort_keys:
+                contact = self._store.contacts[contact_id]
+                rank = 0
+                if words:
+                    name_words = re.findall(r'\w+', sort_name)
+                    if all(any(name_word.startswith(word) for name_word in name_words)
+                           for word in words):
+                        rank += 1
+                if email_prefix and (contact['email_address'] or '').lower().startswith(email_prefix):
+                    rank += 1
+                if digits:
+                    rank += sum(phone_number['number_value'].startswith(digits)
+                                for phone_number in self._store.phone_numbers[contact_id])
+                if rank:
+                    matches.append((-rank, sort_name, contact_id))
+
+            matches.sort()
+            return [self._summary(contact_id) for _, _, contact_id in matches[:limit]]
+
+    def find_contact_by_id(self, contact_id):
+        with self._store.lock:
+            if contact_id not in self._store.contacts:
+                return None
+            return self._contact_dict(contact_id)
+
+    def find_contact_with_phone_numbers(self, contact_id):
+        with self._store.lock:
+            contact = self._store.contacts.get(contact_id)
+            if contact is None:
+                return None
+            contact = copy.deepcopy(contact)
+            contact['phone_numbers'] = self.get_phone_numbers(contact_id)
+            return contact
+
+    def get_phone_numbers(self, contact_id):
+        with self._store.lock:
+            return [
+                {key: phone_number[key]
+                 for key in ('id', 'number_value', 'number_type', 'contact_id')}
+                for phone_number in self._store.phone_numbers.get(contact_id, [])
+            ]
+
+    def _create_change(self, contact, phone_numbers):
+        return {
+            'op': 'create',
+            'contact': {'id': self._store.allocate_contact_id()} | {
+                attribute: contact.get(attribute) for attribute in CONTACT_ATTRIBUTES
+            },
+            'phone_numbers': [
+                {
+                    'id': self._store.allocate_phone_number_id(),
+                    'number_value': phone_number['number_value'],
+                    'number_type': phone_number['number_type'],
+                }
+                for phone_number in phone_numbers or []
+                if phone_number['number_value'] and phone_number['number_value'].strip()
+            ],
+            'updated_at': self._now(),
+        }
+
+    def create_new_contact(self, first_name, middle_names=None, last_name=None,
+                           email_address=None, phone_numbers=None):
+        contact = {
+            'first_name': first_name,
+            'middle_names': middle_names,
+            'last_name': last_name,
+            'email_address': email_address,
+        }
+        with self._writing():
+            change = self._create_change(contact, phone_numbers)
+            self._write(change)
+        return change['contact']['id']
+
+    def update_one_contact(self, contact_id, first_name, middle_names,
+                           last_name, email_address, phone_numbers):
+        with self._writing():
+            if contact_id not in self._store.contacts:
+                return
+
+            existing_ids = {phone_number['id']
+                            for phone_number in self._store.phone_numbers[contact_id]}
+            change = {
+                'op': 'update',
+                'contact_id': contact_id,
+                'contact': {
+                    'first_name': first_name,
+                    'middle_names': middle_names,
+                    'last_name': last_name,
+                    'email_address': email_address,
+                },
+                'updated': [],
+                'deleted': [],
+                'added': [],
+                'updated_at': self._now(),
+            }
+            for phone_number in phone_numbers:
+                if phone_number['id']:
+                    number_id = int(phone_number['id'])
+                    # Like the database backend, ignore ids of
+                    # phone numbers that belong to other contacts
+                    if number_id not in existing_ids:
+                        continue
+                    if phone_number['number_value']:
+                        change['updated'].append({
+                            'id': number_id,
+                            'number_value': phone_number['number_value'],
+                            'number_type': phone_number['number_type'],
+                        })
+                    else:
+                        change['deleted'].append(number_id)
+                elif phone_number['number_value']:
+                    change['added'].append({
+                        'id': self._store.allocate_phone_number_id(),
+                        'number_value': phone_number['number_value'],
+                        'number_type': phone_number['number_type'],
+                    })
+
+            self._write(change)
+
+    def delete_one_contact(self, contact_id):
+        with self._writing():
+            self._write({'op': 'delete', 'contact_id': contact_id})
+
+    def destroy_data(self):
+        with self._writing():
+            self._write({'op': 'destroy'})
+
+    def bulk_import_contacts(self, contacts):
+        with self._writing():
+            for contact in contacts:
+                self._write(self._create_change(contact, contact.get('phone_numbers')))
+        return len(contacts)
+
+    def iter_contacts_with_phone_numbers(self, batch_size=2000):
+        # Contacts are copied batch by batch, so the lock is not held
+        # while the caller consumes them
+        with self._store.lock:
+            contact_ids = sorted(self._store.contacts)
+
+        for start in range(0, len(contact_ids), batch_size):
+            with self._store.lock:
+                batch = [self.find_contact_with_phone_numbers(contact_id)
+                         for contact_id in contact_ids[start:start + batch_size]]
+
+            for contact in batch:
+                # Contacts deleted since the export started are skipped
+                if contact is None:
+                    continue
+                del contact['version'], contact['updated_at']
+                yield contact
+
+    def get_list_version(self):
+        return self._store.list_version
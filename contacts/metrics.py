@@ -0,0 +1,165 @@
+import threading
+import weakref
+from bisect import bisect_left
+
+# Prometheus' default latency buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def escape_label_value(value):
+    return (str(value).replace('\\', '\\\\')
+            .replace('"', '\\"').replace('\n', '\\n'))
+
+def format_labels(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label_value(value)}"'
+                          for name, value in pairs) + '}'
+
+class ThreadShards:
+    """
+    Values of one metric, kept per thread. A thread only ever writes to
+    its own shard, so recording a value takes no lock; the lock is only
+    taken when a thread records its first value, and when collecting.
+
+    Servers that start a thread per request would leave one shard per
+    request behind, so the shards of finished threads are folded into a
+    single retired total.
+    """
+    def __init__(self, new_values, merge_values):
+        self._new_values = new_values
+        # merge_values(into, values) adds `values` to `into`
+        self._merge_values = merge_values
+        self._local = threading.local()
+        # (weak reference to the thread, shard) of the live threads
+        self._shards = []
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def values(self, label_values):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._retire_finished()
+                self._shards.append((weakref.ref(threading.current_thread()), shard))
+
+        values = shard.get(label_values)
+        if values is None:
+            values = shard[label_values] = self._new_values()
+        return values
+
+    def _retire_finished(self):
+        live_shards = []
+        for thread_ref, shard in self._shards:
+            thread = thread_ref()
+            if thread is not None and thread.is_alive():
+                live_shards.append((thread_ref, shard))
+                continue
+            for label_values, values in shard.items():
+                if label_values not in self._retired:
+                    self._retired[label_values] = self._new_values()
+                self._merge_values(self._retired[label_values], values)
+        self._shards = live_shards
+
+    def collect(self):
+        """Returns (label values, [values of every thread]) pairs."""
+        collected = {}
+        with self._lock:
+            self._retire_finished()
+            for label_values, values in self._retired.items():
+                # A copy, since later retirements add to the total
+                copy = self._new_values()
+                self._merge_values(copy, values)
+                collected[label_values] = [copy]
+            shards = [shard for _, shard in self._shards]
+
+        for shard in shards:
+            # Copied in one step, while the owning thread may be adding keys
+            for label_values, values in list(shard.items()):
+                collected.setdefault(label_values, []).append(values)
+        return sorted(collected.items())
+
+class Counter:
+    def __init__(self, name, help, label_names=()):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self._shards = ThreadShards(lambda: [0], self._merge_values)
+
+    @staticmethod
+    def _merge_values(into, values):
+        into[0] += values[0]
+
+    def inc(self, *label_values, amount=1):
+        self._shards.values(label_values)[0] += amount
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        for label_values, shard_values in self._shards.collect():
+            total = sum(values[0] for values in shard_values)
+            yield f'{self.name}{format_labels(self.label_names, label_values)} {total}'
+
+class Histogram:
+    def __init__(self, name, help, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+        # Per label values: observations per bucket (the last one is
+        # +Inf), then their sum
+        self._shards = ThreadShards(lambda: [[0] * (len(self.buckets) + 1), 0.0],
+                                    self._merge_values)
+
+    @staticmethod
+    def _merge_values(into, values):
+        for index, count in enumerate(values[0]):
+            into[0][index] += count
+        into[1] += values[1]
+
+    def observe(self, value, *label_values):
+        values = self._shards.values(label_values)
+        values[0][bisect_left(self.buckets, value)] += 1
+        values[1] += value
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        for label_values, shard_values in self._shards.collect():
+            counts = [sum(column) for column in zip(*(values[0] for values in shard_values))]
+            total = sum(values[1] for values in shard_values)
+
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf', ), counts):
+                cumulative += count
+                labels = format_labels(self.label_names, label_values, [('le', bound)])
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = format_labels(self.label_names, label_values)
+            yield f'{self.name}_sum{labels} {total}'
+            yield f'{self.name}_count{labels} {cumulative}'
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, label_names=()):
+        return self._register(Counter(name, help, label_names))
+
+    def histogram(self, name, help, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, label_names, buckets))
+
+    def render(self):
+        """All metrics, in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics)
+        return [line for metric in metrics for line in metric.render()]
+
+# Metrics of the whole process, served by /metrics
+registry = MetricsRegistry()
@@ -0,0 +1,68 @@
+import os
+import re
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), 'data', 'migrations')
+
+# Migration files are named like `0001_initial_schema.sql`
+MIGRATION_FILE_PATTERN = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+# Arbitrary key for the advisory lock that stops two processes
+# from applying the same migration at the same time
+MIGRATIONS_LOCK_KEY = 7311
+
+def load_migrations(migrations_dir=MIGRATIONS_DIR):
+    migrations = []
+    for file_name in os.listdir(migrations_dir):
+        match = MIGRATION_FILE_PATTERN.match(file_name)
+        if not match:
+            continue
+
+        with open(os.path.join(migrations_dir, file_name), 'r') as file:
+            sql = file.read()
+        migrations.append((int(match.group(1)), match.group(2), sql))
+
+    return sorted(migrations)
+
+def apply_migrations(connection, migrations_dir=MIGRATIONS_DIR):
+    """
+    Apply every migration that has not been recorded in
+    `schema_migrations` yet. Each migration runs in its own transaction.
+    Returns the list of versions that were applied.
+    """
+    applied_now = []
+
+    with connection:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+                """
+            )
+
+    for version, name, sql in load_migrations(migrations_dir):
+        with connection:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)',
+                               (MIGRATIONS_LOCK_KEY, ))
+                cursor.execute(
+                    'SELECT 1 FROM schema_migrations WHERE version = %s',
+                    (version, )
+                )
+                if cursor.rowcount > 0:
+                    continue
+
+                cursor.execute(sql)
+                cursor.execute(
+                    """
+                    INSERT INTO schema_migrations (version, name)
+                    VALUES (%s, %s)
+                    """,
+                    (version, name)
+                )
+                applied_now.append(version)
+
+    return applied_now
@@ -0,0 +1,86 @@
+import contextvars
+import threading
+import time
+from collections import namedtuple
+
+# One executed query of a profiled request
+QueryRecord = namedtuple('QueryRecord', ('statement', 'duration', 'rowcount', 'route'))
+
+class RequestProfile:
+    """
+    The queries run while handling one request. Storage methods add to
+    the profile of the current context, if there is one.
+    """
+    def __init__(self, route):
+        self.route = route
+        self.queries = []
+        self.transactions = 0
+        # Requests are handled by one thread, but streamed responses
+        # may record from another one
+        self._lock = threading.Lock()
+
+    def record(self, statement, duration, rowcount):
+        with self._lock:
+            self.queries.append(QueryRecord(statement, duration, rowcount, self.route))
+
+    def record_transaction(self):
+        with self._lock:
+            self.transactions += 1
+
+    @property
+    def total_duration(self):
+        return sum(query.duration for query in self.queries)
+
+    def slow_queries(self, threshold):
+        return [query for query in self.queries if query.duration >= threshold]
+
+    def summary(self):
+        """One line per request, for the log."""
+        by_statement = {}
+        for query in self.queries:
+            count, duration = by_statement.get(query.statement, (0, 0.0))
+            by_statement[query.statement] = (count + 1, duration + query.duration)
+
+        statements = ', '.join(
+            f'{statement} x{count} {duration * 1000:.1f}ms'
+            for statement, (count, duration)
+            in sorted(by_statement.items(), key=lambda item: -item[1][1])
+        )
+        return (f'{self.route}: {len(self.queries)} queries in {self.transactions} '
+                f'transactions, {self.total_duration * 1000:.1f}ms'
+                + (f' ({statements})' if statements else ''))
+
+current_profile = contextvars.ContextVar('current_profile', default=None)
+
+def start_profile(route):
+    profile = RequestProfile(route)
+    current_profile.set(profile)
+    return profile
+
+def stop_profile():
+    current_profile.set(None)
+
+class ProfiledCursor:
+    """
+    Wraps a DB-API cursor and records every `execute` in `profile`.
+    `statement_name(query)` gives the name queries are recorded under.
+    """
+    def __init__(self, cursor, profile, statement_name):
+        self._cursor = cursor
+        self._profile = profile
+        self._statement_name = statement_name
+
+    def execute(self, query, params=None):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(query, params)
+        finally:
+            self._profile.record(self._statement_name(query),
+                                 time.perf_counter() - start,
+                                 self._cursor.rowcount)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
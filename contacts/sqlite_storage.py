@@ -0,0 +1,446 @@
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from itertools import groupby
+
+from contacts.errors import DataHandlingError
+from contacts.storage import ContactSummary, ContactsPage
+
+CONTACTS_DIR_STRUCTURE = ('contacts', 'data')
+CONTACTS_DIR_STRUCTURE_TEST = ('tests', 'data')
+
+CONTACTS_DB_FILE_NAME = 'contacts.sqlite3'
+
+SCHEMA = r"""
+-- AUTOINCREMENT: like SERIAL, ids of deleted rows are never given out
+-- again, as ETags, cache keys and page cursors are built from them
+CREATE TABLE IF NOT EXISTS contacts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    first_name TEXT NOT NULL,
+    middle_names TEXT,
+    last_name TEXT,
+    email_address TEXT CHECK(instr(email_address, '@') > 0),
+    version INTEGER NOT NULL DEFAULT 1,
+    updated_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+    sort_name TEXT GENERATED ALWAYS AS (
+        lower(first_name || ' ' || coalesce(middle_names, '') || ' ' || coalesce(last_name, ''))
+    ) STORED
+);
+
+CREATE INDEX IF NOT EXISTS contacts_sort_name_id_idx ON contacts (sort_name, id);
+CREATE INDEX IF NOT EXISTS contacts_email_address_idx ON contacts (lower(email_address));
+
+CREATE TABLE IF NOT EXISTS phone_numbers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    number_value TEXT NOT NULL CHECK(length(number_value) >= 6 AND number_value NOT GLOB '*[^0-9]*'),
+    number_type TEXT NOT NULL CHECK(number_type IN ('personal', 'home', 'work', 'other')),
+    contact_id INTEGER NOT NULL REFERENCES contacts(id) ON DELETE CASCADE,
+    version INTEGER NOT NULL DEFAULT 1,
+    updated_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+);
+
+CREATE INDEX IF NOT EXISTS phone_numbers_contact_id_idx ON phone_numbers (contact_id, id);
+CREATE INDEX IF NOT EXISTS phone_numbers_number_value_idx ON phone_numbers (number_value);
+
+CREATE TABLE IF NOT EXISTS contacts_list_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO contacts_list_version (id, version) VALUES (1, 1);
+
+-- Full-text index over the names, kept in sync by triggers
+CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts
+    USING fts5(sort_name, content='contacts', content_rowid='id');
+
+CREATE TRIGGER IF NOT EXISTS contacts_fts_insert AFTER INSERT ON contacts BEGIN
+    INSERT INTO contacts_fts (rowid, sort_name) VALUES (new.id, new.sort_name);
+END;
+CREATE TRIGGER IF NOT EXISTS contacts_fts_delete AFTER DELETE ON contacts BEGIN
+    INSERT INTO contacts_fts (contacts_fts, rowid, sort_name) VALUES ('delete', old.id, old.sort_name);
+END;
+CREATE TRIGGER IF NOT EXISTS contacts_fts_update AFTER UPDATE ON contacts BEGIN
+    INSERT INTO contacts_fts (contacts_fts, rowid, sort_name) VALUES ('delete', old.id, old.sort_name);
+    INSERT INTO contacts_fts (rowid, sort_name) VALUES (new.id, new.sort_name);
+END;
+"""
+
+# All statements are constants, so sqlite3's per-connection statement
+# cache prepares each of them only once per connection
+DISPLAY_NAME = ("first_name || coalesce(' ' || middle_names, '')"
+                " || coalesce(' ' || last_name, '')")
+
+# Upper bound for prefix ranges; as a prefix it matches nothing
+PREFIX_END = chr(0x10FFFF)
+
+SELECT_CONTACT = """
+    SELECT id, first_name, middle_names, last_name, email_address
+    FROM contacts
+    WHERE id = ?
+"""
+
+SELECT_CONTACT_WITH_PHONE_NUMBERS = """
+    SELECT
+        c.id, c.first_name, c.middle_names, c.last_name, c.email_address,
+        c.version, c.updated_at,
+        p.id, p.number_value, p.number_type
+    FROM contacts AS c
+    LEFT JOIN phone_numbers AS p ON p.contact_id = c.id
+    WHERE c.id = ?
+    ORDER BY p.id
+"""
+
+SELECT_PHONE_NUMBERS = """
+    SELECT id, number_value, number_type, contact_id
+    FROM phone_numbers
+    WHERE contact_id = ?
+    ORDER BY id
+"""
+
+SELECT_ALL_CONTACTS = """
+    SELECT id, first_name, middle_names, last_name, email_address
+    FROM contacts
+"""
+
+SELECT_FIRST_PAGE = f"""
+    SELECT id, {DISPLAY_NAME}
+    FROM contacts
+    ORDER BY sort_name, id
+    LIMIT ?
+"""
+
+SELECT_PAGE_AFTER = f"""
+    SELECT id, {DISPLAY_NAME}
+    FROM contacts
+    WHERE (sort_name, id) > (SELECT sort_name, id FROM contacts WHERE id = ?)
+    ORDER BY sort_name, id
+    LIMIT ?
+"""
+
+SELECT_PAGE_BEFORE = f"""
+    SELECT id, {DISPLAY_NAME}
+    FROM contacts
+    WHERE (sort_name, id) < (SELECT sort_name, id FROM contacts WHERE id = ?)
+    ORDER BY sort_name DESC, id DESC
+    LIMIT ?
+"""
+
+SEARCH_CONTACTS = f"""
+    WITH matches AS (
+        SELECT rowid AS contact_id, 1 AS rank
+        FROM contacts_fts
+        WHERE :name_query IS NOT NULL AND contacts_fts MATCH :name_query
+        UNION ALL
+        SELECT id, 1
+        FROM contacts
+        WHERE lower(email_address) >= :email_prefix
+          AND lower(email_address) < :email_prefix || :prefix_end
+        UNION ALL
+        SELECT contact_id, 1
+        FROM phone_numbers
+        WHERE number_value >= :phone_prefix
+          AND number_value < :phone_prefix || :prefix_end
+    )
+    SELECT c.id, {DISPLAY_NAME}
+    FROM (
+        SELECT contact_id, sum(rank) AS rank
+        FROM matches
+        GROUP BY contact_id
+    ) AS m
+    JOIN contacts AS c ON c.id = m.contact_id
+    ORDER BY m.rank DESC, c.sort_name, c.id
+    LIMIT :limit
+"""
+
+INSERT_CONTACT = """
+    INSERT INTO contacts (first_name, middle_names, last_name, email_address)
+    VALUES (?, ?, ?, ?)
+"""
+
+UPDATE_CONTACT = """
+    UPDATE contacts
+    SET first_name = ?,
+        middle_names = ?,
+        last_name = ?,
+        email_address = ?,
+        version = version + 1,
+        updated_at = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')
+    WHERE id = ?
+"""
+
+DELETE_CONTACT = 'DELETE FROM contacts WHERE id = ?'
+
+INSERT_PHONE_NUMBER = """
+    INSERT INTO phone_numbers (number_value, number_type, contact_id)
+    VALUES (?, ?, ?)
+"""
+
+UPDATE_PHONE_NUMBER = """
+    UPDATE phone_numbers
+    SET number_value = ?,
+        number_type = ?,
+        version = version + 1,
+        updated_at = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')
+    WHERE id = ? AND contact_id = ?
+"""
+
+DELETE_PHONE_NUMBER = 'DELETE FROM phone_numbers WHERE id = ? AND contact_id = ?'
+
+BUMP_LIST_VERSION = 'UPDATE contacts_list_version SET version = version + 1'
+
+SELECT_LIST_VERSION = 'SELECT version FROM contacts_list_version'
+
+EXPORT_CONTACTS = """
+    SELECT
+        c.id, c.first_name, c.middle_names, c.last_name, c.email_address,
+        p.id, p.number_value, p.number_type
+    FROM (
+        SELECT * FROM contacts WHERE id > ? ORDER BY id LIMIT ?
+    ) AS c
+    LEFT JOIN phone_numbers AS p ON p.contact_id = c.id
+    ORDER BY c.id, p.id
+"""
+
+# Connections are kept per thread and reused across requests, so that
+# their statement caches stay warm
+thread_connections = threading.local()
+
+def get_thread_connection(file_path):
+    connections = getattr(thread_connections, 'by_path', None)
+    if connections is None:
+        connections = thread_connections.by_path = {}
+
+    connection = connections.get(file_path)
+    if connection is None:
+        connection = sqlite3.connect(file_path, timeout=10, cached_statements=256)
+        connection.execute('PRAGMA foreign_keys = ON')
+        # WAL lets readers run concurrently with the single writer;
+        # NORMAL sync is safe in WAL mode and avoids an fsync per commit
+        connection.execute('PRAGMA journal_mode = WAL')
+        connection.execute('PRAGMA synchronous = NORMAL')
+        connections[file_path] = connection
+    return connection
+
+def parse_timestamp(value):
+    return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%fZ').replace(tzinfo=timezone.utc)
+
+class ContactsSQLiteStorage:
+    """
+    Storage backend on an embedded SQLite database, for deployments
+    without a Postgres server.
+    """
+    def __init__(self, is_testing_environment=False, file_path=None):
+        root_dir = os.path.abspath(os.path.dirname(__name__))
+        if file_path is not None:
+            self._file_path = file_path
+        elif is_testing_environment:
+            self._file_path = os.path.join(root_dir, *CONTACTS_DIR_STRUCTURE_TEST,
+                                           CONTACTS_DB_FILE_NAME)
+        else:
+            self._file_path = os.path.join(root_dir, *CONTACTS_DIR_STRUCTURE,
+                                           CONTACTS_DB_FILE_NAME)
+
+        try:
+            self.connection = get_thread_connection(self._file_path)
+        except sqlite3.Error as e:
+            raise DataHandlingError(f'Could not open contacts database: {e}')
+
+    def setup_schema(self):
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+        return []
+
+    def close_connection(self):
+        # The connection stays open for the next request of this thread;
+        # just make sure nothing is left uncommitted
+        if self.connection.in_transaction:
+            self.connection.rollback()
+
+    def get_all_contacts(self):
+        cursor = self.connection.execute(SELECT_ALL_CONTACTS)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def get_contacts_page(self, after=None, before=None, limit=50):
+        if after is not None:
+            rows = self.connection.execute(SELECT_PAGE_AFTER, (after, limit + 1))
+        elif before is not None:
+            rows = self.connection.execute(SELECT_PAGE_BEFORE, (before, limit + 1))
+        else:
+            rows = self.connection.execute(SELECT_FIRST_PAGE, (limit + 1, ))
+        contacts = list(map(ContactSummary._make, rows))
+
+        has_more = len(contacts) > limit
+        contacts = contacts[:limit]
+
+        if before is not None:
+            contacts.reverse()
+            previous_cursor = contacts[0].id if has_more else None
+            next_cursor = contacts[-1].id if contacts else None
+        else:
+            previous_cursor = (contacts[0].id
+                               if after is not None and contacts else None)
+            next_cursor = contacts[-1].id if has_more else None
+
+        return ContactsPage(contacts, previous_cursor, next_cursor)
+
+    def search_contacts(self, search_text, limit=20):
+        words = re.findall(r'\w+', search_text.lower())
+        digits = re.sub(r'\D', '', search_text)
+        email_prefix = search_text.strip().lower()
+        if ' ' in email_prefix:
+            email_prefix = ''
+
+        if not (words or digits or email_prefix):
+            return []
+
+        params = {
+            'name_query': ' '.join(f'"{word}"*' for word in words) or None,
+            'email_prefix': email_prefix or PREFIX_END,
+            'phone_prefix': digits or PREFIX_END,
+            'prefix_end': PREFIX_END,
+            'limit': limit,
+        }
+        rows = self.connection.execute(SEARCH_CONTACTS, params)
+        return list(map(ContactSummary._make, rows))
+
+    def find_contact_by_id(self, contact_id):
+        cursor = self.connection.execute(SELECT_CONTACT, (contact_id, ))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        columns = [column[0] for column in cursor.description]
+        return dict(zip(columns, row))
+
+    def find_contact_with_phone_numbers(self, contact_id):
+        rows = self.connection.execute(SELECT_CONTACT_WITH_PHONE_NUMBERS,
+                                       (contact_id, )).fetchall()
+        if not rows:
+            return None
+
+        (contact_id, first_name, middle_names, last_name,
+         email_address, version, updated_at) = rows[0][:7]
+        return {
+            'id': contact_id,
+            'first_name': first_name,
+            'middle_names': middle_names,
+            'last_name': last_name,
+            'email_address': email_address,
+            'version': version,
+            'updated_at': parse_timestamp(updated_at),
+            'phone_numbers': [
+                {
+                    'id': row[7],
+                    'number_value': row[8],
+                    'number_type': row[9],
+                    'contact_id': contact_id,
+                }
+                for row in rows
+                if row[7] is not None
+            ],
+        }
+
+    def get_phone_numbers(self, contact_id):
+        return [
+            {'id': id, 'number_value': number_value,
+             'number_type': number_type, 'contact_id': contact_id}
+            for id, number_value, number_type, contact_id
+            in self.connection.execute(SELECT_PHONE_NUMBERS, (contact_id, ))
+        ]
+
+    def _insert_contact(self, first_name, middle_names, last_name,
+                        email_address, phone_numbers):
+        cursor = self.connection.execute(
+            INSERT_CONTACT, (first_name, middle_names, last_name, email_address)
+        )
+        contact_id = cursor.lastrowid
+        self.connection.executemany(INSERT_PHONE_NUMBER, [
+            (phone_number['number_value'], phone_number['number_type'], contact_id)
+            for phone_number in phone_numbers or []
+            if phone_number['number_value'] and phone_number['number_value'].strip()
+        ])
+        return contact_id
+
+    def create_new_contact(self, first_name, middle_names=None, last_name=None,
+                           email_address=None, phone_numbers=None):
+        with self.connection:
+            contact_id = self._insert_contact(first_name, middle_names, last_name,
+                                              email_address, phone_numbers)
+            self.connection.execute(BUMP_LIST_VERSION)
+        return contact_id
+
+    def update_one_contact(self, contact_id, first_name, middle_names,
+                           last_name, email_address, phone_numbers):
+        updated_numbers = []
+        deleted_numbers = []
+        added_numbers = []
+        for phone_number in phone_numbers:
+            if phone_number['id']:
+                if phone_number['number_value']:
+                    updated_numbers.append((phone_number['number_value'],
+                                            phone_number['number_type'],
+                                            int(phone_number['id']), contact_id))
+                else:
+                    deleted_numbers.append((int(phone_number['id']), contact_id))
+            elif phone_number['number_value']:
+                added_numbers.append((phone_number['number_value'],
+                                      phone_number['number_type'], contact_id))
+
+        with self.connection:
+            self.connection.execute(UPDATE_CONTACT, (first_name, middle_names, last_name,
+                                                     email_address, contact_id))
+            self.connection.executemany(UPDATE_PHONE_NUMBER, updated_numbers)
+            self.connection.executemany(DELETE_PHONE_NUMBER, deleted_numbers)
+            self.connection.executemany(INSERT_PHONE_NUMBER, added_numbers)
+            self.connection.execute(BUMP_LIST_VERSION)
+
+    def delete_one_contact(self, contact_id):
+        with self.connection:
+            self.connection.execute(DELETE_CONTACT, (contact_id, ))
+            self.connection.execute(BUMP_LIST_VERSION)
+
+    def destroy_data(self):
+        with self.connection:
+            self.connection.execute('DELETE FROM contacts')
+            self.connection.execute(BUMP_LIST_VERSION)
+
+    def bulk_import_contacts(self, contacts):
+        with self.connection:
+            for contact in contacts:
+                self._insert_contact(contact['first_name'], contact['middle_names'],
+                                     contact['last_name'], contact['email_address'],
+                                     contact.get('phone_numbers'))
+            self.connection.execute(BUMP_LIST_VERSION)
+        return len(contacts)
+
+    def iter_contacts_with_phone_numbers(self, batch_size=2000):
+        # Keyset batches on id, so no read transaction is held open
+        # while the caller consumes the contacts
+        last_id = 0
+        while True:
+            # Batches of `batch_size` contacts, each with all its numbers
+            rows = self.connection.execute(EXPORT_CONTACTS, (last_id, batch_size)).fetchall()
+            if not rows:
+                return
+
+            for contact_id, contact_rows in groupby(rows, key=lambda row: row[0]):
+                contact_rows = list(contact_rows)
+                _, first_name, middle_names, last_name, email_address = contact_rows[0][:5]
+                yield {
+                    'id': contact_id,
+                    'first_name': first_name,
+                    'middle_names': middle_names,
+                    'last_name': last_name,
+                    'email_address': email_address,
+                    'phone_numbers': [
+                        {'id': row[5], 'number_value': row[6],
+                         'number_type': row[7], 'contact_id': contact_id}
+                        for row in contact_rows
+                        if row[5] is not None
+                    ],
+                }
+                last_id = contact_id
+
+    def get_list_version(self):
+        return self.connection.execute(SELECT_LIST_VERSION).fetchone()[0]
@@ -0,0 +1,134 @@
+from collections import namedtuple
+from typing import Protocol
+
+from contacts.errors import DataHandlingError
+
+# Row of the contact list: just what the list page renders.
+# namedtuples are built straight from the cursor's tuples, which is
+# cheaper than copying every row into a dict.
+ContactSummary = namedtuple('ContactSummary', ('id', 'full_name'))
+
+# A page of the contact list. The cursors are the ids of the contacts
+# that the previous / next page should start from, or None when
+# there is no such page.
+ContactsPage = namedtuple(
+    'ContactsPage',
+    ('contacts', 'previous_cursor', 'next_cursor')
+)
+
+class ContactsStorage(Protocol):
+    """
+    Operations every contacts backend provides. Contact ids are ints.
+
+    Contacts are dicts with `id`, `first_name`, `middle_names`,
+    `last_name` and `email_address`. Phone numbers are dicts with `id`,
+    `number_value`, `number_type` and `contact_id`. Write methods take
+    phone numbers in the shape of `get_phone_nums_from_form`.
+    """
+    def setup_schema(self):
+        """Prepare the backend for use. Called once per process."""
+
+    def close_connection(self):
+        """Release whatever the storage object holds for the request."""
+
+    def get_all_contacts(self):
+        ...
+
+    def get_contacts_page(self, after=None, before=None, limit=50):
+        """Returns a `ContactsPage` of `ContactSummary` rows."""
+
+    def search_contacts(self, search_text, limit=20):
+        """Returns ranked `ContactSummary` rows."""
+
+    def find_contact_by_id(self, contact_id):
+        """Returns the contact, or None."""
+
+    def find_contact_with_phone_numbers(self, contact_id):
+        """
+        Returns the contact, with `version`, `updated_at` and
+        `phone_numbers`, or None.
+        """
+
+    def get_phone_numbers(self, contact_id):
+        ...
+
+    def create_new_contact(self, first_name, middle_names=None, last_name=None,
+                           email_address=None, phone_numbers=None):
+        """Returns the id of the new contact."""
+
+    def update_one_contact(self, contact_id, first_name, middle_names,
+                           last_name, email_address, phone_numbers):
+        ...
+
+    def delete_one_contact(self, contact_id):
+        ...
+
+    def destroy_data(self):
+        ...
+
+    def bulk_import_contacts(self, contacts):
+        """Returns the number of contacts imported."""
+
+    def iter_contacts_with_phone_numbers(self, batch_size=2000):
+        """Yields every contact, with `phone_numbers`, in id order."""
+
+    def get_list_version(self):
+        """Returns a number that changes whenever the contact list does."""
+
+# Backend name -> factory(is_testing_environment, config)
+storage_backends = {}
+
+def register_backend(name):
+    def decorator(factory):
+        storage_backends[name] = factory
+        return factory
+    return decorator
+
+def create_storage(backend_name, is_testing_environment, config):
+    try:
+        factory = storage_backends[backend_name]
+    except KeyError:
+        raise DataHandlingError(f'Unknown storage backend: {backend_name}')
+    return factory(is_testing_environment, config)
+
+@register_backend('postgres')
+def create_database_storage(is_testing_environment, config):
+    from contacts.db_storage import ContactsDatabaseStorage
+    # A new connection per storage, so prepared statements would never be reused
+    return ContactsDatabaseStorage(is_testing_environment, prepare_statements=False)
+
+@register_backend('postgres-pooled')
+def create_pooled_database_storage(is_testing_environment, config):
+    from contacts.connection_pool import get_shared_pool
+    from contacts.db_storage import ContactsDatabaseStorage, get_db_dsn
+
+    pool = get_shared_pool(
+        get_db_dsn(is_testing_environment),
+        min_size=config['DB_POOL_MIN_SIZE'],
+        max_size=config['DB_POOL_MAX_SIZE'],
+        timeout=config['DB_POOL_TIMEOUT'],
+        health_check=config['DB_POOL_HEALTH_CHECK'],
+        health_check_idle_time=config['DB_POOL_HEALTH_CHECK_IDLE_TIME'],
+    )
+    return ContactsDatabaseStorage(
+        is_testing_environment, connection_pool=pool,
+        prepare_statements=config.get('DB_PREPARED_STATEMENTS', True)
+    )
+
+@register_backend('memory')
+def create_memory_storage(is_testing_environment, config):
+    from contacts.memory_storage import ContactsMemoryStorage
+    return ContactsMemoryStorage(is_testing_environment)
+
+@register_backend('file')
+def create_file_storage(is_testing_environment, config):
+    from contacts.file_storage import ContactsFileStorage
+    return ContactsFileStorage(is_testing_environment,
+                               file_path=config.get('CONTACTS_FILE_PATH'),
+                               snapshot_format=config.get('CONTACTS_FILE_FORMAT', 'yaml'))
+
+@register_backend('sqlite')
+def create_sqlite_storage(is_testing_environment, config):
+    from contacts.sqlite_storage import ContactsSQLiteStorage
+    return ContactsSQLiteStorage(is_testing_environment,
+                                 file_path=config.get('CONTACTS_SQLITE_PATH'))
@@ -0,0 +1,138 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from contacts import memory_storage
+from contacts.async_db_storage import async_storage_available
+from contacts.storage import ContactSummary, ContactsPage
+
+if async_storage_available():
+    import asgi
+
+def call(method, path, headers=(), body=b''):
+    """Sends one request to the ASGI app. Returns (status, headers, body)."""
+    path, _, query_string = path.partition('?')
+    scope = {
+        'type': 'http',
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'root_path': '',
+        'query_string': query_string.encode(),
+        'headers': [(name.lower().encode(), value.encode()) for name, value in headers],
+        'client': ('127.0.0.1', 50000),
+        'server': ('testserver', 80),
+    }
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    async def run():
+        await asgi.application(scope, receive, send)
+        start = sent[0]
+        response_headers = {name.decode(): value.decode() for name, value in start['headers']}
+        return (start['status'], response_headers,
+                b''.join(message.get('body', b'') for message in sent[1:]))
+
+    return run
+
+class FakeAsyncStorage:
+    """
+    Answers like `AsyncContactsDatabaseStorage` on one contact. Reads of
+    the list version wait until `readers` requests are waiting on it.
+    """
+    def __init__(self, readers=1):
+        self.readers = readers
+        self.waiting = 0
+        self.all_waiting = asyncio.Event()
+        self.page_loads = 0
+
+    async def get_list_version(self):
+        self.waiting += 1
+        if self.waiting >= self.readers:
+            self.all_waiting.set()
+        await asyncio.wait_for(self.all_waiting.wait(), timeout=2)
+        return 1
+
+    async def get_contacts_page(self, after=None, before=None, limit=50):
+        self.page_loads += 1
+        return ContactsPage([ContactSummary(1, 'John Smith')], None, None)
+
+    async def find_contact_with_phone_numbers(self, contact_id):
+        return None
+
+    async def close_connection(self):
+        pass
+
+@unittest.skipUnless(async_storage_available(), 'psycopg 3 and asgiref not installed')
+class ASGIApplicationTest(unittest.TestCase):
+    def setUp(self):
+        app = asgi.app
+        saved_config = {key: app.config[key] for key in
+                        ('TESTING', 'CONTACTS_STORAGE_BACKEND', 'FRAGMENT_CACHE_ENABLED')}
+        self.addCleanup(app.config.update, saved_config)
+        app.config.update(TESTING=True, CONTACTS_STORAGE_BACKEND='postgres',
+                          FRAGMENT_CACHE_ENABLED=False)
+
+        # No database here: the views get the fake storage from the pool
+        self.storage = FakeAsyncStorage()
+        self.connect = mock.AsyncMock(side_effect=lambda pool: self.storage)
+        for patcher in (mock.patch('app.get_async_pool'),
+                        mock.patch('app.AsyncContactsDatabaseStorage.connect', self.connect)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_async_views_share_the_event_loop(self):
+        self.storage = FakeAsyncStorage(readers=2)
+
+        async def run():
+            return await asyncio.gather(call('GET', '/async/')(), call('GET', '/async/')())
+
+        # Each request only gets its version once both are waiting for one
+        responses = asyncio.run(run())
+        self.assertEqual([status for status, _, _ in responses], [200, 200])
+        self.assertIn(b'John Smith', responses[0][2])
+
+    def test_unchanged_list_is_not_loaded_again(self):
+        status, headers, _ = asyncio.run(call('GET', '/async/')())
+        self.assertEqual(status, 200)
+
+        status, _, body = asyncio.run(call('GET', '/async/',
+                                           headers=[('If-None-Match', headers['etag'])])())
+        self.assertEqual((status, body), (304, b''))
+        self.assertEqual(self.storage.page_loads, 1)
+
+    def test_missing_contact_redirects_to_the_list(self):
+        status, headers, _ = asyncio.run(call('GET', '/async/contacts/123')())
+        self.assertEqual(status, 302)
+        self.assertEqual(headers['location'], '/async/')
+
+    def test_invalid_form_is_rejected_before_the_storage_is_opened(self):
+        status, _, _ = asyncio.run(call(
+            'POST', '/async/contacts',
+            headers=[('Content-Type', 'application/x-www-form-urlencoded')],
+            body=b'first_name=&email_address=nope'
+        )())
+        self.assertEqual(status, 422)
+        self.connect.assert_not_called()
+
+    def test_other_backends_have_no_async_views(self):
+        asgi.app.config['CONTACTS_STORAGE_BACKEND'] = 'memory'
+        status, _, _ = asyncio.run(call('GET', '/async/')())
+        self.assertEqual(status, 404)
+
+    def test_sync_routes_are_served_through_wsgi(self):
+        asgi.app.config['CONTACTS_STORAGE_BACKEND'] = 'memory'
+        with mock.patch.dict(memory_storage.memory_stores, clear=True):
+            status, _, body = asyncio.run(call('GET', '/contacts/new')())
+        self.assertEqual(status, 200)
+        self.assertIn(b'first_name', body)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import random
+import unittest
+
+from app import errors_in_contact_data
+from contacts.batch_validation import CONTACT_COLUMNS, errors_in_contact_columns
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Values that hit every rule, including the edge cases
+SAMPLE_VALUES = {
+    'first_name': ['John', ' Jo ', 'J', ' J ', '', '   ', None, 'Élodie'],
+    'email_address': ['j.smith@example.com', ' J.Smith@Example.COM ', 'j@example',
+                      'j smith@example.com', 'j@', '', None, '  ',
+                      # Accepted by the case-insensitive pattern
+                      '\u017fmith@example.com', '\u212aelly@example.com'],
+    'phone_number': ['1234567', ' 123456 ', '12345', '12a', '12a4567', '123-456-7890',
+                     '', None, ' '],
+}
+
+def random_rows(count, seed=1):
+    rng = random.Random(seed)
+    return [
+        {column_name: rng.choice(SAMPLE_VALUES['phone_number'
+                                               if column_name.startswith('phone_number')
+                                               else column_name])
+         for column_name in CONTACT_COLUMNS}
+        for _ in range(count)
+    ]
+
+def as_columns(rows):
+    return {column_name: [row[column_name] for row in rows] for column_name in CONTACT_COLUMNS}
+
+class ErrorsInContactColumnsTest(unittest.TestCase):
+    def test_same_errors_as_row_validation(self):
+        rows = random_rows(2000)
+        self.assertEqual(errors_in_contact_columns(as_columns(rows)),
+                         [errors_in_contact_data(row) or [] for row in rows])
+
+    def test_values_with_line_breaks(self):
+        rows = random_rows(500)
+        rows[10]['email_address'] = 'j@example.com\nk@example.com'
+        rows[20]['email_address'] = 'j@example.com\n'
+        rows[30]['first_name'] = 'J\nK'
+        self.assertEqual(errors_in_contact_columns(as_columns(rows)),
+                         [errors_in_contact_data(row) or [] for row in rows])
+
+    def test_missing_columns(self):
+        errors = errors_in_contact_columns({'email_address': ['j@example', 'j@example.com']})
+        self.assertEqual(errors, [
+            ['First name is required',
+             'Email address is not valid. Expected format: someaddr@example.com'],
+            ['First name is required'],
+        ])
+        self.assertEqual(errors_in_contact_columns({'first_name': ['John']}), [[]])
+        self.assertEqual(errors_in_contact_columns({}), [])
+
+    def test_columns_must_have_the_same_length(self):
+        with self.assertRaises(ValueError):
+            errors_in_contact_columns({'first_name': ['John'], 'phone_number_1': []})
+
+    def test_array_like_columns(self):
+        class Column:
+            def __init__(self, values):
+                self.values = values
+
+            def to_pylist(self):
+                return list(self.values)
+
+        errors = errors_in_contact_columns({'first_name': Column(['John', 'J']),
+                                            'phone_number_1': ('123', '1234567')})
+        self.assertEqual(errors, [
+            ['Phone numbers must be at least 6 digits'],
+            ['First name must be at least 2 letters'],
+        ])
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_numpy_columns(self):
+        rows = random_rows(200)
+        columns = {column_name: numpy.array(column, dtype=object)
+                   for column_name, column in as_columns(rows).items()}
+        self.assertEqual(errors_in_contact_columns(columns),
+                         [errors_in_contact_data(row) or [] for row in rows])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import io
+import unittest
+
+from app import import_contacts
+from contacts.bulk_import import detect_format, read_contact_records
+from contacts.db_storage import DataHandlingError
+
+class RecordingStorage:
+    def __init__(self):
+        self.batches = []
+
+    def bulk_import_contacts(self, contacts):
+        self.batches.append(contacts)
+        return len(contacts)
+
+class BulkImportTest(unittest.TestCase):
+    def test_detect_format(self):
+        self.assertEqual(detect_format('contacts.CSV'), 'csv')
+        self.assertEqual(detect_format('contacts.yml'), 'yaml')
+        self.assertEqual(detect_format('contacts.jsonl'), 'jsonl')
+        with self.assertRaises(DataHandlingError):
+            detect_format('contacts.xlsx')
+
+    def test_read_yaml_records(self):
+        file = io.StringIO(
+            "- first_name: John\n"
+            "  last_name: Addams\n"
+            "  phone_number: '91999999'\n"
+        )
+        (row_number, record), = read_contact_records(file, 'yaml')
+        self.assertEqual(row_number, 1)
+        self.assertEqual(record['first_name'], 'John')
+        self.assertEqual(record['phone_number_1'], '91999999')
+        self.assertEqual(record['phone_number_1_type'], 'personal')
+        self.assertIsNone(record['phone_number_2'])
+
+    def test_read_jsonl_records(self):
+        file = io.StringIO(
+            '{"first_name": "Alice", "phone_numbers": '
+            '[{"number_value": "5551234", "number_type": "work"}, "5559876"]}\n'
+            '\n'
+        )
+        records = list(read_contact_records(file, 'jsonl'))
+        self.assertEqual(len(records), 1)
+        record = records[0][1]
+        self.assertEqual(record['phone_number_1_type'], 'work')
+        self.assertEqual(record['phone_number_2'], '5559876')
+
+    def test_import_reports_invalid_rows(self):
+        file = io.StringIO(
+            "first_name,email_address,phone_number_1,phone_number_1_type\n"
+            "Alice,alice@example.com,5551234,home\n"
+            "B,not-an-email,12,home\n"
+            "Carol,,5559876,mobile\n"
+        )
+        storage = RecordingStorage()
+        progress = []
+        report = import_contacts(storage, read_contact_records(file, 'csv'),
+                                 batch_size=2, progress=progress.append)
+
+        self.assertEqual(report.rows_processed, 3)
+        self.assertEqual(report.rows_imported, 1)
+        self.assertEqual([row for row, _ in report.errors], [2, 3])
+        self.assertEqual(len(storage.batches), 2)
+        self.assertEqual(len(progress), 2)
+
+        contact = storage.batches[0][0]
+        self.assertEqual(contact['first_name'], 'Alice')
+        self.assertEqual(contact['phone_numbers'][0]['number_value'], '5551234')
+
+    def test_unreadable_files(self):
+        files = {
+            'yaml': io.StringIO('- first_name: [John\n'),
+            'csv': io.TextIOWrapper(io.BytesIO(b'first_name\n\xff\xfe\n'), encoding='utf-8'),
+        }
+        for file_format, file in files.items():
+            with self.assertRaises(DataHandlingError, msg=file_format):
+                list(read_contact_records(file, file_format))
+
+        with self.assertRaisesRegex(DataHandlingError, 'list of contacts'):
+            list(read_contact_records(io.StringIO('first_name: John\n'), 'yaml'))
+
+    def test_malformed_jsonl_line_rejects_only_its_row(self):
+        lines = ['{"first_name": "Alice"}\n'] * 3 + ['{"first_name": "Bob",\n'] \
+            + ['{"first_name": "Carol"}\n'] * 2
+        storage = RecordingStorage()
+        report = import_contacts(storage, read_contact_records(io.StringIO(''.join(lines)), 'jsonl'),
+                                 batch_size=2)
+
+        self.assertIsNone(report.failure)
+        self.assertEqual(report.rows_imported, 5)
+        (row_number, errors), = report.errors
+        self.assertEqual(row_number, 4)
+        self.assertRegex(errors[0], '^Line is not valid JSON')
+
+    def test_import_stopped_by_an_unreadable_file_keeps_its_report(self):
+        rows = ''.join(f'- first_name: Name{index}\n' for index in range(4))
+        storage = RecordingStorage()
+
+        def records():
+            yield from read_contact_records(io.StringIO(rows), 'yaml')
+            raise DataHandlingError('Could not parse import file: broken')
+
+        report = import_contacts(storage, records(), batch_size=3)
+
+        self.assertEqual(report.failure, 'Could not parse import file: broken')
+        self.assertEqual(report.rows_imported, 3)
+        self.assertEqual(report.rows_processed, 3)
+        self.assertEqual(len(storage.batches), 1)
+
+    def test_rows_with_wrong_shapes_are_rejected(self):
+        file = io.StringIO(
+            '["Alice", "5551234"]\n'
+            '{"first_name": "Bob", "phone_numbers": '
+            '[{"number_value": " 5551234 ", "number_type": 3}]}\n'
+            '{"first_name": "Carol", "phone_numbers": ["5551234", "5551235", '
+            '"5551236", "5551237"]}\n'
+            '{"first_name": "Dave", "phone_numbers": {"number_value": "5551234"}}\n'
+            '{"first_name": "Erin", "phone_numbers": [{"number_value": " 5551234 "}]}\n'
+        )
+        storage = RecordingStorage()
+        report = import_contacts(storage, read_contact_records(file, 'jsonl'))
+
+        self.assertEqual(report.errors, [
+            (1, ['Row is not a contact: expected a mapping of fields']),
+            (2, ['Phone number type must be one of: personal, home, work, other']),
+            (3, ['At most 3 phone numbers are supported per contact']),
+            (4, ['phone_numbers must be a list']),
+        ])
+        contact, = storage.batches[0]
+        self.assertEqual(contact['phone_numbers'][0]['number_value'], '5551234')
+
+if __name__ == '__main__':
+    unittest.main()
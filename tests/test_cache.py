@@ -0,0 +1,153 @@
+import unittest
+from unittest import mock
+
+from contacts.cache import (
+    MISSING, CachedContactsStorage, ContactCache, LRUCache, SharedCacheBackend
+)
+
+class FakeStorage:
+    def __init__(self):
+        self.contacts = {1: {'id': 1, 'first_name': 'John', 'phone_numbers': []}}
+        self.reads = 0
+
+    def find_contact_with_phone_numbers(self, contact_id):
+        self.reads += 1
+        contact = self.contacts.get(contact_id)
+        return dict(contact) if contact else None
+
+    def update_one_contact(self, contact_id, first_name, **kwargs):
+        self.contacts[contact_id]['first_name'] = first_name
+
+    def delete_one_contact(self, contact_id):
+        del self.contacts[contact_id]
+
+    def close_connection(self):
+        self.closed = True
+
+class FakeSharedClient:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+class LRUCacheTest(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIs(cache.get('b'), MISSING)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_entries_expire(self):
+        cache = LRUCache(ttl=10)
+        with mock.patch('contacts.cache.time.monotonic', return_value=100):
+            cache.set('a', 1)
+        with mock.patch('contacts.cache.time.monotonic', return_value=105):
+            self.assertEqual(cache.get('a'), 1)
+        with mock.patch('contacts.cache.time.monotonic', return_value=111):
+            self.assertIs(cache.get('a'), MISSING)
+
+class CachedContactsStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.storage = FakeStorage()
+        self.cache = ContactCache(LRUCache())
+        self.cached_storage = CachedContactsStorage(self.storage, self.cache)
+
+    def test_reads_are_cached(self):
+        first = self.cached_storage.find_contact_with_phone_numbers(1)
+        first['full_name'] = 'changed by the caller'
+        second = self.cached_storage.find_contact_with_phone_numbers(1)
+
+        self.assertEqual(self.storage.reads, 1)
+        self.assertNotIn('full_name', second)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_writes_invalidate(self):
+        self.cached_storage.find_contact_with_phone_numbers(1)
+        self.cached_storage.update_one_contact(1, first_name='Johnny')
+        contact = self.cached_storage.find_contact_with_phone_numbers(1)
+        self.assertEqual(contact['first_name'], 'Johnny')
+
+        self.cached_storage.delete_one_contact(1)
+        self.assertIsNone(self.cached_storage.find_contact_with_phone_numbers(1))
+
+    def test_other_methods_pass_through(self):
+        self.cached_storage.close_connection()
+        self.assertTrue(self.storage.closed)
+
+    def test_invalidation_during_read_is_not_undone(self):
+        storage = self.storage
+        read = storage.find_contact_with_phone_numbers
+
+        def read_then_update(contact_id):
+            # Another request saves the contact while this one reads it
+            contact = read(contact_id)
+            self.cached_storage.update_one_contact(contact_id, first_name='Johnny')
+            return contact
+
+        storage.find_contact_with_phone_numbers = read_then_update
+        stale = self.cached_storage.find_contact_with_phone_numbers(1)
+        self.assertEqual(stale['first_name'], 'John')
+
+        storage.find_contact_with_phone_numbers = read
+        contact = self.cached_storage.find_contact_with_phone_numbers(1)
+        self.assertEqual(contact['first_name'], 'Johnny')
+
+class SharedContactCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.client = FakeSharedClient()
+        self.storage = FakeStorage()
+
+    def cached_storage(self):
+        # One per worker, sharing the client
+        cache = ContactCache(LRUCache(), SharedCacheBackend(self.client))
+        return CachedContactsStorage(self.storage, cache)
+
+    def test_local_cache_is_skipped(self):
+        SharedCacheBackend(self.client).set(('find_contact_with_phone_numbers', 1),
+                                            {'id': 1, 'first_name': 'Shared'})
+        cached_storage = self.cached_storage()
+
+        contact = cached_storage.find_contact_with_phone_numbers(1)
+        self.assertEqual(contact['first_name'], 'Shared')
+        self.assertEqual(self.storage.reads, 0)
+        self.assertEqual(len(cached_storage.cache.local_cache), 0)
+
+    def test_writes_invalidate_other_workers(self):
+        worker, other_worker = self.cached_storage(), self.cached_storage()
+        other_worker.find_contact_with_phone_numbers(1)
+        worker.update_one_contact(1, first_name='Johnny')
+
+        contact = other_worker.find_contact_with_phone_numbers(1)
+        self.assertEqual(contact['first_name'], 'Johnny')
+
+    def test_invalidation_during_read_is_not_undone(self):
+        worker, other_worker = self.cached_storage(), self.cached_storage()
+        read = self.storage.find_contact_with_phone_numbers
+
+        def read_then_update(contact_id):
+            contact = read(contact_id)
+            other_worker.update_one_contact(contact_id, first_name='Johnny')
+            return contact
+
+        self.storage.find_contact_with_phone_numbers = read_then_update
+        worker.find_contact_with_phone_numbers(1)
+
+        self.storage.find_contact_with_phone_numbers = read
+        contact = other_worker.find_contact_with_phone_numbers(1)
+        self.assertEqual(contact['first_name'], 'Johnny')
+
+if __name__ == '__main__':
+    unittest.main()
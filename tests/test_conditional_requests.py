@@ -0,0 +1,51 @@
+import unittest
+from unittest import mock
+
+from contacts import memory_storage
+
+class ConditionalRequestsTest(unittest.TestCase):
+    def setUp(self):
+        import app
+        self.app = app
+        saved_config = {key: app.app.config[key] for key in
+                        ('TESTING', 'CONTACTS_STORAGE_BACKEND')}
+        self.addCleanup(app.app.config.update, saved_config)
+        app.app.config.update(TESTING=True, CONTACTS_STORAGE_BACKEND='memory')
+        self.client = app.app.test_client()
+
+        patcher = mock.patch.dict(memory_storage.memory_stores, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.restart()
+
+    def restart(self):
+        # What a new process starts from: an empty store and empty caches
+        memory_storage.memory_stores.clear()
+        self.app.contact_caches.clear()
+        self.app.fragment_caches.clear()
+        self.storage = self.app.open_storage(True)
+
+    def test_contact_etag_changes_when_an_id_is_reused(self):
+        contact_id = self.storage.create_new_contact('John')
+        etag = self.client.get(f'/contacts/{contact_id}').headers['ETag']
+
+        self.restart()
+        self.assertEqual(self.storage.create_new_contact('Jane'), contact_id)
+
+        response = self.client.get(f'/contacts/{contact_id}', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Jane', response.get_data(as_text=True))
+
+    def test_list_etag_changes_when_the_store_starts_over(self):
+        self.storage.create_new_contact('John')
+        etag = self.client.get('/').headers['ETag']
+
+        self.restart()
+        self.storage.create_new_contact('Jane')
+
+        response = self.client.get('/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Jane', response.get_data(as_text=True))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+import psycopg2
+
+from contacts.connection_pool import ConnectionPool, PoolTimeoutError
+from contacts.errors import DataHandlingError
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query, params=None):
+        self.connection.queries.append(query)
+        if self.connection.broken:
+            raise psycopg2.OperationalError('server closed the connection')
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.queries = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        pass
+
+    def get_transaction_status(self):
+        return psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+class ConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('contacts.connection_pool.psycopg2.connect',
+                             side_effect=lambda dsn: FakeConnection())
+        self.connect = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        monotonic = mock.patch('contacts.connection_pool.time.monotonic',
+                               side_effect=lambda: self.now)
+        self.now = 1000.0
+        monotonic.start()
+        self.addCleanup(monotonic.stop)
+
+    def test_times_out_when_exhausted(self):
+        pool = ConnectionPool('dbname=test', min_size=0, max_size=1, timeout=0)
+        pool.get_connection()
+
+        with self.assertRaises(PoolTimeoutError):
+            pool.get_connection()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_waits_are_counted(self):
+        pool = ConnectionPool('dbname=test', min_size=0, max_size=1, timeout=5.0)
+        connection = pool.get_connection()
+        borrowed = []
+        thread = threading.Thread(target=lambda: borrowed.append(pool.get_connection()))
+        thread.start()
+
+        # The wait is counted under the lock, which the waiting thread
+        # only releases once it waits
+        while pool.stats()['waits'] == 0:
+            time.sleep(0.001)
+        pool.put_connection(connection)
+        thread.join()
+
+        self.assertEqual(borrowed, [connection])
+        self.assertEqual(pool.stats()['waits'], 1)
+
+    def test_recently_used_connections_are_not_checked(self):
+        pool = ConnectionPool('dbname=test', min_size=1, max_size=1)
+        connection = pool.get_connection()
+        pool.put_connection(connection)
+
+        self.now += 10
+        self.assertIs(pool.get_connection(), connection)
+        self.assertEqual(connection.queries, [])
+
+    def test_idle_connection_failing_the_check_is_replaced(self):
+        pool = ConnectionPool('dbname=test', min_size=1, max_size=1,
+                              health_check_idle_time=30.0)
+        connection = pool.get_connection()
+        pool.put_connection(connection)
+        connection.broken = True
+
+        self.now += 60
+        replacement = pool.get_connection()
+
+        self.assertIsNot(replacement, connection)
+        self.assertTrue(connection.closed)
+        stats = pool.stats()
+        self.assertEqual(stats['health_check_failures'], 1)
+        self.assertEqual(stats['size'], 1)
+        self.assertEqual(stats['connections_opened'], 2)
+
+    def test_closed_connection_is_replaced_without_a_query(self):
+        pool = ConnectionPool('dbname=test', min_size=1, max_size=1)
+        connection = pool.get_connection()
+        pool.put_connection(connection)
+        connection.closed = 2
+
+        self.assertIsNot(pool.get_connection(), connection)
+        self.assertEqual(connection.queries, [])
+
+    def test_failed_connect_releases_the_slot(self):
+        pool = ConnectionPool('dbname=test', min_size=0, max_size=1, timeout=0)
+        self.connect.side_effect = psycopg2.OperationalError('connection refused')
+        with self.assertRaises(DataHandlingError):
+            pool.get_connection()
+        self.assertEqual(pool.stats()['size'], 0)
+
+        self.connect.side_effect = lambda dsn: FakeConnection()
+        self.assertIsInstance(pool.get_connection(), FakeConnection)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import io
+import json
+import unittest
+
+from contacts.bulk_import import read_contact_records
+from contacts.export import export_chunks
+
+CONTACTS = [
+    {
+        'id': 1,
+        'first_name': 'Lilly',
+        'middle_names': 'Elizabeth',
+        'last_name': 'Martinez',
+        'email_address': 'l.martinez@example.com',
+        'phone_numbers': [
+            {'id': 1, 'number_value': '5696934238', 'number_type': 'home', 'contact_id': 1},
+            {'id': 2, 'number_value': '8544089059', 'number_type': 'work', 'contact_id': 1},
+        ],
+    },
+    {
+        'id': 2,
+        'first_name': 'John',
+        'middle_names': None,
+        'last_name': 'Smith, Jr.',
+        'email_address': None,
+        'phone_numbers': [],
+    },
+]
+
+class ExportTest(unittest.TestCase):
+    def export(self, export_format, chunk_size=1):
+        return ''.join(export_chunks(iter(CONTACTS), export_format, chunk_size))
+
+    def test_csv_round_trips_through_import(self):
+        exported = self.export('csv')
+        records = [record for _, record in
+                   read_contact_records(io.StringIO(exported, newline=''), 'csv')]
+
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]['first_name'], 'Lilly')
+        self.assertEqual(records[0]['phone_number_2'], '8544089059')
+        self.assertEqual(records[0]['phone_number_2_type'], 'work')
+        self.assertEqual(records[1]['last_name'], 'Smith, Jr.')
+
+    def test_csv_keeps_numbers_past_the_third(self):
+        contact = CONTACTS[0] | {'phone_numbers': [
+            {'number_value': f'555000{index}', 'number_type': 'work'} for index in range(5)
+        ]}
+        exported = ''.join(export_chunks(iter([contact]), 'csv'))
+        self.assertIn('5550003 (work); 5550004 (work)', exported)
+
+        (_, record), = read_contact_records(io.StringIO(exported, newline=''), 'csv')
+        self.assertEqual(record['phone_number_3'], '5550002')
+        self.assertEqual(record['extra_phone_numbers'], 2)
+
+    def test_jsonl(self):
+        lines = self.export('jsonl').splitlines()
+        self.assertEqual(len(lines), 2)
+        first = json.loads(lines[0])
+        self.assertNotIn('id', first)
+        self.assertEqual(first['phone_numbers'][0],
+                         {'number_value': '5696934238', 'number_type': 'home'})
+
+    def test_vcard(self):
+        exported = self.export('vcf')
+        self.assertEqual(exported.count('BEGIN:VCARD'), 2)
+        self.assertIn('N:Martinez;Lilly;Elizabeth;;\r\n', exported)
+        self.assertIn('TEL;TYPE=WORK:8544089059\r\n', exported)
+        self.assertIn('FN:John Smith\\, Jr.\r\n', exported)
+
+    def test_output_is_chunked(self):
+        chunks = list(export_chunks(iter(CONTACTS), 'jsonl', chunk_size=10 ** 6))
+        self.assertEqual(len(chunks), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import yaml
+
+from contacts import file_storage
+from contacts.file_storage import ContactsFile, ContactsFileStorage
+
+def phone(number_value, number_type='personal', id=None):
+    return {'number_value': number_value, 'number_type': number_type, 'id': id}
+
+class ContactsFileTest(unittest.TestCase):
+    def setUp(self):
+        data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(data_dir.cleanup)
+        self.file_path = os.path.join(data_dir.name, 'contacts.yaml')
+
+        self.storage = ContactsFileStorage(file_path=self.file_path)
+        self.storage.setup_schema()
+        self.addCleanup(file_storage.contacts_files.clear)
+
+    def open_other(self):
+        # A ContactsFile of its own, like another worker process has
+        other = ContactsFileStorage.__new__(ContactsFileStorage)
+        other._file_path = self.file_path
+        other._file = ContactsFile(self.file_path)
+        other._store = other._file.store
+        return other
+
+    def test_writes_go_to_the_journal(self):
+        contact_id = self.storage.create_new_contact('John', phone_numbers=[phone('111111')])
+
+        with open(self.file_path + file_storage.JOURNAL_SUFFIX) as journal:
+            # The generation header, then the change
+            self.assertEqual(len(journal.readlines()), 2)
+        with open(self.file_path) as file:
+            self.assertEqual(yaml.safe_load(file)['contacts'], [])
+
+        other = self.open_other()
+        contact = other.find_contact_with_phone_numbers(contact_id)
+        self.assertEqual(contact['first_name'], 'John')
+        self.assertEqual(contact['phone_numbers'][0]['number_value'], '111111')
+
+    def test_writers_replay_each_others_changes(self):
+        other = self.open_other()
+        list_version = self.storage.get_list_version()
+        first_id = self.storage.create_new_contact('John')
+        second_id = other.create_new_contact('Jane')
+        self.assertNotEqual(first_id, second_id)
+
+        self.storage.update_one_contact(second_id, 'Janet', None, None, None, [])
+        self.assertEqual(self.storage.find_contact_by_id(second_id)['first_name'], 'Janet')
+        self.assertEqual(self.storage.get_list_version(), list_version + 3)
+
+    @mock.patch.object(file_storage, 'COMPACT_AFTER_ENTRIES', 3)
+    def test_compaction(self):
+        for name in ('Alice', 'Bob', 'Carol'):
+            self.storage.create_new_contact(name)
+
+        with open(self.file_path + file_storage.JOURNAL_SUFFIX) as journal:
+            self.assertEqual(journal.read(), file_storage.encode_journal_header(2))
+        with open(self.file_path) as file:
+            data = yaml.safe_load(file)
+        self.assertEqual([c['first_name'] for c in data['contacts']], ['Alice', 'Bob', 'Carol'])
+
+        other = self.open_other()
+        self.assertEqual(len(other.get_all_contacts()), 3)
+        self.assertEqual(other.get_list_version(), self.storage.get_list_version())
+
+    @mock.patch.object(file_storage, 'COMPACT_AFTER_ENTRIES', 3)
+    def test_ids_of_deleted_contacts_are_not_reused(self):
+        self.storage.create_new_contact('Alice')
+        deleted_id = self.storage.create_new_contact('Bob')
+        # Compacts the journal into a snapshot without Bob
+        self.storage.delete_one_contact(deleted_id)
+
+        other = self.open_other()
+        self.assertGreater(other.create_new_contact('Carol'), deleted_id)
+
+    def test_readers_pick_up_other_writes(self):
+        other = self.open_other()
+        contact_id = other.create_new_contact('John')
+
+        storage = ContactsFileStorage(file_path=self.file_path)
+        self.assertEqual(storage.find_contact_by_id(contact_id)['first_name'], 'John')
+
+        with mock.patch.object(file_storage, 'load_yaml') as load_yaml, \
+                mock.patch.object(ContactsFile, '_replay_journal') as replay_journal:
+            ContactsFileStorage(file_path=self.file_path)
+        load_yaml.assert_not_called()
+        replay_journal.assert_not_called()
+
+    def test_unfinished_journal_line_is_ignored(self):
+        contact_id = self.storage.create_new_contact('John')
+        with open(self.file_path + file_storage.JOURNAL_SUFFIX, 'a') as journal:
+            journal.write('{"op": "delete", "contact_')
+
+        other = self.open_other()
+        self.assertIsNotNone(other.find_contact_by_id(contact_id))
+
+        # The next write replaces the unfinished line
+        other.create_new_contact('Jane')
+        self.assertEqual(len(self.open_other().get_all_contacts()), 2)
+
+    @mock.patch.object(file_storage, 'COMPACT_AFTER_ENTRIES', 3)
+    def test_crash_between_snapshot_and_journal_reset(self):
+        self.storage.create_new_contact('Alice')
+        self.storage.create_new_contact('Bob')
+
+        # The process dies right after replacing the snapshot
+        replace = os.replace
+
+        def replace_then_die(source, destination):
+            replace(source, destination)
+            raise SystemExit
+
+        with mock.patch.object(file_storage.os, 'replace', replace_then_die):
+            with self.assertRaises(SystemExit):
+                self.storage.create_new_contact('Carol')
+
+        other = self.open_other()
+        self.assertEqual(sorted(c['first_name'] for c in other.get_all_contacts()),
+                         ['Alice', 'Bob', 'Carol'])
+        self.assertEqual(len(other._store.sort_keys), 3)
+
+        # Writes carry on from the snapshot, in a journal of its generation
+        other.delete_one_contact(other.search_contacts('Bob')[0].id)
+        other.create_new_contact('Dave')
+        self.assertEqual(sorted(c['first_name'] for c in self.open_other().get_all_contacts()),
+                         ['Alice', 'Carol', 'Dave'])
+        self.assertEqual([c.id for c in other.get_contacts_page(limit=10).contacts],
+                         [c.id for c in self.open_other().get_contacts_page(limit=10).contacts])
+
+    def test_legacy_file(self):
+        with open(self.file_path, 'w') as file:
+            yaml.dump([{'id': 'a1b2', 'first_name': 'John', 'phone_number': 5551234}], file)
+
+        other = self.open_other()
+        [contact] = other.get_all_contacts()
+        self.assertIsInstance(contact['id'], int)
+        self.assertEqual(other.get_phone_numbers(contact['id'])[0]['number_value'], '5551234')
+
+    def test_failed_journal_write_reloads_from_disk(self):
+        contact_id = self.storage.create_new_contact('John')
+
+        # The write fails before anything reaches the journal
+        with mock.patch.object(file_storage, 'encode_change',
+                               side_effect=OSError('disk full')):
+            with self.assertRaises(file_storage.DataHandlingError):
+                self.storage.delete_one_contact(contact_id)
+
+        self.assertIsNotNone(self.storage.find_contact_by_id(contact_id))
+        self.assertEqual(self.storage._file.journal_entries, 1)
+
+    def test_mixed_formats_keep_phone_number_ids_unique(self):
+        with open(self.file_path, 'w') as file:
+            yaml.dump({'contacts': [
+                {'id': 'a1b2', 'first_name': 'John', 'phone_number': 5551234},
+                {'id': 2, 'first_name': 'Jane', 'phone_numbers': [
+                    {'id': 1, 'number_value': '5559876', 'number_type': 'work'},
+                ]},
+            ]}, file)
+
+        other = self.open_other()
+        phone_number_ids = [phone_number['id'] for contact in other.get_all_contacts()
+                            for phone_number in other.get_phone_numbers(contact['id'])]
+        self.assertEqual(sorted(phone_number_ids), [1, 2])
+
+    def test_marshal_snapshot_converts_yaml(self):
+        contact_id = self.storage.create_new_contact('John', phone_numbers=[phone('111111')])
+        updated_at = self.storage.find_contact_with_phone_numbers(contact_id)['updated_at']
+
+        other = ContactsFileStorage(file_path=self.file_path, snapshot_format='marshal')
+        marshal_path = os.path.join(os.path.dirname(self.file_path), 'contacts.marshal')
+        self.assertTrue(os.path.exists(marshal_path))
+        self.assertTrue(os.path.exists(self.file_path + '.bak'))
+        self.assertFalse(os.path.exists(self.file_path))
+
+        # Reloading from the marshal snapshot keeps every field
+        reloaded = ContactsFile(self.file_path, 'marshal').store
+        contact = reloaded.contacts[contact_id]
+        self.assertEqual(contact['updated_at'], updated_at)
+        self.assertEqual(reloaded.phone_numbers[contact_id][0]['number_value'], '111111')
+        self.assertEqual(other.get_list_version(), self.storage.get_list_version())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+from unittest import mock
+
+from contacts import memory_storage
+
+class FragmentCacheTest(unittest.TestCase):
+    def setUp(self):
+        import app
+        self.app = app
+        saved_config = {key: app.app.config[key] for key in
+                        ('TESTING', 'CONTACTS_STORAGE_BACKEND', 'FRAGMENT_CACHE_ENABLED',
+                         'FRAGMENT_CACHE_MAX_BYTES', 'FRAGMENT_CACHE_TTL')}
+        self.addCleanup(app.app.config.update, saved_config)
+        app.app.config.update(TESTING=True, CONTACTS_STORAGE_BACKEND='memory')
+        self.client = app.app.test_client()
+
+        patcher = mock.patch.dict(memory_storage.memory_stores, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        app.fragment_caches.clear()
+        self.addCleanup(app.fragment_caches.clear)
+        self.storage = app.open_storage(True)
+
+        renders = mock.patch.object(app, 'render_contact_list_body',
+                                    wraps=app.render_contact_list_body)
+        self.render = renders.start()
+        self.addCleanup(renders.stop)
+
+    def get_home(self, **args):
+        response = self.client.get('/', query_string=args)
+        self.assertEqual(response.status_code, 200)
+        return response.get_data(as_text=True)
+
+    def fragment_cache(self):
+        return self.app.get_fragment_cache(True)
+
+    def test_pages_are_rendered_once_per_list_version(self):
+        self.storage.create_new_contact('John')
+        first = self.get_home()
+        self.assertEqual(self.get_home(), first)
+        self.assertEqual(self.render.call_count, 1)
+
+        # Another page is another entry
+        self.get_home(limit=1)
+        self.assertEqual(self.render.call_count, 2)
+
+    def test_writes_change_the_cached_page(self):
+        contact_id = self.storage.create_new_contact('John')
+        self.assertIn('John', self.get_home())
+
+        self.storage.update_one_contact(contact_id, 'Johnny', None, None, None, [])
+        self.assertIn('Johnny', self.get_home())
+        self.assertEqual(self.render.call_count, 2)
+
+    def test_entries_are_charged_their_size_in_bytes(self):
+        self.storage.create_new_contact('Émilie Øster')
+        self.get_home()
+
+        (_, (fragment, _, cost)), = self.fragment_cache()._entries.items()
+        self.assertEqual(cost, len(fragment.encode('utf-8')))
+        self.assertGreater(cost, len(fragment))
+
+    def test_entries_past_the_byte_budget_are_evicted(self):
+        for index in range(3):
+            self.storage.create_new_contact(f'Contact{index}')
+        self.get_home(limit=1)
+        one_page = self.fragment_cache().total_cost
+
+        self.app.fragment_caches.clear()
+        self.app.app.config['FRAGMENT_CACHE_MAX_BYTES'] = one_page * 2 + one_page // 2
+        for limit in (1, 2, 3):
+            self.get_home(limit=limit)
+
+        cache = self.fragment_cache()
+        self.assertLessEqual(cache.total_cost, cache.max_cost)
+        self.assertLess(len(cache), 3)
+
+    def test_entries_expire(self):
+        self.storage.create_new_contact('John')
+        self.app.app.config['FRAGMENT_CACHE_TTL'] = 60
+        with mock.patch('contacts.cache.time.monotonic', return_value=1000):
+            self.get_home()
+        with mock.patch('contacts.cache.time.monotonic', return_value=1030):
+            self.get_home()
+        self.assertEqual(self.render.call_count, 1)
+
+        with mock.patch('contacts.cache.time.monotonic', return_value=1061):
+            self.get_home()
+        self.assertEqual(self.render.call_count, 2)
+
+    def test_disabled(self):
+        self.app.app.config['FRAGMENT_CACHE_ENABLED'] = False
+        self.storage.create_new_contact('John')
+        self.get_home()
+        self.get_home()
+
+        self.assertEqual(self.render.call_count, 2)
+        self.assertNotIn(self.app.get_storage_key(True), self.app.fragment_caches)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import threading
+import unittest
+
+from contacts.metrics import MetricsRegistry
+
+class MetricsRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter(self):
+        counter = self.registry.counter('opened_total', 'Opened storages.', ('backend', ))
+        counter.inc('memory')
+        counter.inc('memory', amount=2)
+        counter.inc('file')
+
+        self.assertEqual(self.registry.render(), [
+            '# HELP opened_total Opened storages.',
+            '# TYPE opened_total counter',
+            'opened_total{backend="file"} 1',
+            'opened_total{backend="memory"} 3',
+        ])
+
+    def test_histogram(self):
+        histogram = self.registry.histogram('duration_seconds', 'Durations.',
+                                            ('endpoint', ), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value, 'home')
+
+        self.assertEqual(self.registry.render(), [
+            '# HELP duration_seconds Durations.',
+            '# TYPE duration_seconds histogram',
+            'duration_seconds_bucket{endpoint="home",le="0.1"} 2',
+            'duration_seconds_bucket{endpoint="home",le="1.0"} 3',
+            'duration_seconds_bucket{endpoint="home",le="+Inf"} 4',
+            'duration_seconds_sum{endpoint="home"} 2.65',
+            'duration_seconds_count{endpoint="home"} 4',
+        ])
+
+    def test_label_values_are_escaped(self):
+        counter = self.registry.counter('templates_total', 'Templates.', ('template', ))
+        counter.inc('say "hi"\n')
+        self.assertEqual(self.registry.render()[-1],
+                         'templates_total{template="say \\"hi\\"\\n"} 1')
+
+    def test_threads_are_summed(self):
+        counter = self.registry.counter('requests_total', 'Requests.')
+
+        def count():
+            for _ in range(1000):
+                counter.inc()
+
+        threads = [threading.Thread(target=count) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.registry.render()[-1], 'requests_total 8000')
+
+    def test_finished_threads_are_folded(self):
+        counter = self.registry.counter('requests_total', 'Requests.')
+        histogram = self.registry.histogram('duration_seconds', 'Durations.',
+                                            buckets=(1.0, ))
+
+        # Like a server that starts one thread per request
+        for _ in range(100):
+            thread = threading.Thread(target=lambda: (counter.inc(), histogram.observe(0.5)))
+            thread.start()
+            thread.join()
+
+        lines = self.registry.render()
+        self.assertIn('requests_total 100', lines)
+        self.assertIn('duration_seconds_bucket{le="1.0"} 100', lines)
+        self.assertIn('duration_seconds_sum 50.0', lines)
+        self.assertEqual(len(counter._shards._shards), 0)
+
+        counter.inc()
+        self.assertIn('requests_total 101', self.registry.render())
+
+class MetricsEndpointTest(unittest.TestCase):
+    def setUp(self):
+        from app import app
+        self.app = app
+        saved_config = {key: app.config[key] for key in
+                        ('TESTING', 'CONTACTS_STORAGE_BACKEND')}
+        self.addCleanup(app.config.update, saved_config)
+        app.config.update(TESTING=True, CONTACTS_STORAGE_BACKEND='memory')
+        self.client = app.test_client()
+
+    def test_requests_and_storages_are_measured(self):
+        self.assertEqual(self.client.get('/').status_code, 200)
+        body = self.client.get('/metrics').get_data(as_text=True)
+
+        self.assertIn('contacts_http_request_duration_seconds_count'
+                      '{endpoint="home",method="GET",status="200"}', body)
+        self.assertIn('contacts_storage_opened_total{backend="memory"}', body)
+        self.assertIn('contacts_storage_closed_total{backend="memory"}', body)
+        self.assertIn('contacts_template_render_seconds_count', body)
+
+if __name__ == '__main__':
+    unittest.main()
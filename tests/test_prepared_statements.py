@@ -0,0 +1,150 @@
+import unittest
+from unittest import mock
+
+from psycopg2.errors import InvalidSqlStatementName
+
+from contacts import db_storage
+from contacts.db_storage import (
+    Statement, StatementStats, db_transaction, execute_statement, prepared_statements
+)
+
+class FakeConnection:
+    def __init__(self):
+        self.transactions = []
+        # Statements prepared in the server session
+        self.session = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        self.transactions.append('rollback' if exc_type else 'commit')
+        return False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.executed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+        command, _, rest = query.partition(' ')
+        name = rest.split(' ')[0]
+        if command == 'PREPARE':
+            self.connection.session.add(name)
+        elif command == 'EXECUTE' and name not in self.connection.session:
+            raise InvalidSqlStatementName(f'prepared statement "{name}" does not exist')
+
+SELECT_NAME = Statement(
+    'select_name',
+    """
+    SELECT first_name
+    FROM contacts
+    WHERE id = %s AND last_name = %s
+    """,
+    ('int', 'text')
+)
+
+class StatementTest(unittest.TestCase):
+    def test_prepare_and_execute_sql(self):
+        self.assertEqual(
+            SELECT_NAME.prepare_sql,
+            'PREPARE select_name (int, text) AS \n'
+            'SELECT first_name\nFROM contacts\nWHERE id = $1 AND last_name = $2\n'
+        )
+        self.assertEqual(SELECT_NAME.execute_sql, 'EXECUTE select_name (%s, %s)')
+
+        statement = Statement('select_version', 'SELECT version FROM contacts_list_version')
+        self.assertEqual(statement.execute_sql, 'EXECUTE select_version')
+
+    def test_parameter_count_is_checked(self):
+        with self.assertRaises(ValueError):
+            Statement('broken', 'SELECT * FROM contacts WHERE id = %s')
+
+    def test_only_placeholders_are_numbered(self):
+        statement = Statement(
+            'select_like',
+            """SELECT '%s', "%s" FROM contacts WHERE note LIKE '50%%' || %s -- %s""",
+            ('text', )
+        )
+        self.assertEqual(
+            statement.prepare_sql,
+            """PREPARE select_like (text) AS SELECT '%s', "%s" FROM contacts """
+            """WHERE note LIKE '50%' || $1 -- %s"""
+        )
+
+class FakeStorage:
+    def __init__(self):
+        self.connection = FakeConnection()
+
+    @db_transaction()
+    def select_name(self, cursor, contact_id):
+        execute_statement(cursor, SELECT_NAME, (contact_id, 'Smith'))
+        return cursor.executed
+
+class ExecuteStatementTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(db_storage, 'statement_stats', StatementStats())
+        self.stats = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_prepared_once_per_connection(self):
+        connection = FakeConnection()
+        for contact_id in (1, 2):
+            cursor = FakeCursor(connection)
+            execute_statement(cursor, SELECT_NAME, (contact_id, 'Smith'))
+
+        self.assertEqual(cursor.executed, [(SELECT_NAME.execute_sql, (2, 'Smith'))])
+
+        other_cursor = FakeCursor(FakeConnection())
+        execute_statement(other_cursor, SELECT_NAME, (3, 'Jones'))
+        self.assertEqual(other_cursor.executed[0], (SELECT_NAME.prepare_sql, None))
+
+        stats = self.stats.snapshot()
+        self.assertEqual(stats['prepares'], 2)
+        self.assertEqual(stats['reused_executions'], 1)
+        self.assertEqual(stats['executions'], {'select_name': 3})
+
+    def test_deallocated_statement_is_forgotten(self):
+        connection = FakeConnection()
+        execute_statement(FakeCursor(connection), SELECT_NAME, (1, 'Smith'))
+
+        connection.session.clear()
+        cursor = FakeCursor(connection)
+        with self.assertRaises(InvalidSqlStatementName):
+            execute_statement(cursor, SELECT_NAME, (2, 'Smith'))
+
+        # No savepoint around the EXECUTE: the transaction is retried instead
+        self.assertEqual(cursor.executed, [(SELECT_NAME.execute_sql, (2, 'Smith'))])
+        self.assertEqual(prepared_statements[connection], set())
+
+    def test_transaction_is_retried_after_deallocation(self):
+        storage = FakeStorage()
+        self.assertEqual(storage.select_name(1), [(SELECT_NAME.prepare_sql, None),
+                                                  (SELECT_NAME.execute_sql, (1, 'Smith'))])
+
+        # e.g. DISCARD ALL by a connection pooler
+        storage.connection.session.clear()
+        self.assertEqual(storage.select_name(2), [(SELECT_NAME.prepare_sql, None),
+                                                  (SELECT_NAME.execute_sql, (2, 'Smith'))])
+        self.assertEqual(storage.connection.transactions, ['commit', 'rollback', 'commit'])
+        self.assertEqual(self.stats.snapshot()['prepares'], 2)
+
+    def test_unprepared(self):
+        cursor = FakeCursor(FakeConnection())
+        execute_statement(cursor, SELECT_NAME, (1, 'Smith'), prepare=False)
+
+        self.assertEqual(cursor.executed, [(SELECT_NAME.sql, (1, 'Smith'))])
+        self.assertEqual(self.stats.snapshot()['prepares'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
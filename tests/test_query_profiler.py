@@ -0,0 +1,70 @@
+import unittest
+
+from contacts.db_storage import SELECT_CONTACT, statement_names
+from contacts.query_profiler import (
+    ProfiledCursor, RequestProfile, current_profile, start_profile, stop_profile
+)
+
+class FakeCursor:
+    rowcount = -1
+
+    def __init__(self):
+        self.connection = object()
+
+    def execute(self, query, params=None):
+        if 'fail' in query:
+            raise RuntimeError(query)
+        self.rowcount = 1
+
+    def fetchone(self):
+        return (1, )
+
+class ProfiledCursorTest(unittest.TestCase):
+    def setUp(self):
+        self.profile = RequestProfile('view_contact')
+        self.cursor = ProfiledCursor(
+            FakeCursor(), self.profile,
+            lambda query: statement_names.get(query, 'search_contacts')
+        )
+
+    def test_records_statement_names(self):
+        self.cursor.execute(SELECT_CONTACT.prepare_sql)
+        self.cursor.execute(SELECT_CONTACT.execute_sql, (1, ))
+        self.cursor.execute('SELECT 1')
+
+        self.assertEqual(
+            [(query.statement, query.rowcount, query.route) for query in self.profile.queries],
+            [('select_contact (prepare)', 1, 'view_contact'),
+             ('select_contact', 1, 'view_contact'),
+             ('search_contacts', 1, 'view_contact')]
+        )
+        self.assertEqual(self.cursor.fetchone(), (1, ))
+
+    def test_failed_queries_are_recorded(self):
+        with self.assertRaises(RuntimeError):
+            self.cursor.execute('fail')
+        self.assertEqual(len(self.profile.queries), 1)
+
+    def test_summary_and_slow_queries(self):
+        self.profile.record_transaction()
+        self.profile.record('select_contact', 0.002, 1)
+        self.profile.record('select_contact', 0.003, 1)
+        self.profile.record('update_contact', 0.150, 1)
+
+        self.assertEqual(
+            self.profile.summary(),
+            'view_contact: 3 queries in 1 transactions, 155.0ms '
+            '(update_contact x1 150.0ms, select_contact x2 5.0ms)'
+        )
+        self.assertEqual([query.statement for query in self.profile.slow_queries(0.1)],
+                         ['update_contact'])
+
+class CurrentProfileTest(unittest.TestCase):
+    def test_start_and_stop(self):
+        profile = start_profile('home')
+        self.assertIs(current_profile.get(), profile)
+        stop_profile()
+        self.assertIsNone(current_profile.get())
+
+if __name__ == '__main__':
+    unittest.main()
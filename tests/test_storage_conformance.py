@@ -0,0 +1,259 @@
+import asyncio
+import inspect
+import os
+import tempfile
+import unittest
+
+from contacts.storage import create_storage
+
+STORAGE_CONFIG = {
+    'DB_POOL_MIN_SIZE': 1,
+    'DB_POOL_MAX_SIZE': 2,
+    'DB_POOL_TIMEOUT': 5.0,
+    'DB_POOL_HEALTH_CHECK': True,
+    'DB_POOL_HEALTH_CHECK_IDLE_TIME': 30.0,
+    'CONTACTS_FILE_PATH': None,
+    'CONTACTS_FILE_FORMAT': 'yaml',
+    'CONTACTS_SQLITE_PATH': None,
+}
+
+def phone(number_value, number_type='personal', id=None):
+    return {'number_value': number_value, 'number_type': number_type, 'id': id}
+
+class StorageConformanceTests:
+    """
+    Behaviour every storage backend must share. Subclasses set
+    `backend_name` and may override `storage_config`.
+    """
+    backend_name = None
+
+    def storage_config(self):
+        return STORAGE_CONFIG
+
+    def open_storage(self):
+        return create_storage(self.backend_name, True, self.storage_config())
+
+    def setUp(self):
+        self.storage = self.open_storage()
+        self.storage.setup_schema()
+        self.storage.destroy_data()
+
+    def tearDown(self):
+        self.storage.destroy_data()
+        self.storage.close_connection()
+
+    def create(self, first_name, phone_numbers=None, **attributes):
+        return self.storage.create_new_contact(
+            first_name=first_name, phone_numbers=phone_numbers, **attributes
+        )
+
+    def test_create_and_find(self):
+        contact_id = self.create('Lilly', last_name='Martinez',
+                                 email_address='l.martinez@example.com',
+                                 phone_numbers=[phone('5696934238', 'home'), phone('')])
+
+        contact = self.storage.find_contact_by_id(contact_id)
+        self.assertEqual(contact['first_name'], 'Lilly')
+        self.assertIsNone(contact['middle_names'])
+
+        contact = self.storage.find_contact_with_phone_numbers(contact_id)
+        self.assertEqual(contact['email_address'], 'l.martinez@example.com')
+        self.assertIn('version', contact)
+        self.assertEqual(
+            [(p['number_value'], p['number_type']) for p in contact['phone_numbers']],
+            [('5696934238', 'home')]
+        )
+        self.assertEqual(self.storage.get_phone_numbers(contact_id), contact['phone_numbers'])
+
+    def test_missing_contact(self):
+        self.assertIsNone(self.storage.find_contact_by_id(123456))
+        self.assertIsNone(self.storage.find_contact_with_phone_numbers(123456))
+
+    def test_update_contact_and_phone_numbers(self):
+        contact_id = self.create('John', phone_numbers=[phone('111111'), phone('222222')])
+        first, second = self.storage.get_phone_numbers(contact_id)
+        version = self.storage.find_contact_with_phone_numbers(contact_id)['version']
+
+        self.storage.update_one_contact(
+            contact_id, 'Johnny', None, 'Smith', 'j@example.com',
+            [phone('333333', 'work', str(first['id'])),
+             phone('', id=str(second['id'])),
+             phone('444444', 'home')]
+        )
+
+        contact = self.storage.find_contact_with_phone_numbers(contact_id)
+        self.assertEqual((contact['first_name'], contact['last_name']), ('Johnny', 'Smith'))
+        self.assertGreater(contact['version'], version)
+        self.assertEqual(
+            [(p['number_value'], p['number_type']) for p in contact['phone_numbers']],
+            [('333333', 'work'), ('444444', 'home')]
+        )
+
+    def test_delete_cascades(self):
+        contact_id = self.create('John', phone_numbers=[phone('111111')])
+        self.storage.delete_one_contact(contact_id)
+        self.assertIsNone(self.storage.find_contact_by_id(contact_id))
+        self.assertEqual(self.storage.get_phone_numbers(contact_id), [])
+
+    def test_contacts_page(self):
+        names = ('Erin', 'alice', 'Carol', 'Bob', 'Dave')
+        ids = {name: self.create(name) for name in names}
+        expected = sorted(names, key=str.lower)
+
+        page = self.storage.get_contacts_page(limit=2)
+        self.assertEqual([c.full_name for c in page.contacts], expected[:2])
+        self.assertIsNone(page.previous_cursor)
+        self.assertEqual(page.next_cursor, ids[expected[1]])
+
+        page = self.storage.get_contacts_page(after=page.next_cursor, limit=2)
+        self.assertEqual([c.full_name for c in page.contacts], expected[2:4])
+        self.assertEqual(page.previous_cursor, ids[expected[2]])
+
+        last_page = self.storage.get_contacts_page(after=page.next_cursor, limit=2)
+        self.assertEqual([c.full_name for c in last_page.contacts], expected[4:])
+        self.assertIsNone(last_page.next_cursor)
+
+        page = self.storage.get_contacts_page(before=page.previous_cursor, limit=2)
+        self.assertEqual([c.full_name for c in page.contacts], expected[:2])
+        self.assertIsNone(page.previous_cursor)
+
+    def test_search(self):
+        lilly_id = self.create('Lilly', last_name='Martinez',
+                               email_address='l.martinez@example.com',
+                               phone_numbers=[phone('5696934238')])
+        self.create('John', last_name='Miller')
+
+        for search_text in ('lil mart', 'L.MART', '569693'):
+            results = self.storage.search_contacts(search_text)
+            self.assertEqual([c.id for c in results], [lilly_id], search_text)
+        self.assertEqual(self.storage.search_contacts('nobody'), [])
+
+    def test_ids_of_deleted_contacts_are_not_reused(self):
+        self.create('John')
+        deleted_id = self.create('Jane')
+        self.storage.delete_one_contact(deleted_id)
+
+        self.assertGreater(self.create('Jim'), deleted_id)
+
+    def test_list_version_changes_on_writes(self):
+        versions = [self.storage.get_list_version()]
+        contact_id = self.create('John')
+        versions.append(self.storage.get_list_version())
+        self.storage.update_one_contact(contact_id, 'Johnny', None, None, None, [])
+        versions.append(self.storage.get_list_version())
+        self.storage.delete_one_contact(contact_id)
+        versions.append(self.storage.get_list_version())
+
+        self.assertEqual(len(set(versions)), len(versions))
+
+    def test_bulk_import_and_export(self):
+        contacts = [
+            {'first_name': 'Alice', 'middle_names': None, 'last_name': None,
+             'email_address': None, 'phone_numbers': [phone('5551234', 'work')]},
+            {'first_name': 'Bob', 'middle_names': None, 'last_name': 'Jones',
+             'email_address': 'bob@example.com', 'phone_numbers': []},
+        ]
+        self.assertEqual(self.storage.bulk_import_contacts(contacts), 2)
+
+        exported = list(self.storage.iter_contacts_with_phone_numbers(batch_size=1))
+        self.assertEqual([c['first_name'] for c in exported], ['Alice', 'Bob'])
+        self.assertEqual(exported[0]['phone_numbers'][0]['number_value'], '5551234')
+        self.assertEqual(exported[1]['phone_numbers'], [])
+
+    def test_export_batches_keep_every_phone_number(self):
+        self.storage.bulk_import_contacts([
+            {'first_name': 'Alice', 'middle_names': None, 'last_name': None,
+             'email_address': None, 'phone_numbers': [
+                 {'number_value': f'555123{index}', 'number_type': 'home'} for index in range(3)
+             ]},
+            {'first_name': 'Bob', 'middle_names': None, 'last_name': None,
+             'email_address': None, 'phone_numbers': [
+                 {'number_value': '5559876', 'number_type': 'work'}
+             ]},
+        ])
+
+        exported = list(self.storage.iter_contacts_with_phone_numbers(batch_size=2))
+        self.assertEqual([len(contact['phone_numbers']) for contact in exported], [3, 1])
+
+class MemoryStorageTest(StorageConformanceTests, unittest.TestCase):
+    backend_name = 'memory'
+
+class FileStorageTest(StorageConformanceTests, unittest.TestCase):
+    backend_name = 'file'
+
+    def storage_config(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.data_dir.cleanup)
+        return STORAGE_CONFIG | {
+            'CONTACTS_FILE_PATH': os.path.join(self.data_dir.name, 'contacts.yaml')
+        }
+
+class MarshalFileStorageTest(FileStorageTest):
+    def storage_config(self):
+        return super().storage_config() | {'CONTACTS_FILE_FORMAT': 'marshal'}
+
+class SQLiteStorageTest(StorageConformanceTests, unittest.TestCase):
+    backend_name = 'sqlite'
+
+    def storage_config(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.data_dir.cleanup)
+        return STORAGE_CONFIG | {
+            'CONTACTS_SQLITE_PATH': os.path.join(self.data_dir.name, 'contacts.sqlite3')
+        }
+
+def postgres_available():
+    try:
+        import psycopg2
+        psycopg2.connect('dbname=test_contact_list').close()
+    except Exception:
+        return False
+    return True
+
+@unittest.skipUnless(postgres_available(), 'test database not available')
+class PostgresStorageTest(StorageConformanceTests, unittest.TestCase):
+    backend_name = 'postgres'
+
+@unittest.skipUnless(postgres_available(), 'test database not available')
+class PooledPostgresStorageTest(StorageConformanceTests, unittest.TestCase):
+    backend_name = 'postgres-pooled'
+
+class AsyncStorageRunner:
+    """Runs the async storage's methods to completion, for the shared tests."""
+    def __init__(self, storage, loop):
+        self.storage = storage
+        self.loop = loop
+
+    def __getattr__(self, name):
+        method = getattr(self.storage, name)
+
+        async def collect(results):
+            return [result async for result in results]
+
+        def run(*args, **kwargs):
+            result = method(*args, **kwargs)
+            if inspect.isasyncgen(result):
+                result = collect(result)
+            return self.loop.run_until_complete(result)
+        return run
+
+@unittest.skipUnless(postgres_available(), 'test database not available')
+class AsyncPostgresStorageTest(StorageConformanceTests, unittest.TestCase):
+    def open_storage(self):
+        from contacts.async_db_storage import (
+            AsyncContactsDatabaseStorage, async_storage_available, close_async_pools,
+            open_async_pool
+        )
+        from contacts.db_storage import get_db_dsn
+        if not async_storage_available():
+            self.skipTest('psycopg 3 not installed')
+
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        pool = loop.run_until_complete(open_async_pool(get_db_dsn(True), max_size=2))
+        self.addCleanup(loop.run_until_complete, close_async_pools())
+        storage = loop.run_until_complete(AsyncContactsDatabaseStorage.connect(pool))
+        return AsyncStorageRunner(storage, loop)
+
+if __name__ == '__main__':
+    unittest.main()
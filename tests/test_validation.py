@@ -0,0 +1,86 @@
+import unittest
+
+from werkzeug.datastructures import ImmutableMultiDict
+
+from app import errors_in_contact_data, get_contact_data_from_form, get_phone_nums_from_form
+from utils import add_full_name, errors_for_email_addr, get_full_name
+
+def contact_form(**fields):
+    form = {
+        'first_name': 'John',
+        'middle_names': '',
+        'last_name': 'Smith',
+        'email_address': 'j.smith@example.com',
+        'phone_number_1': '1234567',
+        'phone_number_1_type': 'Home',
+        'phone_number_1_id': '3',
+        'phone_number_2': '',
+        'phone_number_2_type': 'personal',
+        'phone_number_2_id': '',
+        'phone_number_3': '',
+        'phone_number_3_type': 'personal',
+        'phone_number_3_id': '',
+    }
+    return ImmutableMultiDict(form | fields)
+
+class ContactFormValidationTest(unittest.TestCase):
+    def test_valid_form(self):
+        self.assertIsNone(errors_in_contact_data(contact_form()))
+
+    def test_errors_are_in_field_order(self):
+        form = contact_form(first_name=' J ', email_address='john@', phone_number_3='12a')
+        self.assertEqual(errors_in_contact_data(form), [
+            'First name must be at least 2 letters',
+            'Email address is not valid. Expected format: someaddr@example.com',
+            'Phone numbers must be digits only',
+            'Phone numbers must be at least 6 digits',
+        ])
+
+    def test_missing_first_name(self):
+        self.assertEqual(errors_in_contact_data(ImmutableMultiDict()),
+                         ['First name is required'])
+
+    def test_email_addresses(self):
+        for email_address in ('J.Smith@Example.COM', ' j@a.b.c ', '', None):
+            self.assertEqual(errors_for_email_addr(email_address), [], email_address)
+        for email_address in ('j@example', 'j smith@example.com', 'j@example.com\nx'):
+            self.assertEqual(len(errors_for_email_addr(email_address)), 1, email_address)
+
+class ContactFormParsingTest(unittest.TestCase):
+    def test_contact_data(self):
+        form = contact_form(first_name=' John ', middle_names='   ', last_name=None)
+        self.assertEqual(get_contact_data_from_form(form), {
+            'first_name': 'John',
+            'middle_names': None,
+            'last_name': None,
+            'email_address': 'j.smith@example.com',
+            'phone_numbers': [
+                {'number_value': '1234567', 'number_type': 'home', 'id': '3'},
+                {'number_value': '', 'number_type': 'personal', 'id': ''},
+                {'number_value': '', 'number_type': 'personal', 'id': ''},
+            ],
+        })
+
+    def test_phone_numbers(self):
+        form = contact_form(phone_number_2='555123', phone_number_2_type='WORK')
+        self.assertEqual(get_phone_nums_from_form(form)[1],
+                         {'number_value': '555123', 'number_type': 'work', 'id': ''})
+
+class FullNameTest(unittest.TestCase):
+    def test_get_full_name(self):
+        self.assertEqual(get_full_name({'first_name': 'John', 'middle_names': 'Paul',
+                                        'last_name': 'Smith'}), 'John Paul Smith')
+        self.assertEqual(get_full_name({'first_name': 'John', 'middle_names': None,
+                                        'last_name': 'Smith'}), 'John  Smith')
+        self.assertEqual(get_full_name({'first_name': 'John'}), 'John')
+
+    def test_add_full_name(self):
+        contacts = [{'first_name': 'John', 'last_name': 'Smith'},
+                    {'first_name': 'Kelly', 'middle_names': 'Ann', 'last_name': None}]
+        add_full_name(contacts)
+        self.assertEqual([contact['full_name'] for contact in contacts],
+                         ['John  Smith', 'Kelly Ann'])
+        add_full_name(None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,15 +1,16 @@
 import random
-from uuid import uuid4
+from uuid import UUID, uuid4
 import re
 
+MIN_FIRST_NAME_LENGTH = 2
+MIN_PHONE_NUMBER_LENGTH = 6
+
+EMAIL_PATTERN = re.compile(r'^[a-z0-9\.]+@[a-z0-9]+(\.[a-z0-9]+)+$', flags=re.IGNORECASE)
+
 def get_full_name(contact):
-    first_name = contact['first_name']
-    middle_names = contact.get('middle_names', '')
-    last_name = contact.get('last_name', '')
-    return ' '.join(
-        (first_name,
-         middle_names if middle_names else '',
-         last_name if last_name else '')).rstrip()
+    # Missing names still leave their separator: 'John  Smith'
+    return (f"{contact['first_name']} {contact.get('middle_names') or ''} "
+            f"{contact.get('last_name') or ''}").rstrip()
 
 def default_phone_number_data():
     return {
@@ -28,16 +29,19 @@ def get_contact_by_id(contact_id, contacts):
         return None
     return next((contact for contact in contacts if contact['id'] == contact_id), None)
 
-def create_random_contact():
+PHONE_NUMBER_TYPES = ('personal', 'home', 'work', 'other')
+
+def create_random_contact(rng=random):
+    # Pass a seeded `random.Random` as `rng` for reproducible contacts
     names = ('John', 'Matthew', 'Kelly', 'Ronald', 'Alice', 'Michael', 'Lilly', 'Robert', 'Stefanie', 'Ryan', 'Elizabeth')
     last_names = ("Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Martinez", "Taylor")
 
-    first_name = random.choice(names)
-    middle_names = random.choice(names)
-    last_name = random.choice(last_names)
-    phone_num = ''.join([str(random.randint(0, 9)) for _ in range(10)])
+    first_name = rng.choice(names)
+    middle_names = rng.choice(names)
+    last_name = rng.choice(last_names)
+    phone_num = ''.join([str(rng.randint(0, 9)) for _ in range(10)])
     email_address = f'{first_name[:1]}.{last_name}@example.com'.lower()
-    contact_uuid = str(uuid4())
+    contact_uuid = str(uuid4()) if rng is random else str(UUID(int=rng.getrandbits(128), version=4))
     return {
         'id': contact_uuid,
         'first_name': first_name,
@@ -47,13 +51,39 @@ def create_random_contact():
         'email_address': email_address,
     }
 
+def create_random_contacts(count, seed=None, max_phone_numbers=3):
+    """
+    `count` contacts in the shape `bulk_import_contacts` takes, each with
+    1 to `max_phone_numbers` phone numbers. The same seed gives the same
+    contacts.
+    """
+    rng = random.Random(seed)
+    contacts = []
+    for _ in range(count):
+        contact = create_random_contact(rng)
+        phone_numbers = [{'number_value': contact['phone_number'],
+                          'number_type': rng.choice(PHONE_NUMBER_TYPES)}]
+        for _ in range(rng.randint(1, max_phone_numbers) - 1):
+            phone_numbers.append({
+                'number_value': ''.join(str(rng.randint(0, 9)) for _ in range(10)),
+                'number_type': rng.choice(PHONE_NUMBER_TYPES),
+            })
+        contacts.append({
+            'first_name': contact['first_name'],
+            'middle_names': contact['middle_names'],
+            'last_name': contact['last_name'],
+            'email_address': contact['email_address'],
+            'phone_numbers': phone_numbers,
+        })
+    return contacts
+
 def errors_for_first_name(first_name):
     first_name = first_name.strip() if first_name else None
 
     if not first_name:
         return ['First name is required']
 
-    if len(first_name) < 2:
+    if len(first_name) < MIN_FIRST_NAME_LENGTH:
         return ['First name must be at least 2 letters']
 
     return []
@@ -68,7 +98,7 @@ def errors_for_phone_num(phone_number):
 
     if not phone_number.isdigit():
         errors.append('Phone numbers must be digits only')
-    if len(phone_number) < 6:
+    if len(phone_number) < MIN_PHONE_NUMBER_LENGTH:
         errors.append('Phone numbers must be at least 6 digits')
 
     return errors
@@ -88,8 +118,7 @@ def errors_for_email_addr(email_address):
     if not email_address:
         return []
 
-    email_pattern = r'^[a-z0-9\.]+@[a-z0-9]+(\.[a-z0-9]+)+$'
-    if not re.search(email_pattern, email_address, flags=re.IGNORECASE):
+    if not EMAIL_PATTERN.search(email_address):
         return ['Email address is not valid. Expected format: someaddr@example.com']
 
     return []
\ No newline at end of file